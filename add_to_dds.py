@@ -1,349 +1,288 @@
 import argparse
 import logging
 import os
-from datetime import datetime
+import time
+from concurrent.futures import ProcessPoolExecutor
 from logging.handlers import RotatingFileHandler
-from typing import Optional
+from multiprocessing.util import Finalize
+from typing import Any, Dict, Optional, Set, Tuple
 
 import psycopg2
 from dotenv import load_dotenv
 
+from checkpoints import load_checkpoint, save_checkpoint
+from dag_executor import DONE, run_dag
+from dimension_keys import DimensionKeys
+from micro_batch import BATCH_SIZE, FLUSH_INTERVAL, listen, wait_for_tables
+from statements import execute, log_statistics, register
+from streaming import ITERSIZE, log_peak_memory
+from transfer_engine import transfer_to_dds
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def add_companies() -> None:
-    # Загрузка данных из staging.clients
-    cur.execute('SELECT * FROM staging.companies')
-    rows = cur.fetchall()
-
-    cur.execute('SELECT MAX(timestamp_column) FROM dds.deposits_companies')
-    last_timestamp = cur.fetchone()[0]
-
-    for row in rows:
-        name = row[1]
-        phone_number = row[2]
-        address = row[3]
-        registration_date = row[4]
-        email = row[5]
-        inn = row[6]
-        deposit_amount = row[7]
-        opening_date = row[8]
-        closing_date = row[9]
-        interest_rate = row[10]
-        timestamp_column = row[12]
-
-        # Проверка условия по времени и добавление в dds.deposits_clients
-        if not last_timestamp or timestamp_column > last_timestamp:
-            # Добавление данных в dds.clients
-            cur.execute('INSERT INTO dds.companies (name,phone_number,address,registration_date,email,inn,'
-                        ' timestamp_column) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING company_id',
-                        (name, phone_number, address, registration_date, email, inn, timestamp_column))
-            new_company_id = cur.fetchone()[0]
-
-            # Добавление в dds.deposits_clients
-            cur.execute('INSERT INTO dds.deposits_companies (deposit_amount, opening_date, closing_date, interest_rate,'
-                        ' company_id, timestamp_column)'
-                        ' VALUES (%s, %s, %s, %s, %s, %s)', (deposit_amount, opening_date, closing_date,
-                                                             interest_rate, new_company_id, timestamp_column))
-
-
-def add_clients() -> None:
-    # Загрузка данных из staging.companies
-    cur.execute('SELECT * FROM staging.clients')
-    rows = cur.fetchall()
-
-    cur.execute('SELECT MAX(timestamp_column) FROM dds.deposits_clients')
-    last_timestamp = cur.fetchone()[0]
-
-    for row in rows:
-        first_name = row[1]
-        last_name = row[2]
-        address = row[3]
-        phone_number = row[4]
-        registration_date = row[5]
-        email = row[6]
-        deposit_amount = row[7]
-        opening_date = row[8]
-        closing_date = row[9]
-        interest_rate = row[10]
-        timestamp_column = row[12]
-
-        # Проверка условия по времени и добавление в dds.deposits_clients
-        if not last_timestamp or timestamp_column > last_timestamp:
-            # Добавление данных в dds.clients
-            cur.execute('INSERT INTO dds.clients (first_name, last_name, address, phone_number, registration_date,'
-                        ' email, timestamp_column)'
-                        ' VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING client_id',
-                        (first_name, last_name, address, phone_number, registration_date, email, timestamp_column))
-            new_client_id = cur.fetchone()[0]
-
-            # Добавление в dds.deposits_clients
-            cur.execute(
-                'INSERT INTO dds.deposits_clients (deposit_amount, opening_date, closing_date, interest_rate, client_id, timestamp_column)'
-                ' VALUES (%s, %s, %s, %s, %s, %s)', (deposit_amount, opening_date, closing_date,
-                                                     interest_rate, new_client_id, timestamp_column))
+def next_batch(table: str, last_id: int, batch_size: Optional[int] = None) -> Tuple[Any, Any]:
+    """Функция возвращает id и время последней строки следующей пачки новых строк таблицы staging:
+     не больше batch_size строк после last_id, без batch_size - все новые строки"""
+    if batch_size:
+        cur.execute(f'SELECT MAX(id), MAX(timestamp_column) '
+                    f'FROM (SELECT id, timestamp_column FROM {table} WHERE id > %s ORDER BY id LIMIT %s) AS batch',
+                    (last_id, batch_size))
+    else:
+        cur.execute(f'SELECT MAX(id), MAX(timestamp_column) FROM {table} WHERE id > %s', (last_id,))
+    return cur.fetchone()
+
+
+def add_companies(batch_size: Optional[int] = None) -> int:
+    # Контрольная точка - id последней перенесенной строки staging.companies
+    last_id, _ = load_checkpoint(cur, 'dds', 'companies', """
+        SELECT MAX(id), MAX(timestamp_column)
+        FROM staging.companies
+        WHERE timestamp_column <= (SELECT MAX(timestamp_column) FROM dds.deposits_companies)
+    """)
+    max_id, max_timestamp = next_batch('staging.companies', last_id, batch_size)
+    if max_id is None:
+        logger.info("Новых строк в staging.companies нет")
+        return 0
+
+    # Перенос новых строк staging.companies в dds.companies и dds.deposits_companies одним запросом.
+    # Новые строки отбираются в БД по id, в Python строки не выгружаются. Ключ company_id берется
+    # из последовательности заранее, поэтому компания и ее депозит получают один и тот же company_id.
+    cur.execute("""
+        WITH new_companies AS (
+            SELECT nextval(pg_get_serial_sequence('dds.companies', 'company_id')) AS company_id,
+                   name, phone_number, address, registration_date, email, inn, deposit_amount, opening_date,
+                   closing_date, interest_rate, timestamp_column
+            FROM staging.companies
+            WHERE id > %s AND id <= %s
+        ),
+        inserted_companies AS (
+            INSERT INTO dds.companies (company_id, name, phone_number, address, registration_date, email, inn,
+                                       timestamp_column)
+            SELECT company_id, name, phone_number, address, registration_date, email, inn, timestamp_column
+            FROM new_companies
+        )
+        INSERT INTO dds.deposits_companies (deposit_amount, opening_date, closing_date, interest_rate, company_id,
+                                            timestamp_column)
+        SELECT deposit_amount, opening_date, closing_date, interest_rate, company_id, timestamp_column
+        FROM new_companies
+    """, (last_id, max_id))
+    inserted = cur.rowcount
+    save_checkpoint(cur, 'dds', 'companies', max_id, max_timestamp)
+    logger.info(f"В dds.companies и dds.deposits_companies добавлено строк: {inserted}")
+    return inserted
+
+
+def add_clients(batch_size: Optional[int] = None) -> int:
+    # Контрольная точка - id последней перенесенной строки staging.clients
+    last_id, _ = load_checkpoint(cur, 'dds', 'clients', """
+        SELECT MAX(id), MAX(timestamp_column)
+        FROM staging.clients
+        WHERE timestamp_column <= (SELECT MAX(timestamp_column) FROM dds.deposits_clients)
+    """)
+    max_id, max_timestamp = next_batch('staging.clients', last_id, batch_size)
+    if max_id is None:
+        logger.info("Новых строк в staging.clients нет")
+        return 0
+
+    # Перенос новых строк staging.clients в dds.clients и dds.deposits_clients одним запросом.
+    # Новые строки отбираются в БД по id, в Python строки не выгружаются. Ключ client_id берется
+    # из последовательности заранее, поэтому клиент и его депозит получают один и тот же client_id.
+    cur.execute("""
+        WITH new_clients AS (
+            SELECT nextval(pg_get_serial_sequence('dds.clients', 'client_id')) AS client_id,
+                   first_name, last_name, address, phone_number, registration_date, email, deposit_amount,
+                   opening_date, closing_date, interest_rate, timestamp_column
+            FROM staging.clients
+            WHERE id > %s AND id <= %s
+        ),
+        inserted_clients AS (
+            INSERT INTO dds.clients (client_id, first_name, last_name, address, phone_number, registration_date,
+                                     email, timestamp_column)
+            SELECT client_id, first_name, last_name, address, phone_number, registration_date, email,
+                   timestamp_column
+            FROM new_clients
+        )
+        INSERT INTO dds.deposits_clients (deposit_amount, opening_date, closing_date, interest_rate, client_id,
+                                          timestamp_column)
+        SELECT deposit_amount, opening_date, closing_date, interest_rate, client_id, timestamp_column
+        FROM new_clients
+    """, (last_id, max_id))
+    inserted = cur.rowcount
+    save_checkpoint(cur, 'dds', 'clients', max_id, max_timestamp)
+    logger.info(f"В dds.clients и dds.deposits_clients добавлено строк: {inserted}")
+    return inserted
 
 
 def add_bank() -> None:
-    # Загрузка данных из staging.bank
-    cur.execute('SELECT * FROM staging.bank')
+    # Контрольная точка - id последней перенесенной строки staging.bank
+    last_id, _ = load_checkpoint(cur, 'dds', 'bank', """
+        SELECT MAX(id), MAX(timestamp_column)
+        FROM staging.bank
+        WHERE timestamp_column <= (SELECT MAX(timestamp_column) FROM dds.bank)
+    """)
+
+    # Загрузка новых данных из staging.bank
+    cur.execute('SELECT * FROM staging.bank WHERE id > %s ORDER BY id', (last_id,))
     rows = cur.fetchall()
 
-    cur.execute('SELECT MAX(timestamp_column) FROM dds.bank')
-    last_timestamp = cur.fetchone()[0]
-
     for row in rows:
         name = row[1]
         address = row[2]
         license_number = row[3]
         timestamp_column = row[4]
 
-        # Проверка условия по времени и добавление в dds.deposits_clients
-        if not last_timestamp or timestamp_column > last_timestamp:
-            # Добавление данных в dds.bank
-            cur.execute(
-                'INSERT INTO dds.bank (name, address, license_number, timestamp_column)'
-                ' VALUES (%s, %s, %s, %s)',
+        # Добавление данных в dds.bank и ключа нового банка в кэш
+        execute(cur, register('dds_insert_bank', 'INSERT INTO dds.bank (name, address, license_number, '
+                                                 'timestamp_column) VALUES (%s, %s, %s, %s) RETURNING id'),
                 (name, address, license_number, timestamp_column))
-
-
-def add_capital(history: bool = False, date: Optional[str] = None) -> None:
-    # выбор объекта с последним timestamp_column на текущую дату staging.capital
-    if history:
-        # Загрузка данных из staging.capital
-        cur.execute('''
-            SELECT * 
-            FROM staging.capital c
-            WHERE timestamp_column = (
-                SELECT MAX(timestamp_column)
-                FROM staging.capital
-                WHERE CAST(timestamp_column AS date) = CAST(c.timestamp_column AS date)
-            )
-            ''')
-        latest_capital = cur.fetchall()
-
-    else:
-        if date:
-            current_date_check = date
-        else:
-            current_date_check = datetime.now().date()
-        current_datetime = datetime.now().replace(microsecond=0)
-        current_date = current_datetime.strftime('%Y-%m-%d %H:%M:%S')
-
-        # Загрузка последнего объекта на текущую дату из staging.capital
-        cur.execute(
-            "SELECT * FROM staging.capital WHERE CAST(timestamp_column AS date) = %s ORDER BY timestamp_column DESC LIMIT 1",
-            (current_date_check,))
-
-        # Получаем единственный объект
-        latest_capital = cur.fetchone()
-
-        if latest_capital:
-            latest_capital = [latest_capital]
-
-    if latest_capital:
-        # Получение последнего объекта из dds.capital для проверки обновления
-        cur.execute('SELECT MAX(timestamp_column) FROM dds.capital')
-        last_timestamp = cur.fetchone()[0]
-
-        for row in latest_capital:
-            reserve_fund = row[1]
-            equity_capital = row[2]
-            accumulated_earnings = row[3]
-            timestamp_column = row[5]
-
-            if date:
-                # Получение последнего ID банка из dds.bank
-                cur.execute("SELECT id FROM dds.bank ORDER BY id DESC LIMIT 1")
-                bank_id = cur.fetchone()[0]
-
-                # Добавление данных в dds.bank
-                current_date = date
-
-                cur.execute(
-                    'INSERT INTO dds.capital (reserve_fund, equity_capital, accumulated_earnings, timestamp_column,'
-                    ' bank_id)'
-                    ' VALUES (%s, %s, %s, %s, %s)',
-                    (reserve_fund, equity_capital, accumulated_earnings, current_date, bank_id))
-
-            # Проверка условия по времени и добавление в dds.deposits_clients
-            if not last_timestamp or timestamp_column > last_timestamp:
-                # Получение последнего ID банка из dds.bank
-                cur.execute("SELECT id FROM dds.bank ORDER BY id DESC LIMIT 1")
-                bank_id = cur.fetchone()[0]
-
-                # Добавление данных в dds.bank
-                if history:
-                    current_date = timestamp_column
-
-                cur.execute(
-                    'INSERT INTO dds.capital (reserve_fund, equity_capital, accumulated_earnings, timestamp_column,'
-                    ' bank_id)'
-                    ' VALUES (%s, %s, %s, %s, %s)',
-                    (reserve_fund, equity_capital, accumulated_earnings, current_date, bank_id))
-
-
-def add_assets(history: bool = False, date: Optional[str] = None) -> None:
-    # выбор объекта с последним timestamp_column на текущую дату staging.general_assets
-    if history:
-        # Загрузка данных из staging.general_assets
-        cur.execute('''
-                    SELECT * 
-                    FROM staging.general_assets c
-                    WHERE timestamp_column = (
-                        SELECT MAX(timestamp_column)
-                        FROM staging.general_assets
-                        WHERE CAST(timestamp_column AS date) = CAST(c.timestamp_column AS date)
-                    )
-                    ''')
-        latest_assets = cur.fetchall()
-
-    else:
-        if date:
-            current_date_check = date
+        dimension_keys.add('bank', (name, address, license_number), cur.fetchone()[0], timestamp_column)
+
+    if rows:
+        save_checkpoint(cur, 'dds', 'bank', rows[-1][0], rows[-1][4])
+
+
+def add_capital(history: bool = False, date: Optional[str] = None, date_from: Optional[str] = None,
+                date_to: Optional[str] = None) -> None:
+    # Перенос данных о капитале банка по описанию сущности в transfer_engine
+    transfer_to_dds(cur, 'capital', dimension_keys, history, date, date_from, date_to, itersize)
+
+
+def add_assets(history: bool = False, date: Optional[str] = None, date_from: Optional[str] = None,
+               date_to: Optional[str] = None) -> None:
+    # Перенос данных об активах банка по описанию сущности в transfer_engine
+    transfer_to_dds(cur, 'general_assets', dimension_keys, history, date, date_from, date_to, itersize)
+
+
+def add_control_liabilities(history: bool = False, date: Optional[str] = None, date_from: Optional[str] = None,
+                            date_to: Optional[str] = None) -> None:
+    # Перенос данных о пассивах банка по описанию сущности в transfer_engine
+    transfer_to_dds(cur, 'control_liabilities', dimension_keys, history, date, date_from, date_to, itersize)
+
+
+def process_new_rows(tables: Set[str], batch_size: int = BATCH_SIZE) -> None:
+    """Функция переносит в dds новые строки указанных таблиц staging начиная с контрольных точек.
+     Клиенты и компании переносятся пачками не больше batch_size строк, каждая пачка - отдельной транзакцией."""
+    # Клиенты и компании - пачками, пока новые строки не закончатся
+    for table, add_rows in (('clients', add_clients), ('companies', add_companies)):
+        if table in tables:
+            while add_rows(batch_size) >= batch_size:
+                cur.connection.commit()
+            cur.connection.commit()
+
+    # Банк переносится раньше данных, которые к нему привязываются
+    if 'bank' in tables:
+        add_bank()
+    for table, add_rows in (('capital', add_capital), ('general_assets', add_assets),
+                            ('control_liabilities', add_control_liabilities)):
+        if table in tables:
+            add_rows(history=True)
+    cur.connection.commit()
+
+
+def run_micro_batch(listen_conn: Any, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL) -> None:
+    """Функция работает непрерывно: после уведомления о вставке в staging переносит в dds только строки
+     после контрольных точек. При запуске переносятся строки, добавленные пока скрипт не работал.
+     Ошибка переноса откатывает транзакцию пачки и не останавливает ожидание: таблицы пачки переносятся
+     повторно вместе со следующими уведомлениями."""
+    global dimension_keys
+    listen(listen_conn)
+    tables = {'clients', 'companies', 'bank', 'capital', 'general_assets', 'control_liabilities'}
+    try:
+        while True:
+            try:
+                process_new_rows(tables, batch_size)
+                tables = set()
+            except Exception as e:
+                cur.connection.rollback()
+                logger.exception(f"Ошибка переноса новых строк {', '.join(sorted(tables))}: %s", e)
+                # Кэш ключей мог получить банк из отмененной транзакции
+                dimension_keys = DimensionKeys(cur, 'dds')
+            tables |= wait_for_tables(listen_conn, flush_interval)
+            logger.info(f"Новые строки в staging: {', '.join(sorted(tables))}")
+    except KeyboardInterrupt:
+        logger.info('Непрерывный режим остановлен.')
+
+
+# Шаги переноса и шаги, которые должны завершиться до их запуска: капитал, активы и пассивы привязываются
+# к банку, клиенты и компании ни от чего не зависят
+STEPS = {
+    'clients': (),
+    'companies': (),
+    'bank': (),
+    'capital': ('bank',),
+    'general_assets': ('bank',),
+    'control_liabilities': ('bank',),
+}
+
+
+def init_worker(connection_params: Dict[str, Any], worker_itersize: int) -> None:
+    """Функция открывает подключение процесса пула. Подключение используется всеми шагами, которые выполняет
+     процесс, каждый шаг - в своей транзакции, и закрывается при завершении процесса вместе с пулом."""
+    global cur, itersize
+    conn = psycopg2.connect(**connection_params)
+    # Обработчики atexit в процессах пула, запущенных через fork, не вызываются, а завершающие функции
+    # multiprocessing вызываются при любом способе запуска
+    Finalize(conn, conn.close, exitpriority=10)
+    cur = conn.cursor()
+    itersize = worker_itersize
+
+    # Процесс, запущенный через spawn (по умолчанию в Windows и macOS), не наследует настройку логов
+    # из __main__: ошибки шагов выводятся в консоль, в сводку они попадают через результат run_step
+    if not logger.handlers:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        logger.addHandler(console_handler)
+
+
+def run_step(step: str, kwargs: Optional[Dict[str, Any]] = None) -> Tuple[str, bool, str, float]:
+    """Функция выполняет один шаг переноса в подключении процесса и фиксирует его отдельной транзакцией.
+     Возвращает шаг, признак успеха, текст ошибки и время выполнения в секундах."""
+    global dimension_keys
+    start = time.monotonic()
+    # Кэш ключей создается заново: банк мог быть добавлен шагом в другом процессе
+    dimension_keys = DimensionKeys(cur, 'dds')
+    step_functions = {'clients': add_clients, 'companies': add_companies, 'bank': add_bank,
+                      'capital': add_capital, 'general_assets': add_assets,
+                      'control_liabilities': add_control_liabilities}
+    try:
+        step_functions[step](**(kwargs or {}))
+        cur.connection.commit()
+    except Exception as e:
+        cur.connection.rollback()
+        logger.exception(f"Ошибка на шаге {step}: %s", e)
+        return step, False, str(e), time.monotonic() - start
+    return step, True, '', time.monotonic() - start
+
+
+def parallel_steps(connection_params: Dict[str, Any], workers: int, history: bool = False,
+                   date_from: Optional[str] = None, date_to: Optional[str] = None) -> bool:
+    """Функция выполняет все шаги переноса в пуле из workers процессов с учетом зависимостей STEPS
+     и выводит в лог сводку по каждому шагу. Возвращает True, если все шаги выполнены."""
+    # Параметры режима history передаются только шагам капитала, активов и пассивов
+    snapshot_kwargs = {'history': True, 'date_from': date_from, 'date_to': date_to} if history else {}
+    step_args = {step: (snapshot_kwargs,) for step in ('capital', 'general_assets', 'control_liabilities')}
+
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(connection_params, itersize)) as executor:
+        statuses = run_dag(executor, STEPS, run_step, step_args)
+    elapsed = time.monotonic() - start
+
+    for step, (status, error, seconds) in statuses.items():
+        if status == DONE:
+            logger.info(f"{step}: {status} за {seconds:.1f} с")
         else:
-            current_date_check = datetime.now().date()
-        current_datetime = datetime.now().replace(microsecond=0)
-        current_date = current_datetime.strftime('%Y-%m-%d %H:%M:%S')
-
-        # Загрузка последнего объекта на текущую дату из staging.capital
-        cur.execute(
-            "SELECT * FROM staging.general_assets WHERE CAST(timestamp_column AS date) = %s ORDER BY timestamp_column DESC LIMIT 1",
-            (current_date_check,))
-
-        # Получаем единственный объект
-        latest_assets = cur.fetchone()
-
-        if latest_assets:
-            latest_assets = [latest_assets]
-
-    if latest_assets:
-        # Получение последнего объекта из dds.capital для проверки обновления
-        cur.execute('SELECT MAX(timestamp_column) FROM dds.general_assets')
-        last_timestamp = cur.fetchone()[0]
-
-        for row in latest_assets:
-            securities = row[1]
-            real_estate = row[2]
-            financial_reports = row[3]
-            credit_facilities = row[4]
-            machinery = row[5]
-            debts = row[6]
-            equipment = row[7]
-            timestamp_column = row[9]
-
-            if date:
-                # Получение последнего ID банка из dds.bank
-                cur.execute("SELECT id FROM dds.bank ORDER BY id DESC LIMIT 1")
-                bank_id = cur.fetchone()[0]
-
-                # Добавление данных в dds.bank
-                current_date = date
-
-                cur.execute(
-                    'INSERT INTO dds.general_assets (securities, real_estate, financial_reports, credit_facilities,'
-                    ' machinery, debts, equipment, timestamp_column, bank_id)'
-                    ' VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)',
-                    (securities, real_estate, financial_reports, credit_facilities, machinery, debts, equipment,
-                     current_date, bank_id))
-
-            # Проверка условия по времени и добавление в dds.deposits_clients
-            if not last_timestamp or timestamp_column > last_timestamp:
-                # Получение последнего ID банка из dds.bank
-                cur.execute("SELECT id FROM dds.bank ORDER BY id DESC LIMIT 1")
-                bank_id = cur.fetchone()[0]
-
-                # Добавление данных в dds.bank
-                if history:
-                    current_date = timestamp_column
-
-                cur.execute(
-                    'INSERT INTO dds.general_assets (securities, real_estate, financial_reports, credit_facilities,'
-                    ' machinery, debts, equipment, timestamp_column, bank_id)'
-                    ' VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)',
-                    (securities, real_estate, financial_reports, credit_facilities, machinery, debts, equipment,
-                     current_date, bank_id))
-
-
-def add_control_liabilities(history: bool = False, date: Optional[str] = None) -> None:
-    # выбор объекта с последним timestamp_column на текущую дату staging.control_liabilities
-    if history:
-        # Загрузка данных из staging.general_assets
-        cur.execute('''
-                    SELECT * 
-                    FROM staging.control_liabilities c
-                    WHERE timestamp_column = (
-                        SELECT MAX(timestamp_column)
-                        FROM staging.control_liabilities
-                        WHERE CAST(timestamp_column AS date) = CAST(c.timestamp_column AS date)
-                    )
-                    ''')
-        latest_liabilities = cur.fetchall()
+            logger.error(f"{step}: {status} - {error}")
 
-    else:
-        if date:
-            current_date_check = date
-        else:
-            current_date_check = datetime.now().date()
-        current_datetime = datetime.now().replace(microsecond=0)
-        current_date = current_datetime.strftime('%Y-%m-%d %H:%M:%S')
-
-        # Загрузка последнего объекта на текущую дату из staging.capital
-        cur.execute(
-            "SELECT * FROM staging.control_liabilities WHERE CAST(timestamp_column AS date) = %s ORDER BY timestamp_column DESC LIMIT 1",
-            (current_date_check,))
-
-        # Получаем единственный объект
-        latest_liabilities = cur.fetchone()
-        if latest_liabilities:
-            latest_liabilities = [latest_liabilities]
-
-    if latest_liabilities:
-        # Получение последнего объекта из dds.capital для проверки обновления
-        cur.execute('SELECT MAX(timestamp_column) FROM dds.control_liabilities')
-        last_timestamp = cur.fetchone()[0]
-
-        for row in latest_liabilities:
-            financial_instruments_debts = row[1]
-            securities_obligations = row[2]
-            reporting_data = row[3]
-            invoices_to_pay = row[4]
-            funds_in_accounts = row[5]
-            timestamp_column = row[7]
-
-            if date:
-                # Получение последнего ID банка из dds.bank
-                cur.execute("SELECT id FROM dds.bank ORDER BY id DESC LIMIT 1")
-                bank_id = cur.fetchone()[0]
-
-                # Добавление данных в dds.bank
-                current_date = date
-
-                cur.execute(
-                    'INSERT INTO dds.control_liabilities (financial_instruments_debts, securities_obligations,'
-                    ' reporting_data, invoices_to_pay, funds_in_accounts, timestamp_column, bank_id)'
-                    ' VALUES (%s, %s, %s, %s, %s, %s, %s)',
-                    (financial_instruments_debts, securities_obligations, reporting_data, invoices_to_pay,
-                     funds_in_accounts, current_date, bank_id))
-
-            # Проверка условия по времени и добавление в dds.deposits_clients
-            if not last_timestamp or timestamp_column > last_timestamp:
-                # Получение последнего ID банка из dds.bank
-                cur.execute("SELECT id FROM dds.bank ORDER BY id DESC LIMIT 1")
-                bank_id = cur.fetchone()[0]
-
-                # Добавление данных в dds.bank
-                if history:
-                    current_date = timestamp_column
-
-                cur.execute(
-                    'INSERT INTO dds.control_liabilities (financial_instruments_debts, securities_obligations,'
-                    ' reporting_data, invoices_to_pay, funds_in_accounts, timestamp_column, bank_id)'
-                    ' VALUES (%s, %s, %s, %s, %s, %s, %s)',
-                    (financial_instruments_debts, securities_obligations, reporting_data, invoices_to_pay,
-                     funds_in_accounts, current_date, bank_id))
+    failed = [step for step, (status, _, _) in statuses.items() if status != DONE]
+    logger.info(f"Параллельный перенос завершен за {elapsed:.1f} с (последовательно "
+                f"{sum(seconds for _, _, seconds in statuses.values()):.1f} с): успешно "
+                f"{len(statuses) - len(failed)} из {len(statuses)}"
+                + (f", не выполнены: {', '.join(failed)}" if failed else ""))
+    return not failed
 
 
 if __name__ == '__main__':
@@ -376,7 +315,8 @@ if __name__ == '__main__':
                              'history_liabilities - данные о пассивах банка.'
                              'history_assets - данные о активах банка.'
                              'all - загрузка всех данных на текущий день.'
-                             'history_all - загрузка всех данных, с последней даты загрузки по текущий день.',
+                             'history_all - загрузка всех данных, с последней даты загрузки по текущий день.'
+                             'listen - непрерывный перенос новых строк staging по уведомлениям из БД.',
                         default='all')
 
     parser.add_argument('date',
@@ -384,27 +324,71 @@ if __name__ == '__main__':
                         help='Загрузка данных только на указанную дату',
                         default=None)
 
+    parser.add_argument('--from',
+                        dest='date_from',
+                        help='Начало диапазона дат для режимов history_*. Данные на даты диапазона загружаются '
+                             'заново, независимо от последней загрузки. Пример 2024-11-01',
+                        default=None)
+
+    parser.add_argument('--to',
+                        dest='date_to',
+                        help='Конец диапазона дат (включительно) для режимов history_*. Пример 2024-11-07',
+                        default=None)
+
+    parser.add_argument('--itersize',
+                        type=int,
+                        help='Количество строк, которые читаются с сервера за один раз в режимах history_*. '
+                             'Чем меньше, тем меньше памяти нужно процессу.',
+                        default=ITERSIZE)
+
+    parser.add_argument('--batch-size',
+                        type=int,
+                        help='Режим listen: максимальное количество новых строк клиентов и компаний, '
+                             'которые переносятся одной транзакцией.',
+                        default=BATCH_SIZE)
+
+    parser.add_argument('--flush-interval',
+                        type=float,
+                        help='Режим listen: сколько секунд после первого уведомления собирать остальные '
+                             'перед переносом.',
+                        default=FLUSH_INTERVAL)
+
+    parser.add_argument('--workers',
+                        type=int,
+                        help='Режимы all и history_all: количество процессов для параллельного переноса. '
+                             'Клиенты, компании и банк переносятся одновременно, капитал, активы и пассивы - '
+                             'после банка. Каждый шаг выполняется в своей транзакции.',
+                        default=1)
+
     args = parser.parse_args()
+    itersize = args.itersize
 
     # Подключение к базе данных
-    conn = psycopg2.connect(
-        dbname=db_name,
-        user=db_user,
-        password=db_pass,
-        host=db_host
-    )
+    connection_params = {
+        'dbname': db_name,
+        'user': db_user,
+        'password': db_pass,
+        'host': db_host,
+    }
+    conn = psycopg2.connect(**connection_params)
     cur = conn.cursor()
+    # Кэш ключей справочников слоя dds на время запуска
+    dimension_keys = DimensionKeys(cur, 'dds')
 
     try:
         if args.history == 'history_capital':
-            add_capital(history=True)
+            add_capital(history=True, date_from=args.date_from, date_to=args.date_to)
             logger.info('Загрузка данных по капиталу с момента последней загрузки, до текущего момента - завершена.')
         elif args.history == 'history_liabilities':
-            add_control_liabilities(history=True)
+            add_control_liabilities(history=True, date_from=args.date_from, date_to=args.date_to)
             logger.info('Загрузка данных по активам с момента последней загрузки, до текущего момента - завершена.')
         elif args.history == 'history_assets':
-            add_assets(history=True)
+            add_assets(history=True, date_from=args.date_from, date_to=args.date_to)
             logger.info('Загрузка данных по пассивам с момента последней загрузки, до текущего момента - завершена.')
+        elif args.history in ('all', 'history_all') and args.workers > 1:
+            if parallel_steps(connection_params, args.workers, history=args.history == 'history_all',
+                              date_from=args.date_from, date_to=args.date_to):
+                logger.info('Загрузка всех данных - завершена.')
         elif args.history == 'all':
             add_clients()
             add_companies()
@@ -417,9 +401,9 @@ if __name__ == '__main__':
             add_clients()
             add_companies()
             add_bank()
-            add_capital(history=True)
-            add_assets(history=True)
-            add_control_liabilities(history=True)
+            add_capital(history=True, date_from=args.date_from, date_to=args.date_to)
+            add_assets(history=True, date_from=args.date_from, date_to=args.date_to)
+            add_control_liabilities(history=True, date_from=args.date_from, date_to=args.date_to)
             logger.info('Загрузка всех с момента последней загрузки, до текущего момента - завершена.')
         elif args.history == 'None' and args.date:
             add_clients()
@@ -429,6 +413,12 @@ if __name__ == '__main__':
             add_capital(history=False, date=args.date)
             add_assets(history=False, date=args.date)
             logger.info('Загрузка данных на указанную дату - завершена.')
+        elif args.history == 'listen':
+            # Отдельное соединение для получения уведомлений, перенос выполняется в основном соединении
+            listen_conn = psycopg2.connect(**connection_params)
+            logger.info('Непрерывный режим: ожидание новых строк staging.')
+            run_micro_batch(listen_conn, args.batch_size, args.flush_interval)
+            listen_conn.close()
 
         else:
             logger.warning("""Вы ввели некорректный параметр. Введите:
@@ -436,13 +426,20 @@ if __name__ == '__main__':
                      history_liabilities - данные о пассивах банка.
                      history_assets - данные о активах банка.
                      all - загрузка всех данных на текущий день.
-                     history_all - загрузка всех данных, с последней даты загрузки по текущий день.""")
+                     history_all - загрузка всех данных, с последней даты загрузки по текущий день.
+                     listen - непрерывный перенос новых строк staging по уведомлениям из БД.""")
 
     except Exception as e:
         logger.exception("Произошла ошибка во время выполнения файла: %s", e)
+        # Откатываем изменения, чтобы не сохранить частично загруженные данные
+        conn.rollback()
+
+    else:
+        # Сохраняем изменения
+        conn.commit()
 
-    # Сохраняем изменения
-    conn.commit()
+    log_peak_memory(logger)
+    log_statistics(logger)
 
     # Закрываем соединение
     cur.close()
@@ -1,116 +1,40 @@
 import argparse
 import logging
 import os
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from logging.handlers import RotatingFileHandler
-from typing import Optional
+from typing import Dict, List, Optional
 
 import psycopg2
 from dotenv import load_dotenv
 
+from dimension_keys import DimensionKeys
+from statements import execute, log_statistics, register
+from streaming import log_peak_memory
+from transfer_engine import transfer_dimension_to_dwh, transfer_range_to_dwh, transfer_to_dwh
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
 def add_companies() -> None:
-    cur.execute('SELECT * FROM dds.companies')
-    rows = cur.fetchall()
-
-    cur.execute('SELECT MAX(timestamp_column) FROM dwh.companies')
-    last_timestamp = cur.fetchone()[0]
-
-    for row in rows:
-        company_id = row[0]
-        name = row[1]
-        phone_number = row[2]
-        address = row[3]
-        registration_date = row[4]
-        email = row[5]
-        inn = row[6]
-        timestamp_column = row[7]
-
-        # Проверка условия по времени и добавление в dds.deposits_clients
-        if not last_timestamp or timestamp_column > last_timestamp:
-            # Добавление данных в dwh.clients
-            cur.execute('INSERT INTO dwh.companies (name, phone_number,address,registration_date,email,inn,'
-                        ' timestamp_column) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING company_id',
-                        (name, phone_number, address, registration_date, email, inn, timestamp_column))
-            new_company_id = cur.fetchone()[0]
-
-            cur.execute("""
-            SELECT * 
-            FROM dds.deposits_companies
-            WHERE company_id = %s;
-            """, (company_id,))
-
-            company_deposit = [cur.fetchone()]
-
-            for row in company_deposit:
-                deposit_amount = row[1]
-                opening_date = row[2]
-                closing_date = row[3]
-                interest_rate = row[4]
-                timestamp_column = row[6]
-
-            # Добавление в dwh.deposits_companies
-            cur.execute('INSERT INTO dwh.deposits_companies (deposit_amount, opening_date, closing_date, interest_rate,'
-                        ' company_id, timestamp_column)'
-                        ' VALUES (%s, %s, %s, %s, %s, %s)', (deposit_amount, opening_date, closing_date,
-                                                             interest_rate, new_company_id, timestamp_column))
+    # Слияние новых строк dds.companies с историей dwh.companies (SCD Type 2) и перенос их депозитов
+    opened, closed, deposits = transfer_dimension_to_dwh(cur, 'companies')
+    logger.info(f"В dwh.companies открыто версий: {opened}, закрыто предыдущих версий: {closed}, "
+                f"в dwh.deposits_companies добавлено {deposits} строк")
 
 
 def add_clients() -> None:
-    cur.execute('SELECT * FROM dds.clients')
-    rows = cur.fetchall()
-
-    cur.execute('SELECT MAX(timestamp_column) FROM dwh.clients')
-    last_timestamp = cur.fetchone()[0]
-
-    for row in rows:
-        client_id = row[0]
-        first_name = row[1]
-        last_name = row[2]
-        address = row[3]
-        phone_number = row[4]
-        registration_date = row[5]
-        email = row[6]
-        timestamp_column = row[7]
-
-        # Проверка условия по времени и добавление в dds.deposits_clients
-        if not last_timestamp or timestamp_column > last_timestamp:
-            cur.execute("""
-                        SELECT * 
-                        FROM dds.deposits_clients
-                        WHERE client_id = %s;
-                        """, (client_id,))
-
-            client_deposit = [cur.fetchone()]
-
-            # Добавление данных в dds.clients
-            cur.execute('INSERT INTO dwh.clients (first_name, last_name, address, phone_number, registration_date,'
-                        ' email, timestamp_column)'
-                        ' VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING client_id',
-                        (first_name, last_name, address, phone_number, registration_date, email, timestamp_column))
-            new_client_id = cur.fetchone()[0]
-
-            for row in client_deposit:
-                deposit_amount = row[1]
-                opening_date = row[2]
-                closing_date = row[3]
-                interest_rate = row[4]
-                timestamp_column = row[6]
-
-            # Добавление в dwh.deposits_clients
-            cur.execute('INSERT INTO dwh.deposits_clients (deposit_amount, opening_date, closing_date, interest_rate,'
-                        ' client_id, timestamp_column)'
-                        ' VALUES (%s, %s, %s, %s, %s, %s)', (deposit_amount, opening_date, closing_date,
-                                                             interest_rate, new_client_id, timestamp_column))
+    # Слияние новых строк dds.clients с историей dwh.clients (SCD Type 2) и перенос их депозитов
+    opened, closed, deposits = transfer_dimension_to_dwh(cur, 'clients')
+    logger.info(f"В dwh.clients открыто версий: {opened}, закрыто предыдущих версий: {closed}, "
+                f"в dwh.deposits_clients добавлено {deposits} строк")
 
 
 def add_bank() -> None:
     # Выборка данных из таблицы dds.bank, которых нет в таблице dwh.bank
-    cur.execute(f"""
+    cur.execute("""
         SELECT *
         FROM dds.bank
         WHERE NOT EXISTS (
@@ -127,123 +51,58 @@ def add_bank() -> None:
 
     timestamp_column = datetime.now()
 
-    # Вставка данных в таблицу dwh.capital
+    # Вставка данных в таблицу dwh.bank и ключа нового банка в кэш
     for row in rows:
         bank_data = (*row[1:-1], timestamp_column)
-        cur.execute("""
-            INSERT INTO dwh.bank (name, address, license_number, timestamp_column)
-            VALUES (%s, %s, %s, %s)
-        """, bank_data)
+        execute(cur, register('dwh_insert_bank', 'INSERT INTO dwh.bank (name, address, license_number, '
+                                                 'timestamp_column) VALUES (%s, %s, %s, %s) RETURNING id'),
+                bank_data)
+        dwh_keys.add('bank', row[1:-1], cur.fetchone()[0], timestamp_column)
 
 
-def add_capital(target_date: Optional[str] = None) -> None:
-    # Формирование условия для выборки по дате, если указана
-    date_condition = f"timestamp_column::date = '{target_date}'" if target_date else "TRUE"
+def transfer_snapshot(entity: str, target_date: Optional[str] = None, date_from: Optional[str] = None,
+                      date_to: Optional[str] = None) -> Dict[date, int]:
+    """Функция переносит срезы сущности из dds в dwh на дату target_date или, если указан date_from, за все даты
+     диапазона date_from - date_to одним запросом. id банков dds заменяются id банков dwh по натуральному ключу
+     из кэша. Для диапазона возвращает количество перенесенных строк за каждый день."""
+    bank_ids = dds_keys.mapping(dwh_keys, 'bank')
+    if date_from:
+        return transfer_range_to_dwh(cur, entity, bank_ids, date_from, date_to or datetime.now().strftime('%Y-%m-%d'))
+    transfer_to_dwh(cur, entity, bank_ids, target_date)
+    return {}
 
-    # Выборка данных из таблицы dds.capital, которых нет в таблице dwh.capital
-    cur.execute(f"""
-        SELECT *
-        FROM dds.capital
-        WHERE {date_condition}
-        AND NOT EXISTS (
-            SELECT 1
-            FROM dwh.capital
-            WHERE 
-            dds.capital.reserve_fund = dwh.capital.reserve_fund AND
-            dds.capital.equity_capital = dwh.capital.equity_capital AND
-            dds.capital.accumulated_earnings = dwh.capital.accumulated_earnings AND
-            dds.capital.timestamp_column = dwh.capital.timestamp_column
-        )
-    """)
 
-    rows = cur.fetchall()
+def add_capital(target_date: Optional[str] = None, date_from: Optional[str] = None,
+                date_to: Optional[str] = None) -> Dict[date, int]:
+    # Перенос данных из dds.capital по описанию сущности в transfer_engine
+    return transfer_snapshot('capital', target_date, date_from, date_to)
 
-    cur.execute("SELECT id FROM dwh.bank ORDER BY id DESC LIMIT 1")
-    bank_id = cur.fetchone()[0]
 
-    # Вставка данных в таблицу dwh.capital
-    for row in rows:
-        bank_data = (*row[1:-1], bank_id)
-        cur.execute("""
-            INSERT INTO dwh.capital (reserve_fund, equity_capital, accumulated_earnings, timestamp_column, bank_id)
-            VALUES (%s, %s, %s, %s, %s)
-        """, bank_data)
+def add_assets(target_date: Optional[str] = None, date_from: Optional[str] = None,
+               date_to: Optional[str] = None) -> Dict[date, int]:
+    # Перенос данных из dds.general_assets по описанию сущности в transfer_engine
+    return transfer_snapshot('general_assets', target_date, date_from, date_to)
 
 
-def add_assets(target_date: Optional[str] = None) -> None:
-    # Формирование условия для выборки по дате, если указана
-    date_condition = f"timestamp_column::date = '{target_date}'" if target_date else "TRUE"
+def add_control_liabilities(target_date: Optional[str] = None, date_from: Optional[str] = None,
+                            date_to: Optional[str] = None) -> Dict[date, int]:
+    # Перенос данных из dds.control_liabilities по описанию сущности в transfer_engine
+    return transfer_snapshot('control_liabilities', target_date, date_from, date_to)
 
-    # Выборка данных из таблицы dds.general_assets, которых нет в таблице dwh.general_assets
-    cur.execute(f"""
-        SELECT *
-        FROM dds.general_assets
-        WHERE {date_condition}
-        AND NOT EXISTS (
-            SELECT 1
-            FROM dwh.general_assets
-            WHERE 
-            dds.general_assets.securities = dwh.general_assets.securities AND
-            dds.general_assets.real_estate = dwh.general_assets.real_estate AND
-            dds.general_assets.financial_reports = dwh.general_assets.financial_reports AND
-            dds.general_assets.credit_facilities = dwh.general_assets.credit_facilities AND
-            dds.general_assets.machinery = dwh.general_assets.machinery AND
-            dds.general_assets.debts = dwh.general_assets.debts AND
-            dds.general_assets.equipment = dwh.general_assets.equipment AND
-            dds.general_assets.timestamp_column = dwh.general_assets.timestamp_column
-        )
-    """)
 
-    rows = cur.fetchall()
-
-    cur.execute("SELECT id FROM dwh.bank ORDER BY id DESC LIMIT 1")
-    bank_id = cur.fetchone()[0]
-
-    # Вставка данных в таблицу dwh.capital
-    for row in rows:
-        bank_data = (*row[1:-1], bank_id)
-        cur.execute("""
-            INSERT INTO dwh.general_assets (securities, real_estate, financial_reports, credit_facilities, 
-                     machinery, debts, equipment, timestamp_column, bank_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, bank_data)
-
-
-def add_control_liabilities(target_date: Optional[str] = None) -> None:
-    # Формирование условия для выборки по дате, если указана
-    date_condition = f"timestamp_column::date = '{target_date}'" if target_date else "TRUE"
-
-    # Выборка данных из таблицы dds.control_liabilities, которых нет в таблице dwh.control_liabilities
-    cur.execute(f"""
-        SELECT *
-        FROM dds.control_liabilities
-        WHERE {date_condition}
-        AND NOT EXISTS (
-            SELECT 1
-            FROM dwh.control_liabilities
-            WHERE 
-            dds.control_liabilities.financial_instruments_debts = dwh.control_liabilities.financial_instruments_debts AND
-            dds.control_liabilities.securities_obligations = dwh.control_liabilities.securities_obligations AND
-            dds.control_liabilities.reporting_data = dwh.control_liabilities.reporting_data AND
-            dds.control_liabilities.invoices_to_pay = dwh.control_liabilities.invoices_to_pay AND
-            dds.control_liabilities.funds_in_accounts = dwh.control_liabilities.funds_in_accounts AND
-            dds.control_liabilities.timestamp_column = dwh.control_liabilities.timestamp_column        
-        )
-    """)
-
-    rows = cur.fetchall()
-
-    cur.execute("SELECT id FROM dwh.bank ORDER BY id DESC LIMIT 1")
-    bank_id = cur.fetchone()[0]
-
-    # Вставка данных в таблицу dwh.capital
-    for row in rows:
-        bank_data = (*row[1:-1], bank_id)
-        cur.execute("""
-            INSERT INTO dwh.control_liabilities (financial_instruments_debts, securities_obligations,
-                     reporting_data, invoices_to_pay, funds_in_accounts, timestamp_column, bank_id)
-                     VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, bank_data)
+def range_summary(counts: Dict[str, Dict[date, int]], date_from: str, date_to: str) -> List[str]:
+    """Функция формирует итог загрузки диапазона дат: по строке на каждый день диапазона с количеством
+     перенесенных строк каждой сущности. Дни без новых строк тоже выводятся, чтобы были видны пропуски."""
+    day = datetime.strptime(date_from, '%Y-%m-%d').date()
+    last_day = datetime.strptime(date_to, '%Y-%m-%d').date()
+    lines = []
+    while day <= last_day:
+        lines.append(f"{day}: " + ', '.join(f"{entity} - {entity_counts.get(day, 0)}"
+                                            for entity, entity_counts in counts.items()))
+        day += timedelta(days=1)
+    totals = ', '.join(f"{entity} - {sum(entity_counts.values())}" for entity, entity_counts in counts.items())
+    lines.append(f"Всего: {totals}")
+    return lines
 
 
 if __name__ == '__main__':
@@ -284,7 +143,23 @@ if __name__ == '__main__':
                         help='Дата, на которую будет загрузка.',
                         default=datetime.now())
 
+    parser.add_argument('--from',
+                        dest='date_from',
+                        help='Начало диапазона дат для режимов target_* и current_all. Все даты диапазона '
+                             'переносятся одним запросом на сущность. Пример 2024-10-01',
+                        default=None)
+
+    parser.add_argument('--to',
+                        dest='date_to',
+                        help='Конец диапазона дат (включительно), по умолчанию - текущая дата. Пример 2024-12-31',
+                        default=None)
+
     args = parser.parse_args()
+    # Диапазон дат заменяет одну дату date
+    date_range = {}
+    if args.date_from:
+        date_range = {'date_from': args.date_from, 'date_to': args.date_to or datetime.now().strftime('%Y-%m-%d')}
+    counts = {}
 
     # Подключение к базе данных
     conn = psycopg2.connect(
@@ -294,18 +169,24 @@ if __name__ == '__main__':
         host=db_host
     )
     cur = conn.cursor()
+    # Кэш ключей справочников слоев dds и dwh на время запуска
+    dds_keys = DimensionKeys(cur, 'dds')
+    dwh_keys = DimensionKeys(cur, 'dwh')
 
     try:
+        if args.date_to and not args.date_from:
+            logger.warning("Вы ввели некорректный параметр. Конец диапазона --to указывается вместе с началом --from")
+
         if args.target_date == 'target_capital':
-            add_capital(target_date=args.date)
+            counts['capital'] = add_capital(target_date=args.date, **date_range)
             logger.info("Данные о капитале банка на все ранее не загруженные даты - загружены. "
                         "Если вы ввели конкретную дату, то данные на эту дату загружены.")
         if args.target_date == 'target_liabilities':
-            add_control_liabilities(target_date=args.date)
+            counts['control_liabilities'] = add_control_liabilities(target_date=args.date, **date_range)
             logger.info("Данные о пассивах банка на все ранее не загруженные даты - загружены."
                         "Если вы ввели конкретную дату, то данные на эту дату загружены.")
         if args.target_date == 'target_assets':
-            add_assets(target_date=args.date)
+            counts['general_assets'] = add_assets(target_date=args.date, **date_range)
             logger.info("Данные об активах банка на все ранее не загруженные даты - загружены. "
                         "Если вы ввели конкретную дату, то данные на эту дату загружены.")
 
@@ -323,16 +204,28 @@ if __name__ == '__main__':
             add_clients()
             add_companies()
             add_bank()
-            add_capital(target_date=args.date)
-            add_assets(target_date=args.date)
-            add_control_liabilities(target_date=args.date)
-            logger.info("Все данные загружены на текущую дату.")
+            counts['capital'] = add_capital(target_date=args.date, **date_range)
+            counts['general_assets'] = add_assets(target_date=args.date, **date_range)
+            counts['control_liabilities'] = add_control_liabilities(target_date=args.date, **date_range)
+            logger.info("Все данные загружены за диапазон дат." if date_range else
+                        "Все данные загружены на текущую дату.")
+
+        # Итог загрузки диапазона дат: количество перенесенных строк по дням
+        if date_range and counts:
+            for line in range_summary(counts, **date_range):
+                logger.info(line)
 
     except Exception as e:
         logger.exception("Произошла ошибка во время выполнения файла: %s", e)
+        # Откатываем изменения, чтобы не сохранить частично загруженные данные
+        conn.rollback()
+
+    else:
+        # Сохраняем изменения
+        conn.commit()
 
-    # Сохраняем изменения
-    conn.commit()
+    log_peak_memory(logger)
+    log_statistics(logger)
 
     # Закрываем соединение
     cur.close()
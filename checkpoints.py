@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+
+def load_checkpoint(cur: Any, stage: str, entity: str, bootstrap_query: str) -> Tuple[int, Optional[datetime]]:
+    """Функция возвращает id и время последней перенесенной строки источника для этапа и сущности.
+     Этап и сущность блокируются до конца транзакции, чтобы параллельный запуск не перенес те же строки.
+     Блокировка рекомендательная (advisory lock), а не блокировка строки: при первом запуске строки точки
+     еще нет, и заблокировать ее было бы нечем. Если точки еще нет, она вычисляется запросом bootstrap_query
+     по уже загруженным данным (как раньше по MAX(timestamp_column)), запрос должен вернуть id и время."""
+    # Блокировка берется отдельным запросом: снимок данных следующего запроса делается уже после того,
+    # как параллельный запуск сохранил свою точку и завершил транзакцию
+    cur.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (f'etl.checkpoints.{stage}.{entity}',))
+    cur.execute('SELECT last_id, last_timestamp FROM etl.checkpoints WHERE stage = %s AND entity = %s FOR UPDATE',
+                (stage, entity))
+    checkpoint = cur.fetchone()
+    if checkpoint is None:
+        cur.execute(bootstrap_query)
+        checkpoint = cur.fetchone()
+
+    last_id, last_timestamp = checkpoint
+    return last_id or 0, last_timestamp
+
+
+def save_checkpoint(cur: Any, stage: str, entity: str, last_id: int, last_timestamp: Optional[datetime]) -> None:
+    """Функция сохраняет контрольную точку в текущей транзакции, вместе с перенесенными данными"""
+    cur.execute("""
+        INSERT INTO etl.checkpoints (stage, entity, last_id, last_timestamp, timestamp_column)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (stage, entity) DO UPDATE SET
+            last_id = EXCLUDED.last_id,
+            last_timestamp = EXCLUDED.last_timestamp,
+            timestamp_column = EXCLUDED.timestamp_column""",
+                (stage, entity, last_id, last_timestamp, datetime.now()))
@@ -8,6 +8,8 @@ from typing import Optional, Tuple
 import psycopg2
 from dotenv import load_dotenv
 
+from statements import execute, log_statistics, register
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -22,30 +24,31 @@ def create_common_data(date: str) -> None:
         bank_total_assets = sum_assests(date)
         bank_total_capital = sum_capital(date)
 
-        cur.execute("""
+        execute(cur, register('insert_common_data', """
                     INSERT INTO dwh.common_data (client_deposits_total, company_deposits_total,
-                     bank_total_liabilities, bank_total_assets, bank_total_capital, date) VALUES (%s, %s, %s, %s, %s, %s)""",
+                     bank_total_liabilities, bank_total_assets, bank_total_capital, date)
+                     VALUES (%s, %s, %s, %s, %s, %s)"""),
                     (client_deposits_total, company_deposits_total, bank_total_liabilities, bank_total_assets,
                      bank_total_capital, date))
 
 
 def sum_deposits(date: str) -> Tuple[float, float]:
     # рассчитываем сумму депозитов клиентов, которые открыты и не закрыты на указанную дату
-    cur.execute("""
+    execute(cur, register('sum_client_deposits', """
             SELECT COALESCE(SUM(deposit_amount), 0) 
             FROM dwh.deposits_clients
             WHERE opening_date < %s 
             AND closing_date > %s
-        """, (date, date))
+        """), (date, date))
     client_deposits_total = cur.fetchone()[0]
 
     # рассчитываем сумму депозитов компаний, которые открыты и не закрыты на указанную дату
-    cur.execute("""
+    execute(cur, register('sum_company_deposits', """
                 SELECT COALESCE(SUM(deposit_amount), 0) 
                 FROM dwh.deposits_companies
                 WHERE opening_date < %s 
                 AND closing_date > %s
-            """, (date, date))
+            """), (date, date))
     company_deposits_total = cur.fetchone()[0]
     return client_deposits_total, company_deposits_total
 
@@ -55,16 +58,16 @@ def sum_liabilities(date: str) -> Optional[float]:
     search_date = datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)
     # идем по циклу с проверкой на какую дату из диапазона delta_days найдутся данные по пассивам банка
     for i in range(delta_days):
-        cur.execute("""
+        execute(cur, register('latest_liabilities', """
                 WITH closest_date AS (
                     SELECT *
                     FROM dwh.control_liabilities
-                    WHERE timestamp_column::date = %s
+                    WHERE timestamp_column >= CAST(%s AS date) AND timestamp_column < CAST(%s AS date) + 1
                     ORDER BY timestamp_column
                     LIMIT 1
                 )
                 SELECT * FROM closest_date
-            """, (search_date.strftime('%Y-%m-%d'),))
+            """), (search_date.strftime('%Y-%m-%d'),) * 2)
         liability = cur.fetchone()
 
         # присваиваем переменным соответствующие значения из найденного объекта
@@ -90,16 +93,16 @@ def sum_assests(date: str) -> Optional[float]:
     search_date = datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)
     # идем по циклу с проверкой на какую дату из диапазона delta_days найдутся данные по активам банка
     for i in range(delta_days):
-        cur.execute("""
+        execute(cur, register('latest_assets', """
                     WITH closest_date AS (
                         SELECT *
                         FROM dwh.general_assets
-                        WHERE timestamp_column::date = %s
+                        WHERE timestamp_column >= CAST(%s AS date) AND timestamp_column < CAST(%s AS date) + 1
                         ORDER BY timestamp_column
                         LIMIT 1
                     )
                     SELECT * FROM closest_date
-                """, (search_date.strftime('%Y-%m-%d'),))
+                """), (search_date.strftime('%Y-%m-%d'),) * 2)
         assets = cur.fetchone()
 
         # присваиваем переменным соответствующие значения из найденного объекта
@@ -127,16 +130,16 @@ def sum_capital(date: str) -> Optional[float]:
     search_date = datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)
     # идем по циклу с проверкой на какую дату из диапазона delta_days найдутся данные по капиталу банка
     for i in range(delta_days):
-        cur.execute("""
+        execute(cur, register('latest_capital', """
                     WITH closest_date AS (
                         SELECT *
                         FROM dwh.capital
-                        WHERE timestamp_column::date = %s
+                        WHERE timestamp_column >= CAST(%s AS date) AND timestamp_column < CAST(%s AS date) + 1
                         ORDER BY timestamp_column
                         LIMIT 1
                     )
                     SELECT * FROM closest_date
-                """, (search_date.strftime('%Y-%m-%d'),))
+                """), (search_date.strftime('%Y-%m-%d'),) * 2)
         capital = cur.fetchone()
 
         # присваиваем переменным соответствующие значения из найденного объекта
@@ -230,9 +233,14 @@ if __name__ == '__main__':
 
     except Exception as e:
         logger.exception("Произошла ошибка во время выполнения файла: %s", e)
+        # Откатываем изменения, чтобы не сохранить частично загруженные данные
+        conn.rollback()
+
+    else:
+        # Сохраняем изменения
+        conn.commit()
 
-    # Сохраняем изменения
-    conn.commit()
+    log_statistics(logger)
 
     # Закрываем соединение
     cur.close()
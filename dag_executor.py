@@ -0,0 +1,50 @@
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+
+# Статусы шагов
+DONE = 'выполнен'
+FAILED = 'ошибка'
+SKIPPED = 'пропущен'
+
+
+def run_dag(executor: Executor, dependencies: Dict[str, Sequence[str]],
+            run_step: Callable[..., Tuple[str, bool, str, float]],
+            step_args: Dict[str, Tuple[Any, ...]]) -> Dict[str, Tuple[str, str, float]]:
+    """Функция выполняет шаги в пуле executor с учетом зависимостей: dependencies - шаги, которые должны
+     успешно завершиться до запуска шага. Независимые шаги выполняются одновременно, поэтому общее время -
+     самая длинная цепочка зависимостей, а не сумма всех шагов. Если шаг завершился ошибкой, зависящие от него
+     шаги не запускаются. run_step(шаг, *step_args[шаг]) возвращает шаг, признак успеха, текст ошибки и время.
+     Возвращает для каждого шага статус, текст ошибки и время выполнения в секундах."""
+    statuses: Dict[str, Tuple[str, str, float]] = {}
+    running: Dict[Any, str] = {}
+
+    while len(statuses) < len(dependencies):
+        # Запуск шагов, у которых выполнены все зависимости, и пропуск шагов с невыполненными
+        scheduled = True
+        while scheduled:
+            scheduled = False
+            for step, required in dependencies.items():
+                if step in statuses or step in running.values():
+                    continue
+                failed = [name for name in required if statuses.get(name, ('',))[0] in (FAILED, SKIPPED)]
+                if failed:
+                    statuses[step] = (SKIPPED, f"не выполнены шаги: {', '.join(failed)}", 0.0)
+                    scheduled = True
+                elif all(statuses.get(name, ('',))[0] == DONE for name in required):
+                    running[executor.submit(run_step, step, *step_args.get(step, ()))] = step
+                    scheduled = True
+
+        if not running:
+            if len(statuses) < len(dependencies):
+                raise ValueError(f"Циклические или неизвестные зависимости шагов: "
+                                 f"{', '.join(step for step in dependencies if step not in statuses)}")
+            break
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            step = running.pop(future)
+            _, success, error, seconds = future.result()
+            statuses[step] = (DONE if success else FAILED, error, seconds)
+
+    return statuses
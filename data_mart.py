@@ -8,6 +8,9 @@ from typing import Optional
 import psycopg2
 from dotenv import load_dotenv
 
+from statements import execute, log_statistics, register
+from streaming import ITERSIZE, log_peak_memory, stream_rows
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -16,12 +19,11 @@ logger.setLevel(logging.INFO)
 def add_data_mart(standard_n1_0: float, standard_n1_1: float, standard_n1_2: float, date: Optional[str] = None) -> None:
     # расчет данных по указанной дате
     if date != 'None' and date:
-        cur.execute('SELECT * FROM dwh.common_data WHERE "date" = %s', (date,))
+        execute(cur, register('common_data_on_date', 'SELECT * FROM dwh.common_data WHERE "date" = %s'), (date,))
         rows = cur.fetchall()
-    # расчет показателей на все даты, указанные в БД
+    # расчет показателей на все даты, указанные в БД, строки читаются потоком через серверный курсор
     else:
-        cur.execute('SELECT * FROM dwh.common_data')
-        rows = cur.fetchall()
+        rows = stream_rows(cur, 'SELECT * FROM dwh.common_data', itersize=itersize)
 
     cur.execute('SELECT MAX(date) FROM data_mart.params')
     last_timestamp = cur.fetchone()[0]
@@ -55,10 +57,10 @@ def add_data_mart(standard_n1_0: float, standard_n1_1: float, standard_n1_2: flo
                 timestamp = datetime.now()
 
             # Добавление данных в data_mart.params
-            cur.execute('INSERT INTO data_mart.params (n1_0, standard_n1_0, n1_1, standard_n1_1, '
-                        'n1_2, standard_n1_2, date, timestamp)'
-                        ' VALUES (%s, %s, %s, %s, %s, %s, %s, %s)', (n1_0, standard_n1_0, n1_1, standard_n1_1, n1_2,
-                                                                     standard_n1_2, date, timestamp))
+            execute(cur, register('insert_params', 'INSERT INTO data_mart.params (n1_0, standard_n1_0, n1_1, '
+                                                   'standard_n1_1, n1_2, standard_n1_2, date, timestamp) '
+                                                   'VALUES (%s, %s, %s, %s, %s, %s, %s, %s)'),
+                    (n1_0, standard_n1_0, n1_1, standard_n1_1, n1_2, standard_n1_2, date, timestamp))
 
 
 if __name__ == '__main__':
@@ -107,7 +109,13 @@ if __name__ == '__main__':
                         help='Дата, на которую будет загружены параметры. Формат 2024-11-01',
                         default=datetime.now().strftime('%Y-%m-%d'))
 
+    parser.add_argument('--itersize',
+                        type=int,
+                        help='Количество строк, которые читаются с сервера за один раз при расчете на все даты.',
+                        default=ITERSIZE)
+
     args = parser.parse_args()
+    itersize = args.itersize
 
     # Подключение к базе данных
     conn = psycopg2.connect(
@@ -131,9 +139,15 @@ if __name__ == '__main__':
 
     except Exception as e:
         logger.exception("Произошла ошибка во время выполнения файла: %s", e)
+        # Откатываем изменения, чтобы не сохранить частично загруженные данные
+        conn.rollback()
+
+    else:
+        # Сохраняем изменения
+        conn.commit()
 
-    # Сохраняем изменения
-    conn.commit()
+    log_peak_memory(logger)
+    log_statistics(logger)
 
     # Закрываем соединение
     cur.close()
@@ -0,0 +1,90 @@
+from bisect import bisect_right
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+
+# Справочники: суррогатный ключ и поля натурального ключа
+DIMENSIONS = {
+    'bank': ('id', ('name', 'address', 'license_number')),
+    'clients': ('client_id', ('first_name', 'last_name', 'registration_date', 'email')),
+    'companies': ('company_id', ('inn',)),
+}
+
+# Справочники, ключи которых кэшируются в памяти. Клиенты и компании переносятся запросами на множество строк,
+# которые сами соединяют таблицы по натуральному ключу, поэтому их ключи в Python не нужны
+CACHED_DIMENSIONS = ('bank',)
+
+
+def to_datetime(value: Union[str, date, datetime]) -> datetime:
+    """Функция приводит дату или время строкой (как их передают скрипты ETL) к datetime для сравнения"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value))
+
+
+class DimensionKeys:
+    """Кэш соответствия натуральных ключей суррогатным для справочников CACHED_DIMENSIONS одного слоя (dds или dwh).
+     Каждый справочник загружается из БД один раз за запуск, при первом обращении. Новые ключи, добавленные
+     скриптом, дописываются в кэш методом add, поэтому повторные запросы к справочникам не нужны."""
+
+    def __init__(self, cur: Any, schema: str):
+        self.cur = cur
+        self.schema = schema
+        self.keys: Dict[str, Dict[Tuple[Any, ...], int]] = {}
+        self.natural_keys: Dict[str, Dict[int, Tuple[Any, ...]]] = {}
+        # Ключи в порядке времени добавления, для поиска записи, действовавшей на момент времени
+        self.timelines: Dict[str, Tuple[List[datetime], List[int]]] = {}
+
+    def load(self, dimension: str) -> None:
+        """Функция загружает справочник одним запросом, если он еще не загружен"""
+        if dimension in self.keys:
+            return
+        if dimension not in CACHED_DIMENSIONS:
+            raise ValueError(f"Ключи справочника {dimension} не кэшируются, доступны: {', '.join(CACHED_DIMENSIONS)}")
+
+        key_column, natural_columns = DIMENSIONS[dimension]
+        self.cur.execute(f"SELECT {key_column}, {', '.join(natural_columns)}, timestamp_column "
+                         f"FROM {self.schema}.{dimension} ORDER BY timestamp_column, {key_column}")
+        self.keys[dimension] = {}
+        self.natural_keys[dimension] = {}
+        self.timelines[dimension] = ([], [])
+        for row in self.cur.fetchall():
+            self.add(dimension, tuple(row[1:-1]), row[0], row[-1])
+
+    def add(self, dimension: str, natural_key: Tuple[Any, ...], surrogate_key: int,
+            timestamp_column: Union[str, date, datetime]) -> None:
+        """Функция добавляет в кэш ключ новой строки справочника"""
+        self.load(dimension)
+        self.keys[dimension][tuple(natural_key)] = surrogate_key
+        self.natural_keys[dimension][surrogate_key] = tuple(natural_key)
+
+        timestamps, surrogate_keys = self.timelines[dimension]
+        position = bisect_right(timestamps, to_datetime(timestamp_column))
+        timestamps.insert(position, to_datetime(timestamp_column))
+        surrogate_keys.insert(position, surrogate_key)
+
+    def get(self, dimension: str, natural_key: Tuple[Any, ...]) -> Optional[int]:
+        """Функция возвращает суррогатный ключ по натуральному"""
+        self.load(dimension)
+        return self.keys[dimension].get(tuple(natural_key))
+
+    def at(self, dimension: str, timestamp_column: Union[str, date, datetime]) -> Optional[int]:
+        """Функция возвращает ключ строки справочника, действовавшей на указанный момент - последней добавленной
+         не позже него. Для строк раньше первой записи справочника возвращается первая запись."""
+        self.load(dimension)
+        timestamps, surrogate_keys = self.timelines[dimension]
+        if not surrogate_keys:
+            return None
+        position = bisect_right(timestamps, to_datetime(timestamp_column))
+        return surrogate_keys[max(position - 1, 0)]
+
+    def mapping(self, target: 'DimensionKeys', dimension: str) -> Dict[int, int]:
+        """Функция сопоставляет ключи этого слоя ключам слоя target по натуральному ключу,
+         например id банка в dds - id того же банка в dwh"""
+        self.load(dimension)
+        target.load(dimension)
+        return {surrogate_key: target.keys[dimension][natural_key]
+                for surrogate_key, natural_key in self.natural_keys[dimension].items()
+                if natural_key in target.keys[dimension]}
@@ -0,0 +1,287 @@
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow.dataset as arrow_dataset
+except ImportError:
+    arrow_dataset = None
+
+
+# Размер части файла, которую разбирает один процесс
+RANGE_SIZE = 16 * 1024 * 1024
+
+# Количество строк в одной пачке колонок при чтении Parquet и Arrow файлов
+BATCH_SIZE = 64 * 1024
+
+# Форматы колоночных файлов по расширению
+COLUMNAR_FORMATS = {
+    '.parquet': 'parquet',
+    '.arrow': 'ipc',
+    '.feather': 'ipc',
+    '.ipc': 'ipc',
+}
+
+
+def open_zstd(path_file: str) -> BinaryIO:
+    """Функция открывает файл .zst как поток распакованных данных"""
+    if zstandard is None:
+        raise RuntimeError(f"Для чтения файла {path_file} установите пакет zstandard: pip install zstandard")
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path_file, 'rb'), closefd=True))
+
+
+# Функции открытия сжатых файлов по расширению
+DECOMPRESSORS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.zst': open_zstd,
+}
+
+
+def is_compressed(path_file: str) -> bool:
+    """Функция проверяет по расширению, что файл сжат"""
+    return os.path.splitext(path_file)[1].lower() in DECOMPRESSORS
+
+
+def open_binary(path_file: str) -> BinaryIO:
+    """Функция открывает файл для чтения байтов. Сжатые файлы читаются потоком без распаковки на диск,
+     смещения в них считаются по распакованным данным."""
+    decompressor = DECOMPRESSORS.get(os.path.splitext(path_file)[1].lower())
+    if decompressor:
+        return decompressor(path_file)
+    return open(path_file, 'rb')
+
+
+def skip_to(file: BinaryIO, byte_offset: int) -> None:
+    """Функция переходит к смещению byte_offset от начала файла. Поток распаковки .zst не поддерживает seek,
+     в нем данные до смещения читаются и отбрасываются (для .gz, .bz2 и .xz seek делает то же самое)."""
+    if not byte_offset:
+        return
+    if file.seekable():
+        file.seek(byte_offset)
+        return
+    while byte_offset > 0:
+        skipped = len(file.read(min(byte_offset, io.DEFAULT_BUFFER_SIZE * 16)))
+        if not skipped:
+            break
+        byte_offset -= skipped
+
+
+@contextmanager
+def mapped_file(path_file: str) -> Iterator[Any]:
+    """Функция отображает несжатый файл в память, чтобы искать границы строк и читать части файла
+     без копирования в буферы Python"""
+    with open(path_file, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # Пустой файл нельзя отобразить в память
+            yield b''
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def header_end(path_file: str) -> int:
+    """Функция возвращает смещение в байтах, с которого начинаются данные после заголовка"""
+    with mapped_file(path_file) as mapped:
+        end = mapped.find(b'\n')
+        return len(mapped) if end == -1 else end + 1
+
+
+def split_byte_ranges(path_file: str, start: int, range_size: int = RANGE_SIZE) -> List[Tuple[int, int]]:
+    """Функция делит файл начиная со смещения start на части примерно по range_size байт. Границы частей
+     сдвигаются на начало следующей записи CSV, поэтому каждая запись целиком попадает ровно в одну часть.
+     Перевод строки внутри поля в кавычках границей не считается: граница допустима, только если число кавычек
+     от начала части четное. Разбиение по байтам корректно и для UTF-8: байты перевода строки и кавычки
+     не встречаются внутри многобайтных символов."""
+    ranges = []
+    with mapped_file(path_file) as mapped:
+        file_size = len(mapped)
+        while start < file_size:
+            end = start + range_size
+            if end < file_size:
+                # Граница сдвигается за ближайший перевод строки, поиск идет прямо в отображенном файле
+                end = mapped.find(b'\n', end) + 1 or file_size
+                quotes = mapped[start:end].count(b'"')
+                # Пока открыта кавычка, перевод строки - часть поля, граница сдвигается за следующий
+                while quotes % 2 and end < file_size:
+                    next_end = mapped.find(b'\n', end) + 1 or file_size
+                    quotes += mapped[end:next_end].count(b'"')
+                    end = next_end
+            else:
+                end = file_size
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_byte_range(path_file: str, start: int, end: int) -> Tuple[List[List[str]], int]:
+    """Функция разбирает строки CSV из части файла [start, end).
+     Возвращает строки и количество прочитанных строк файла."""
+    with mapped_file(path_file) as mapped, memoryview(mapped) as view:
+        with view[start:end] as part:
+            data = str(part, 'utf-8')
+
+    if data.count('"') % 2:
+        raise ValueError(f"В файле {path_file} не закрыта кавычка в части с {start} по {end} байт")
+    lines_count = data.count('\n') + (0 if not data or data.endswith('\n') else 1)
+    return list(csv.reader(io.StringIO(data, newline=''))), lines_count
+
+
+class ParallelReader:
+    """Замена csv.reader для больших файлов: части файла разбираются параллельно в workers процессах,
+     строки отдаются в том же порядке, что и при последовательном чтении. Одновременно в памяти находится
+     не больше 2 * workers разобранных частей."""
+
+    def __init__(self, path_file: str, byte_offset: int = 0, workers: int = 2, range_size: int = RANGE_SIZE):
+        self.path_file = path_file
+        self.workers = workers
+        # Заголовок пропускается, только если чтение идет с начала файла
+        self.start = byte_offset or header_end(path_file)
+        self.line_num = 1 if not byte_offset else 0
+        self.ranges = split_byte_ranges(path_file, self.start, range_size)
+        self.end = self.ranges[-1][1] if self.ranges else self.start
+
+    def __iter__(self) -> Iterator[List[str]]:
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            ranges = iter(self.ranges)
+            for start, end in ranges:
+                pending.append(executor.submit(parse_byte_range, self.path_file, start, end))
+                if len(pending) >= 2 * self.workers:
+                    break
+
+            while pending:
+                rows, lines_count = pending.popleft().result()
+                next_range = next(ranges, None)
+                if next_range:
+                    pending.append(executor.submit(parse_byte_range, self.path_file, *next_range))
+                self.line_num += lines_count
+                yield from rows
+
+    def tell(self) -> int:
+        """Смещение в байтах, до которого файл будет прочитан"""
+        return self.end
+
+
+def read_chunks(path_file: str, byte_offset: int, chunk_size: int) -> Iterator[Tuple[List[List[str]], int, int]]:
+    """Функция читает CSV файл с указанного смещения пачками по chunk_size записей. Для каждой пачки возвращает
+     разобранные строки, смещение в байтах сразу после пачки и количество прочитанных строк файла,
+     чтобы после сохранения пачки можно было записать, до какого места файл загружен. Запись с полем
+     в кавычках, содержащим перевод строки, не разрывается между пачками. Незакрытая кавычка в конце файла
+     считается ошибкой."""
+    with open_binary(path_file) as file:
+        skip_to(file, byte_offset)
+        lines_count = 0
+        if byte_offset == 0:
+            file.readline()  # Пропускаем заголовок
+            lines_count = 1
+
+        lines = []
+        records = 0
+        in_quotes = False
+        for line in file:
+            lines.append(line.decode('utf-8'))
+            # Нечетное число кавычек в строке открывает или закрывает поле с переводом строки внутри
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            if in_quotes:
+                continue
+            records += 1
+            if records == chunk_size:
+                yield list(csv.reader(lines)), file.tell(), lines_count + len(lines)
+                lines = []
+                records = 0
+                lines_count = 0
+
+        if in_quotes:
+            raise ValueError(f"В файле {path_file} не закрыта кавычка в записи, начинающейся с: {lines[0][:100]!r}")
+        if lines or lines_count:
+            yield list(csv.reader(lines)), file.tell(), lines_count + len(lines)
+
+
+def is_columnar(path_file: str) -> bool:
+    """Функция проверяет по расширению, что файл в формате Parquet или Arrow IPC"""
+    return os.path.splitext(path_file)[1].lower() in COLUMNAR_FORMATS
+
+
+class ColumnarReader:
+    """Замена csv.reader для файлов Parquet и Arrow IPC: файл читается пачками колонок с уже типизированными
+     значениями, разбор строк не нужен. Колонки выбираются по названиям в порядке колонок таблицы staging,
+     при timestamp_in_file timestamp_column добавляется последним значением, если она есть в файле и заполнена.
+     Для таблиц, у которых время загрузки задает скрипт (клиенты, компании), колонка файла не читается."""
+
+    def __init__(self, path_file: str, columns: Optional[Sequence[str]] = None, skip_rows: int = 0,
+                 batch_size: int = BATCH_SIZE, timestamp_in_file: bool = False):
+        if arrow_dataset is None:
+            raise RuntimeError(f"Для чтения файла {path_file} установите пакет pyarrow: pip install pyarrow")
+
+        self.path_file = path_file
+        file_format = COLUMNAR_FORMATS[os.path.splitext(path_file)[1].lower()]
+        self.dataset = arrow_dataset.dataset(path_file, format=file_format)
+        names = self.dataset.schema.names
+        self.columns = list(columns or names)
+        missing = [column for column in self.columns if column not in names]
+        if missing:
+            raise ValueError(f"В файле {path_file} нет колонок: {', '.join(missing)}")
+
+        self.timestamp_in_file = (timestamp_in_file and bool(columns) and 'timestamp_column' in names
+                                  and 'timestamp_column' not in columns)
+        if self.timestamp_in_file:
+            self.columns.append('timestamp_column')
+        self.skip_rows = skip_rows
+        self.batch_size = batch_size
+        self.line_num = 0
+        self.end = 0
+
+    def __iter__(self) -> Iterator[List[Any]]:
+        skip_rows = self.skip_rows
+        for batch in self.dataset.to_batches(columns=self.columns, batch_size=self.batch_size):
+            # При продолжении загрузки пропускаются уже загруженные строки
+            if skip_rows >= batch.num_rows:
+                skip_rows -= batch.num_rows
+                continue
+            batch = batch.slice(skip_rows)
+            skip_rows = 0
+
+            for row in zip(*(column.to_pylist() for column in batch.columns)):
+                row = list(row)
+                if self.timestamp_in_file and row[-1] is None:
+                    row.pop()
+                yield row
+            self.line_num += batch.num_rows
+        self.end = os.path.getsize(self.path_file)
+
+    def tell(self) -> int:
+        """После чтения всего файла - размер файла, до конца чтения - 0"""
+        return self.end
+
+    def chunks(self, chunk_size: int) -> Iterator[Tuple[List[List[Any]], int, int]]:
+        """Функция читает файл пачками по chunk_size строк так же, как read_chunks: для каждой пачки возвращает
+         строки, смещение (размер файла после последней пачки, иначе 0) и количество прочитанных строк"""
+        file_size = os.path.getsize(self.path_file)
+        remaining = self.dataset.count_rows() - self.skip_rows
+        if remaining <= 0:
+            yield [], file_size, 0
+            return
+
+        rows = []
+        for row in self:
+            rows.append(row)
+            remaining -= 1
+            if len(rows) == chunk_size or not remaining:
+                yield rows, 0 if remaining else file_size, len(rows)
+                rows = []
@@ -0,0 +1,198 @@
+import argparse
+import hashlib
+import logging
+import os
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from logging.handlers import RotatingFileHandler
+from typing import Any, Iterable
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# Таблицы с колонкой row_hash и поля, по которым считается отпечаток строки
+FINGERPRINT_COLUMNS = {
+    'staging.clients': ('first_name', 'last_name', 'address', 'phone_number', 'registration_date', 'email',
+                        'deposit_amount', 'opening_date', 'closing_date', 'interest_rate'),
+    'staging.companies': ('name', 'phone_number', 'address', 'registration_date', 'email', 'inn', 'deposit_amount',
+                          'opening_date', 'closing_date', 'interest_rate'),
+    'staging.bank': ('name', 'address', 'license_number'),
+    'staging.capital': ('reserve_fund', 'equity_capital', 'accumulated_earnings', 'timestamp_column'),
+    'staging.control_liabilities': ('financial_instruments_debts', 'securities_obligations', 'reporting_data',
+                                    'invoices_to_pay', 'funds_in_accounts', 'timestamp_column'),
+    'staging.general_assets': ('securities', 'real_estate', 'financial_reports', 'credit_facilities', 'machinery',
+                               'debts', 'equipment', 'timestamp_column'),
+    'dds.capital': ('reserve_fund', 'equity_capital', 'accumulated_earnings', 'timestamp_column'),
+    'dds.control_liabilities': ('financial_instruments_debts', 'securities_obligations', 'reporting_data',
+                                'invoices_to_pay', 'funds_in_accounts', 'timestamp_column'),
+    'dds.general_assets': ('securities', 'real_estate', 'financial_reports', 'credit_facilities', 'machinery',
+                           'debts', 'equipment', 'timestamp_column'),
+    'dwh.capital': ('reserve_fund', 'equity_capital', 'accumulated_earnings', 'timestamp_column'),
+    'dwh.control_liabilities': ('financial_instruments_debts', 'securities_obligations', 'reporting_data',
+                                'invoices_to_pay', 'funds_in_accounts', 'timestamp_column'),
+    'dwh.general_assets': ('securities', 'real_estate', 'financial_reports', 'credit_facilities', 'machinery',
+                           'debts', 'equipment', 'timestamp_column'),
+}
+
+# Текстовые поля: ИНН, телефон, номер лицензии и т.п. похожи на числа, но ведущие нули и знак в них значимы,
+# поэтому они сравниваются как строки без приведения к числу или дате
+TEXT_COLUMNS = {'first_name', 'last_name', 'address', 'phone_number', 'email', 'name', 'inn', 'license_number'}
+
+
+def normalize_value(value: Any, text: bool = False) -> str:
+    """Функция приводит значение к единому строковому виду, чтобы строка из файла ('1000.00',
+     '2024-05-01 00:00:00.000') и то же значение, прочитанное из БД (Decimal, float, datetime),
+     давали один отпечаток. Значение текстового поля (text) только очищается от пробелов по краям."""
+    if value is None:
+        return ''
+    if text:
+        return str(value).strip()
+    if isinstance(value, datetime):
+        if value.time() == datetime.min.time():
+            return value.date().isoformat()
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (int, float, Decimal)):
+        value = str(value)
+
+    value = str(value).strip()
+    try:
+        number = Decimal(value)
+        if number.is_finite():
+            return format(number.normalize(), 'f')
+    except InvalidOperation:
+        pass
+    try:
+        return normalize_value(datetime.fromisoformat(value))
+    except ValueError:
+        return value
+
+
+def row_fingerprint(values: Iterable[Any], table: str) -> str:
+    """Функция считает отпечаток строки таблицы table - md5 от нормализованных значений бизнес-полей
+     в порядке FINGERPRINT_COLUMNS"""
+    normalized = '\x1f'.join(normalize_value(value, column in TEXT_COLUMNS)
+                              for value, column in zip(values, FINGERPRINT_COLUMNS[table]))
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()
+
+
+def has_unique_hash(cur: Any, table: str) -> bool:
+    """Функция проверяет, есть ли у таблицы уникальный индекс, в который входит row_hash"""
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1
+            FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = to_regclass(%s) AND i.indisunique AND a.attname = 'row_hash'
+        )""", (table,))
+    return bool(cur.fetchone()[0])
+
+
+def backfill_table(table: str, conn: Any, batch_size: int = 10000) -> None:
+    """Функция заполняет row_hash у строк, загруженных до появления отпечатков. Если у таблицы есть уникальный
+     индекс по row_hash и отпечаток уже занят другой строкой (дубликат), row_hash остается пустым, чтобы
+     не нарушить индекс. В таблицах без такого индекса (dds, секционированные таблицы) отпечаток получают
+     все строки, в том числе повторы: по нему перенос в dwh отличает изменившиеся срезы от прежних."""
+    columns = FINGERPRINT_COLUMNS[table]
+
+    with conn.cursor() as cur:
+        unique = has_unique_hash(cur, table)
+        known_hashes = set()
+        if unique:
+            cur.execute(f'SELECT row_hash FROM {table} WHERE row_hash IS NOT NULL')
+            known_hashes = {row[0] for row in cur.fetchall()}
+
+    updated = 0
+    duplicates = 0
+    with conn.cursor(name=f"backfill_{table.replace('.', '_')}") as read_cur, conn.cursor() as write_cur:
+        read_cur.execute(f"SELECT id, {', '.join(columns)} FROM {table} WHERE row_hash IS NULL ORDER BY id")
+        while True:
+            rows = read_cur.fetchmany(batch_size)
+            if not rows:
+                break
+
+            hashes = []
+            for row in rows:
+                row_hash = row_fingerprint(row[1:], table)
+                if unique and row_hash in known_hashes:
+                    duplicates += 1
+                    continue
+                known_hashes.add(row_hash)
+                hashes.append((row[0], row_hash))
+
+            execute_values(write_cur, f"""
+                UPDATE {table} t SET row_hash = v.row_hash
+                FROM (VALUES %s) AS v(id, row_hash)
+                WHERE t.id = v.id""", hashes)
+            updated += len(hashes)
+
+    logger.info(f"{table}: заполнено {updated} отпечатков, дубликатов без отпечатка {duplicates}")
+
+
+if __name__ == '__main__':
+    # Запись логов в файл
+    file_handler = RotatingFileHandler(os.path.join('logs', 'fingerprint.log'),
+                                       maxBytes=2*1024*1024,
+                                       backupCount=1)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(file_handler)
+
+    # Вывод логов в консоль
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    logger.addHandler(console_handler)
+
+    # Использование переменных окружения
+    load_dotenv()
+
+    db_name = os.getenv("DB_NAME")
+    db_host = os.getenv("DB_HOST")
+    db_user = os.getenv("DB_USER")
+    db_pass = os.getenv("DB_PASS")
+
+    # Использование парсера
+    parser = argparse.ArgumentParser()
+    parser.add_argument('table',
+                        nargs='?',
+                        help='Таблица, в которой нужно заполнить row_hash, например staging.clients. '
+                             'all - заполнение во всех таблицах.',
+                        default='all')
+
+    args = parser.parse_args()
+
+    # Подключение к базе данных
+    conn = psycopg2.connect(
+        dbname=db_name,
+        user=db_user,
+        password=db_pass,
+        host=db_host
+    )
+
+    try:
+        if args.table == 'all':
+            for table in FINGERPRINT_COLUMNS:
+                backfill_table(table, conn)
+        elif args.table in FINGERPRINT_COLUMNS:
+            backfill_table(args.table, conn)
+        else:
+            logger.warning(f"Вы ввели некорректный параметр. Введите all или одну из таблиц: "
+                           f"{', '.join(FINGERPRINT_COLUMNS)}")
+
+    except Exception as e:
+        logger.exception("Произошла ошибка во время выполнения файла: %s", e)
+        # Откатываем изменения, чтобы не сохранить частично загруженные данные
+        conn.rollback()
+
+    else:
+        # Сохраняем изменения
+        conn.commit()
+
+    # Закрываем соединение
+    conn.close()
@@ -1,264 +1,650 @@
 import argparse
 import csv
+import hashlib
+import io
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from logging.handlers import RotatingFileHandler
-from typing import Any, Callable, List, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import psycopg2
 from dotenv import load_dotenv
 
+from file_readers import (ColumnarReader, ParallelReader, is_columnar, is_compressed, open_binary, read_chunks,
+                          skip_to)
+from fingerprint import row_fingerprint
+from partitions import PARTITIONED_TABLES
+from statements import execute, log_statistics, register
+from validation import validate_batch, write_rejects
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-
-def reading_file(path_file: str, loading_function: Callable[[csv.reader, str, Any], None], cur: Any):
+# Количество строк файла, уникальность которых проверяется одним запросом
+CHUNK_SIZE = 1000
+
+# Папка для строк файлов, не прошедших проверку
+REJECTS_DIR = 'rejects'
+
+# Размер начального и конечного блока загруженной части файла, по которым считается контрольная сумма
+CHECKSUM_BLOCK = 64 * 1024
+
+
+def file_checksum(path_file: str, byte_offset: int) -> str:
+    """Функция считает контрольную сумму уже загруженной части файла (первые byte_offset байт) по ее начальному
+     и конечному блокам. Этого достаточно, чтобы отличить дописанный файл от перезаписанного, не перечитывая
+     файл целиком."""
+    digest = hashlib.sha256(str(byte_offset).encode())
+    with open(path_file, 'rb') as file:
+        digest.update(file.read(min(CHECKSUM_BLOCK, byte_offset)))
+        tail_start = max(CHECKSUM_BLOCK, byte_offset - CHECKSUM_BLOCK)
+        if tail_start < byte_offset:
+            file.seek(tail_start)
+            digest.update(file.read(byte_offset - tail_start))
+    return digest.hexdigest()
+
+
+def manifest_checksum(path_file: str, byte_offset: int) -> str:
+    """Функция считает контрольную сумму для журнала загрузки. Смещение в сжатом файле относится
+     к распакованным данным, а файлы Parquet и Arrow не дописываются, поэтому такие файлы сверяются целиком."""
+    if is_compressed(path_file) or is_columnar(path_file):
+        return file_checksum(path_file, os.path.getsize(path_file))
+    return file_checksum(path_file, byte_offset)
+
+
+def fully_loaded(path_file: str, byte_offset: int) -> bool:
+    """Функция проверяет, что несжатый файл уже загружен до конца. Для сжатого файла размер распакованных
+     данных заранее неизвестен, такой файл дочитывается с сохраненного смещения: при каждой загрузке он
+     распаковывается с начала до этого смещения, поэтому сжатые файлы лучше не дописывать, а заводить новые."""
+    return not is_compressed(path_file) and byte_offset == os.path.getsize(path_file)
+
+
+def manifest_position(path_file: str, cur: Any) -> Tuple[int, int]:
+    """Функция по журналу etl.load_manifest возвращает смещение в байтах и номер строки, с которых нужно
+     продолжить загрузку файла. Если файл не загружался или был перезаписан, загрузка идет с начала."""
+    cur.execute('SELECT byte_offset, line_number, checksum FROM etl.load_manifest WHERE file_path = %s',
+                (os.path.abspath(path_file),))
+    manifest = cur.fetchone()
+    if manifest is None:
+        return 0, 0
+
+    byte_offset, line_number, checksum = manifest
+    if (is_compressed(path_file) or byte_offset <= os.path.getsize(path_file)) and \
+            manifest_checksum(path_file, byte_offset) == checksum:
+        return byte_offset, line_number
+
+    logger.warning(f"Файл {path_file} изменился не только дописыванием, загружаем его с начала")
+    return 0, 0
+
+
+def update_manifest(path_file: str, byte_offset: int, line_number: int, cur: Any) -> None:
+    """Функция записывает в журнал etl.load_manifest, до какого места файл загружен"""
+    cur.execute("""
+        INSERT INTO etl.load_manifest (file_path, file_size, checksum, byte_offset, line_number, timestamp_column)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (file_path) DO UPDATE SET
+            file_size = EXCLUDED.file_size,
+            checksum = EXCLUDED.checksum,
+            byte_offset = EXCLUDED.byte_offset,
+            line_number = EXCLUDED.line_number,
+            timestamp_column = EXCLUDED.timestamp_column""",
+                (os.path.abspath(path_file), os.path.getsize(path_file), manifest_checksum(path_file, byte_offset),
+                 byte_offset, line_number, datetime.now()))
+
+
+@contextmanager
+def open_csv(path_file: str, byte_offset: int = 0, workers: int = 1, columns: Optional[Tuple[str, ...]] = None,
+             timestamp_in_file: bool = False, line_number: int = 0) -> Iterator[Tuple[Any, Callable[[], int]]]:
+    """Функция открывает CSV файл для чтения с указанного смещения в байтах. Заголовок пропускается,
+     только если чтение идет с начала файла. При workers > 1 части файла разбираются параллельно.
+     Файлы .gz, .bz2, .xz и .zst читаются потоком без распаковки на диск, файлы Parquet и Arrow IPC -
+     пачками колонок columns (и timestamp_column при timestamp_in_file), продолжение их загрузки начинается
+     после line_number уже загруженных строк. Вместе с reader возвращается функция, которая после чтения
+     отдает смещение конца прочитанных данных. reader.line_num считает только строки, прочитанные сейчас."""
+    if is_columnar(path_file):
+        reader = ColumnarReader(path_file, columns, skip_rows=line_number, timestamp_in_file=timestamp_in_file)
+        yield reader, reader.tell
+        return
+
+    if workers > 1 and is_compressed(path_file):
+        logger.warning(f"Сжатый файл {path_file} нельзя разделить на части, он будет разобран в одном процессе")
+    elif workers > 1:
+        reader = ParallelReader(path_file, byte_offset, workers)
+        yield reader, reader.tell
+        return
+
+    with open_binary(path_file) as binary_file:
+        skip_to(binary_file, byte_offset)
+        with io.TextIOWrapper(binary_file, encoding='utf-8', newline='') as file:
+            reader = csv.reader(file)
+            if byte_offset == 0:
+                next(reader)  # Пропускаем заголовок
+            yield reader, binary_file.tell
+
+
+def loading_in_chunks(path_file: str, byte_offset: int, line_number: int, chunk_size: int,
+                      load_chunk: Callable[[List[List[str]]], None], cur: Any,
+                      columns: Optional[Tuple[str, ...]] = None, timestamp_in_file: bool = False) -> None:
+    """Функция загружает файл пачками по chunk_size строк. Каждая пачка сохраняется отдельной транзакцией
+     вместе с записью в журнал etl.load_manifest, поэтому после сбоя загрузка продолжается
+     с последней сохраненной пачки, а в памяти находится не больше одной пачки.
+     Файлы Parquet и Arrow продолжаются по номеру строки, а не по смещению в байтах."""
+    if is_columnar(path_file):
+        chunks = ColumnarReader(path_file, columns, skip_rows=line_number,
+                                timestamp_in_file=timestamp_in_file).chunks(chunk_size)
+    else:
+        chunks = read_chunks(path_file, byte_offset, chunk_size)
+
+    for rows, end_offset, lines_count in chunks:
+        load_chunk(rows)
+        line_number += lines_count
+        update_manifest(path_file, end_offset, line_number, cur)
+        cur.connection.commit()
+        logger.info(f"{os.path.basename(path_file)}: сохранено до строки {line_number}")
+
+
+def reading_file(path_file: str, loading_function: Callable[[csv.reader, str, Any], None], cur: Any,
+                 manifest: bool = False, workers: int = 1, chunk_size: Optional[int] = None,
+                 columns: Optional[Tuple[str, ...]] = None, timestamp_in_file: bool = False):
     """Функция считывает данные с файла в список списков строк и передает данный список
-     в указанную функцию для загрузки информации в базу данных."""
+     в указанную функцию для загрузки информации в базу данных.
+     При manifest=True загружаются только строки, дописанные после прошлой загрузки,
+     при workers > 1 файл разбирается параллельно в нескольких процессах,
+     при указании chunk_size файл загружается пачками с сохранением после каждой пачки.
+     Из файлов Parquet и Arrow читаются колонки columns, без них - все колонки в порядке файла,
+     timestamp_column файла читается только при timestamp_in_file."""
     file_name = os.path.basename(path_file)
+    # Без журнала загрузки продолжить прерванную загрузку пачками было бы невозможно
+    manifest = manifest or bool(chunk_size)
+
+    byte_offset, line_number = manifest_position(path_file, cur) if manifest else (0, 0)
+    if manifest and fully_loaded(path_file, byte_offset):
+        logger.info(f"Файл {file_name} не изменился с прошлой загрузки")
+        return None, file_name
+
+    if chunk_size:
+        loading_in_chunks(path_file, byte_offset, line_number, chunk_size,
+                          lambda rows: loading_function(rows, file_name, cur), cur, columns, timestamp_in_file)
+        return None, file_name
 
     # Открываем CSV файл для чтения
-    with open(path_file, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.reader(file)
-        next(reader)  # Пропускаем заголовок
+    with open_csv(path_file, byte_offset, workers, columns, timestamp_in_file, line_number) as (reader, tell):
         loading_function(reader, file_name, cur)
+        if manifest:
+            update_manifest(path_file, tell(), line_number + reader.line_num, cur)
     return reader, file_name
 
 
+def chunked(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Функция разбивает поток строк на списки по size строк"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def insert_new_records(cur: Any, table: str, columns: Tuple[str, ...], records: List[Tuple[Any, ...]]) -> None:
+    """Функция одним запросом по индексу row_hash проверяет, какие записи пачки уже есть в таблице,
+     и вставляет только новые. Отпечаток строки должен быть последним значением записи.
+     Оба запроса регистрируются один раз на таблицу и выполняются как подготовленные (см. statements.py)."""
+    name = table.replace('.', '_')
+    execute(cur, register(f'{name}_existing_hashes', f'SELECT row_hash FROM {table} WHERE row_hash = ANY(%s)'),
+            ([record[-1] for record in records],))
+    existing_hashes = {row[0] for row in cur.fetchall()}
+
+    insert = register(f'{name}_insert', f"INSERT INTO {table} ({', '.join(columns)}) "
+                                        f"VALUES ({', '.join(['%s'] * len(columns))})")
+    for record in records:
+        # Повтор строки внутри одной пачки тоже не вставляем
+        if record[-1] in existing_hashes:
+            continue
+        existing_hashes.add(record[-1])
+
+        # Вставляем новую запись
+        execute(cur, insert, record)
+
+
 def loading_clients(clients_info: List[Tuple[Any, Any, Any, Any, Any, Any, Any, Any, Any, Any]], file_name: str,
                     cur: Any) -> None:
     """Функция загружает информацию по клиентам из списка списков в БД"""
-    for client in clients_info:
-        first_name, last_name, address, phone_number, registration_date, email, deposit_amount, opening_date, \
-        closing_date, interest_rate = client
-
-        # Проверяем уникальность записи перед загрузкой
-        cur.execute("""
-            SELECT id FROM staging.clients
-            WHERE first_name = %s
-            AND last_name = %s
-            AND address = %s
-            AND phone_number = %s
-            AND registration_date = %s
-            AND email = %s
-            AND deposit_amount = %s
-            AND opening_date = %s
-            AND closing_date = %s
-            AND interest_rate = %s""", (first_name, last_name, address, phone_number, registration_date, email,
-                                        deposit_amount, opening_date, closing_date, interest_rate))
-        existing_record = cur.fetchone()
-
-        if existing_record is None:
+    for chunk in chunked(clients_info, CHUNK_SIZE):
+        records = []
+        for client in chunk:
+            first_name, last_name, address, phone_number, registration_date, email, deposit_amount, opening_date, \
+            closing_date, interest_rate = client
             timestamp_column = datetime.now()
 
-            # Вставляем новую запись
-            cur.execute('INSERT INTO staging.clients (first_name, last_name, address, phone_number, registration_date, '
-                        'email, deposit_amount, opening_date, closing_date, interest_rate, file_name, timestamp_column)'
-                        ' VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
-                        (first_name, last_name, address, phone_number, registration_date, email, deposit_amount,
-                         opening_date, closing_date, interest_rate, file_name, timestamp_column))
+            records.append((first_name, last_name, address, phone_number, registration_date, email, deposit_amount,
+                            opening_date, closing_date, interest_rate, file_name, timestamp_column,
+                            row_fingerprint(client, 'staging.clients')))
+
+        insert_new_records(cur, 'staging.clients',
+                           ('first_name', 'last_name', 'address', 'phone_number', 'registration_date', 'email',
+                            'deposit_amount', 'opening_date', 'closing_date', 'interest_rate', 'file_name',
+                            'timestamp_column', 'row_hash'), records)
 
 
 def loading_companies(companies_info: List[Tuple[Any, Any, Any, Any, Any, Any, Any, Any, Any, Any]], file_name: str,
                       cur: Any) -> None:
     """Функция загружает информацию по компаниям из списка списков в БД"""
-    for company in companies_info:
-        name, phone_number, address, registration_date, email, inn, deposit_amount, opening_date, closing_date, \
-        interest_rate = company
-
-        # Проверяем уникальность записи перед загрузкой
-        cur.execute("""
-            SELECT id FROM staging.companies
-            WHERE name = %s
-            AND phone_number = %s
-            AND address = %s
-            AND registration_date = %s
-            AND email = %s
-            AND inn = %s
-            AND deposit_amount = %s
-            AND opening_date = %s
-            AND closing_date = %s
-            AND interest_rate = %s""", (name, phone_number, address, registration_date, email, inn, deposit_amount,
-                                        opening_date, closing_date, interest_rate))
-        existing_record = cur.fetchone()
-
-        if existing_record is None:
+    for chunk in chunked(companies_info, CHUNK_SIZE):
+        records = []
+        for company in chunk:
+            name, phone_number, address, registration_date, email, inn, deposit_amount, opening_date, closing_date, \
+            interest_rate = company
             timestamp_column = datetime.now()
 
-            # Вставляем новую запись
-            cur.execute("""
-                INSERT INTO staging.companies
-                (name, phone_number, address, registration_date, email, inn, deposit_amount, opening_date,
-                closing_date, interest_rate, file_name, timestamp_column)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                        (name, phone_number, address, registration_date, email, inn, deposit_amount,
-                         opening_date, closing_date, interest_rate, file_name, timestamp_column))
+            records.append((name, phone_number, address, registration_date, email, inn, deposit_amount,
+                            opening_date, closing_date, interest_rate, file_name, timestamp_column,
+                            row_fingerprint(company, 'staging.companies')))
+
+        insert_new_records(cur, 'staging.companies',
+                           ('name', 'phone_number', 'address', 'registration_date', 'email', 'inn', 'deposit_amount',
+                            'opening_date', 'closing_date', 'interest_rate', 'file_name', 'timestamp_column',
+                            'row_hash'), records)
 
 
 def loading_bank(bank_info: List[Tuple[str, str, str]], file_name: str, cur: Any) -> None:
     """Функция загружает банковскую информацию в БД"""
-    for bank_data in bank_info:
-        name, address, license_number = bank_data
-
-        # Проверяем уникальность записи перед загрузкой
-        cur.execute("""
-            SELECT id FROM staging.bank
-            WHERE name = %s
-            AND address = %s
-            AND license_number = %s""", (name, address, license_number))
-
-        existing_record = cur.fetchone()
-
-        if existing_record is None:
+    for chunk in chunked(bank_info, CHUNK_SIZE):
+        records = []
+        for bank_data in chunk:
+            name, address, license_number = bank_data
             timestamp_column = datetime.now()
 
-            # Вставляем новую запись
-            cur.execute("""
-                INSERT INTO staging.bank
-                (name, address, license_number,timestamp_column)
-                VALUES (%s, %s, %s, %s)""",
-                        (name, address, license_number, timestamp_column))
+            records.append((name, address, license_number, timestamp_column,
+                            row_fingerprint(bank_data, 'staging.bank')))
+
+        insert_new_records(cur, 'staging.bank',
+                           ('name', 'address', 'license_number', 'timestamp_column', 'row_hash'), records)
 
 
 def loading_capital(capital_info: List, file_name: str, cur: Any) -> None:
     """Функция загружает информацию по капиталу банка на разные даты из списка списков в БД"""
-    for capital_data in capital_info:
-        if len(capital_data) == 3:
-            reserve_fund, equity_capital, accumulated_earnings = capital_data
-            timestamp_column = datetime.now()
-            # Проверяем уникальность записи перед загрузкой
-            cur.execute("""
-                        SELECT id FROM staging.capital
-                        WHERE reserve_fund = %s
-                        AND equity_capital = %s
-                        AND accumulated_earnings = %s
-                        """,
-                        (reserve_fund, equity_capital, accumulated_earnings))
-
-            existing_record = cur.fetchone()
-        elif len(capital_data) == 4:
-            reserve_fund, equity_capital, accumulated_earnings, timestamp_column = capital_data
-            # Проверяем уникальность записи перед загрузкой
-            cur.execute("""
-                        SELECT id FROM staging.capital
-                        WHERE reserve_fund = %s
-                        AND equity_capital = %s
-                        AND accumulated_earnings = %s
-                        AND timestamp_column = %s""",
-                        (reserve_fund, equity_capital, accumulated_earnings, timestamp_column))
-
-            existing_record = cur.fetchone()
-        else:
-            logger.warning("Incorrect number of values in liabilities_data")
-            continue
-
-        if existing_record is None:
-            # Вставляем новую запись
-            cur.execute("""
-                INSERT INTO staging.capital
-                (reserve_fund, equity_capital, accumulated_earnings,file_name, timestamp_column)
-                VALUES (%s, %s, %s, %s, %s)""",
-                        (reserve_fund, equity_capital, accumulated_earnings, file_name, timestamp_column))
+    # Строки без даты в файле получают одно время загрузки, которое входит в отпечаток так же, как дата из файла
+    loaded_at = datetime.now()
+    for chunk in chunked(capital_info, CHUNK_SIZE):
+        records = []
+        for capital_data in chunk:
+            if len(capital_data) == 3:
+                reserve_fund, equity_capital, accumulated_earnings = capital_data
+                timestamp_column = loaded_at
+                row_hash = row_fingerprint((*capital_data, timestamp_column), 'staging.capital')
+            elif len(capital_data) == 4:
+                reserve_fund, equity_capital, accumulated_earnings, timestamp_column = capital_data
+                row_hash = row_fingerprint(capital_data, 'staging.capital')
+            else:
+                logger.warning("Incorrect number of values in liabilities_data")
+                continue
+
+            records.append((reserve_fund, equity_capital, accumulated_earnings, file_name, timestamp_column,
+                            row_hash))
+
+        insert_new_records(cur, 'staging.capital',
+                           ('reserve_fund', 'equity_capital', 'accumulated_earnings', 'file_name',
+                            'timestamp_column', 'row_hash'), records)
 
 
 def loading_liabilities(liabilities_info: List[Tuple[str, str, str, str, str]],
                         file_name: str, cur: Any) -> None:
     """Функция загружает информацию по пассивам банка на разные даты из списка списков в БД"""
-    for liabilities_data in liabilities_info:
-        if len(liabilities_data) == 5:
-            financial_instruments_debts, securities_obligations, reporting_data, invoices_to_pay, \
-            funds_in_accounts = liabilities_data
-            timestamp_column = datetime.now()
-            cur.execute('SELECT id FROM staging.control_liabilities '
-                        'WHERE financial_instruments_debts = %s '
-                        'AND securities_obligations = %s '
-                        'AND reporting_data = %s '
-                        'AND invoices_to_pay = %s '
-                        'AND funds_in_accounts = %s', (financial_instruments_debts, securities_obligations,
-                                                       reporting_data, invoices_to_pay, funds_in_accounts))
-
-            existing_record = cur.fetchone()
-
-        elif len(liabilities_data) == 6:
-            financial_instruments_debts, securities_obligations, reporting_data, invoices_to_pay, \
-            funds_in_accounts, timestamp_column = liabilities_data
-            cur.execute('SELECT id FROM staging.control_liabilities '
-                        'WHERE financial_instruments_debts = %s '
-                        'AND securities_obligations = %s '
-                        'AND reporting_data = %s '
-                        'AND invoices_to_pay = %s '
-                        'AND funds_in_accounts = %s '
-                        'AND timestamp_column = %s', (financial_instruments_debts, securities_obligations,
-                                                      reporting_data, invoices_to_pay, funds_in_accounts,
-                                                      timestamp_column))
-
-            existing_record = cur.fetchone()
-        else:
-            logger.warning("Incorrect number of values in liabilities_data")
-            continue
-
-        if existing_record is None:
-            # Вставляем новую запись
-            cur.execute('INSERT INTO staging.control_liabilities (financial_instruments_debts, securities_obligations,'
-                        ' reporting_data, invoices_to_pay, funds_in_accounts, file_name, timestamp_column)'
-                        ' VALUES (%s, %s, %s, %s, %s, %s, %s)',
-                        (financial_instruments_debts, securities_obligations, reporting_data, invoices_to_pay,
-                         funds_in_accounts, file_name, timestamp_column))
+    # Строки без даты в файле получают одно время загрузки, которое входит в отпечаток так же, как дата из файла
+    loaded_at = datetime.now()
+    for chunk in chunked(liabilities_info, CHUNK_SIZE):
+        records = []
+        for liabilities_data in chunk:
+            if len(liabilities_data) == 5:
+                financial_instruments_debts, securities_obligations, reporting_data, invoices_to_pay, \
+                funds_in_accounts = liabilities_data
+                timestamp_column = loaded_at
+                row_hash = row_fingerprint((*liabilities_data, timestamp_column), 'staging.control_liabilities')
+            elif len(liabilities_data) == 6:
+                financial_instruments_debts, securities_obligations, reporting_data, invoices_to_pay, \
+                funds_in_accounts, timestamp_column = liabilities_data
+                row_hash = row_fingerprint(liabilities_data, 'staging.control_liabilities')
+            else:
+                logger.warning("Incorrect number of values in liabilities_data")
+                continue
+
+            records.append((financial_instruments_debts, securities_obligations, reporting_data, invoices_to_pay,
+                            funds_in_accounts, file_name, timestamp_column, row_hash))
+
+        insert_new_records(cur, 'staging.control_liabilities',
+                           ('financial_instruments_debts', 'securities_obligations', 'reporting_data',
+                            'invoices_to_pay', 'funds_in_accounts', 'file_name', 'timestamp_column', 'row_hash'),
+                           records)
 
 
 def loading_assets(assets_info: List[Tuple[str, str, str, str, str, str, str]],
                    file_name: str, cur: Any) -> None:
     """Функция загружает информацию по активам банка на разные даты из списка списков в БД"""
-    for assets_data in assets_info:
-        if len(assets_data) == 7:
-            securities, real_estate, financial_reports, credit_facilities, machinery, debts, equipment = assets_data
-            timestamp_column = datetime.now()
-            # Проверяем уникальность записи перед загрузкой
-            cur.execute("""
-                        SELECT id FROM staging.general_assets
-                        WHERE securities = %s
-                        AND real_estate = %s
-                        AND financial_reports = %s
-                        AND credit_facilities = %s
-                        AND machinery = %s
-                        AND debts = %s
-                        AND equipment = %s
-                        """, (securities, real_estate, financial_reports, credit_facilities,
-                              machinery, debts, equipment))
-
-            existing_record = cur.fetchone()
-        elif len(assets_data) == 8:
-            securities, real_estate, financial_reports, credit_facilities, machinery, debts, equipment, \
-            timestamp_column = assets_data
-            # Проверяем уникальность записи перед загрузкой
-            cur.execute("""
-                        SELECT id FROM staging.general_assets
-                        WHERE securities = %s
-                        AND real_estate = %s
-                        AND financial_reports = %s
-                        AND credit_facilities = %s
-                        AND machinery = %s
-                        AND debts = %s
-                        AND equipment = %s
-                        AND timestamp_column = %s""", (securities, real_estate, financial_reports, credit_facilities,
-                                                       machinery, debts, equipment, timestamp_column))
-
-            existing_record = cur.fetchone()
+    # Строки без даты в файле получают одно время загрузки, которое входит в отпечаток так же, как дата из файла
+    loaded_at = datetime.now()
+    for chunk in chunked(assets_info, CHUNK_SIZE):
+        records = []
+        for assets_data in chunk:
+            if len(assets_data) == 7:
+                securities, real_estate, financial_reports, credit_facilities, machinery, debts, \
+                equipment = assets_data
+                timestamp_column = loaded_at
+                row_hash = row_fingerprint((*assets_data, timestamp_column), 'staging.general_assets')
+            elif len(assets_data) == 8:
+                securities, real_estate, financial_reports, credit_facilities, machinery, debts, equipment, \
+                timestamp_column = assets_data
+                row_hash = row_fingerprint(assets_data, 'staging.general_assets')
+            else:
+                logger.warning("Incorrect number of values in assets_data")
+                continue
+
+            records.append((securities, real_estate, financial_reports, credit_facilities, machinery, debts,
+                            equipment, file_name, timestamp_column, row_hash))
+
+        insert_new_records(cur, 'staging.general_assets',
+                           ('securities', 'real_estate', 'financial_reports', 'credit_facilities', 'machinery',
+                            'debts', 'equipment', 'file_name', 'timestamp_column', 'row_hash'), records)
+
+
+# Описание таблиц слоя staging для потоковой загрузки через COPY: порядок колонок совпадает с порядком в файлах,
+# types - типы колонок для проверки значений, file_name - есть ли в таблице колонка с названием файла,
+# timestamp_in_file - может ли последним значением в строке файла идти timestamp_column
+STAGING_TABLES = {
+    'clients': {
+        'table': 'staging.clients',
+        'columns': ('first_name', 'last_name', 'address', 'phone_number', 'registration_date', 'email',
+                    'deposit_amount', 'opening_date', 'closing_date', 'interest_rate'),
+        'types': ('text', 'text', 'text', 'text', 'date', 'text', 'decimal', 'date', 'date', 'decimal'),
+        'file_name': True,
+        'timestamp_in_file': False,
+        'loading_function': loading_clients,
+    },
+    'companies': {
+        'table': 'staging.companies',
+        'columns': ('name', 'phone_number', 'address', 'registration_date', 'email', 'inn', 'deposit_amount',
+                    'opening_date', 'closing_date', 'interest_rate'),
+        'types': ('text', 'text', 'text', 'date', 'text', 'text', 'decimal', 'date', 'date', 'decimal'),
+        'file_name': True,
+        'timestamp_in_file': False,
+        'loading_function': loading_companies,
+    },
+    'bank': {
+        'table': 'staging.bank',
+        'columns': ('name', 'address', 'license_number'),
+        'types': ('text', 'text', 'text'),
+        'file_name': False,
+        'timestamp_in_file': False,
+        'loading_function': loading_bank,
+    },
+    'capital': {
+        'table': 'staging.capital',
+        'columns': ('reserve_fund', 'equity_capital', 'accumulated_earnings'),
+        'types': ('decimal', 'decimal', 'decimal'),
+        'file_name': True,
+        'timestamp_in_file': True,
+        'loading_function': loading_capital,
+    },
+    'liabilities': {
+        'table': 'staging.control_liabilities',
+        'columns': ('financial_instruments_debts', 'securities_obligations', 'reporting_data', 'invoices_to_pay',
+                    'funds_in_accounts'),
+        'types': ('decimal', 'decimal', 'decimal', 'decimal', 'decimal'),
+        'file_name': True,
+        'timestamp_in_file': True,
+        'loading_function': loading_liabilities,
+    },
+    'assets': {
+        'table': 'staging.general_assets',
+        'columns': ('securities', 'real_estate', 'financial_reports', 'credit_facilities', 'machinery', 'debts',
+                    'equipment'),
+        'types': ('decimal', 'decimal', 'decimal', 'decimal', 'decimal', 'decimal', 'decimal'),
+        'file_name': True,
+        'timestamp_in_file': True,
+        'loading_function': loading_assets,
+    },
+}
+
+
+# Обозначение NULL в данных COPY. Незакавыченное пустое поле CSV по умолчанию читается как NULL, а построчная
+# загрузка сохраняет пустую строку, поэтому NULL передается явным маркером, а пустое поле остается пустой строкой
+COPY_NULL = r'\N'
+
+
+class CopyStream:
+    """Файлоподобный объект для COPY FROM STDIN. Строки CSV формируются по мере того,
+     как psycopg2 вычитывает данные, поэтому файл целиком в памяти не держится. None записывается как COPY_NULL."""
+
+    def __init__(self, rows: Iterable[List[Any]]):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        self._data = ''
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._data) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow([COPY_NULL if value is None else value for value in row])
+            self._data += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+
+        if size < 0:
+            size = len(self._data)
+        chunk, self._data = self._data[:size], self._data[size:]
+        return chunk
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+
+def enrich_rows(rows: Iterable[List[str]], dataset: str, file_name: str,
+                timestamp_column: Optional[datetime]) -> Iterator[List[Any]]:
+    """Функция дополняет строки файла названием файла, временем загрузки и отпечатком строки так же,
+     как это делают функции loading_*, и отбрасывает строки с некорректным количеством значений."""
+    table = STAGING_TABLES[dataset]
+    columns_count = len(table['columns'])
+
+    for row in rows:
+        if len(row) == columns_count:
+            values = list(row) + [timestamp_column]
+            # Время загрузки входит в отпечаток срезов вместо даты из файла, как и в функциях loading_*
+            row_hash = row_fingerprint(values if table['timestamp_in_file'] else row, table['table'])
+        elif table['timestamp_in_file'] and len(row) == columns_count + 1:
+            values = list(row)
+            row_hash = row_fingerprint(row, table['table'])
         else:
-            logger.warning("Incorrect number of values in assets_data")
+            logger.warning(f"Incorrect number of values in {dataset}: {row}")
             continue
 
-        if existing_record is None:
-            # Вставляем новую запись
-            cur.execute("""
-                INSERT INTO staging.general_assets
-                (securities, real_estate, financial_reports, credit_facilities, machinery, debts,
-                 equipment, file_name, timestamp_column)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                        (securities, real_estate, financial_reports, credit_facilities, machinery,
-                         debts, equipment, file_name, timestamp_column))
+        if table['file_name']:
+            values.insert(columns_count, file_name)
+        values.append(row_hash)
+        yield values
+
+
+def deduplication_query(dataset: str, temp_table: str) -> str:
+    """Функция формирует запрос, который одним INSERT ... SELECT переносит из временной таблицы в staging
+     только новые строки. Уникальность проверяется по индексу row_hash."""
+    table = STAGING_TABLES[dataset]
+    columns = list(table['columns'])
+    if table['file_name']:
+        columns.append('file_name')
+
+    # У секционированных таблиц (см. partitions.py) уникального индекса по одному row_hash нет,
+    # поэтому уже загруженные строки отсеиваются условием по индексу row_hash
+    if table['table'] in PARTITIONED_TABLES:
+        duplicates_check = f"""WHERE NOT EXISTS (SELECT 1 FROM {table['table']} s WHERE s.row_hash = t.row_hash)
+        ON CONFLICT DO NOTHING"""
+    else:
+        duplicates_check = 'ON CONFLICT (row_hash) DO NOTHING'
+
+    return f"""
+        INSERT INTO {table['table']} ({', '.join(columns)}, timestamp_column, row_hash)
+        SELECT DISTINCT ON (t.row_hash) {', '.join(f't.{column}' for column in columns)},
+        t.timestamp_column, t.row_hash
+        FROM {temp_table} t
+        {duplicates_check}"""
+
+
+def copy_rows(rows: Iterable[List[str]], dataset: str, file_name: str, cur: Any) -> Tuple[int, int]:
+    """Функция потоково загружает строки через COPY FROM STDIN во временную таблицу, затем одним запросом
+     переносит в таблицу слоя staging только отсутствующие там строки.
+     Возвращает количество добавленных и пропущенных строк."""
+    table = STAGING_TABLES[dataset]
+    temp_table = f"tmp_{dataset}"
+    columns = list(table['columns'])
+    if table['file_name']:
+        columns.append('file_name')
+    columns.extend(['timestamp_column', 'row_hash'])
+
+    # Временная таблица с теми же типами колонок, но без ограничений и значений по умолчанию
+    cur.execute(f"DROP TABLE IF EXISTS {temp_table}")
+    cur.execute(f"CREATE TEMP TABLE {temp_table} AS SELECT {', '.join(columns)} FROM {table['table']} WITH NO DATA")
+
+    # Всем строкам без timestamp_column присваивается одно время загрузки
+    stream = CopyStream(enrich_rows(rows, dataset, file_name, datetime.now()))
+    cur.copy_expert(f"COPY {temp_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                    stream)
+    copied = cur.rowcount
+
+    cur.execute(deduplication_query(dataset, temp_table))
+    inserted = cur.rowcount
+
+    cur.execute(f"DROP TABLE {temp_table}")
+    return inserted, copied - inserted
+
+
+def bulk_loading(path_file: str, dataset: str, cur: Any, manifest: bool = False, workers: int = 1,
+                 chunk_size: Optional[int] = None, validate: bool = False) -> Tuple[int, int]:
+    """Функция загружает файл в таблицу слоя staging через COPY без дубликатов.
+     Возвращает количество добавленных и пропущенных строк."""
+    table = STAGING_TABLES[dataset]
+    file_name = os.path.basename(path_file)
+    # Без журнала загрузки продолжить прерванную загрузку пачками было бы невозможно
+    manifest = manifest or bool(chunk_size)
+
+    byte_offset, line_number = manifest_position(path_file, cur) if manifest else (0, 0)
+    if manifest and fully_loaded(path_file, byte_offset):
+        logger.info(f"Файл {file_name} не изменился с прошлой загрузки")
+        return 0, 0
+
+    totals = [0, 0]
+    if chunk_size:
+        def load_chunk(rows: List[List[str]]) -> None:
+            if validate:
+                rows = validated_rows(rows, dataset, file_name)
+            inserted, skipped = copy_rows(rows, dataset, file_name, cur)
+            totals[0] += inserted
+            totals[1] += skipped
+
+        loading_in_chunks(path_file, byte_offset, line_number, chunk_size, load_chunk, cur, table['columns'],
+                          table['timestamp_in_file'])
+    else:
+        with open_csv(path_file, byte_offset, workers, table['columns'], table['timestamp_in_file'],
+                      line_number) as (reader, tell):
+            rows = validated_rows(reader, dataset, file_name) if validate else reader
+            totals = list(copy_rows(rows, dataset, file_name, cur))
+            if manifest:
+                update_manifest(path_file, tell(), line_number + reader.line_num, cur)
+
+    inserted, skipped = totals
+    logger.info(f"Файл {file_name} загружен в {table['table']} через COPY: добавлено {inserted} строк, "
+                f"пропущено как дубликаты {skipped} строк")
+    return inserted, skipped
+
+
+def validated_rows(rows: Iterable[List[str]], dataset: str, file_name: str) -> Iterator[List[Any]]:
+    """Функция пачками проверяет строки файла до загрузки в БД: количество значений и формат чисел, дат и времени.
+     Дальше передаются строки с типизированными значениями, отклоненные строки с причиной дописываются
+     в файл rejects/<имя файла>.rejects.csv."""
+    table = STAGING_TABLES[dataset]
+    path_rejects = os.path.join(REJECTS_DIR, f"{file_name}.rejects.csv")
+    rejected_count = 0
+
+    for chunk in chunked(rows, CHUNK_SIZE):
+        typed_rows, rejected = validate_batch(chunk, table['types'], table['timestamp_in_file'])
+        write_rejects(path_rejects, rejected)
+        rejected_count += len(rejected)
+        yield from typed_rows
+
+    if rejected_count:
+        logger.warning(f"{file_name}: отклонено строк - {rejected_count}, подробности в {path_rejects}")
+
+
+def validating_loader(dataset: str) -> Callable[[Iterable[List[str]], str, Any], None]:
+    """Функция возвращает функцию загрузки данных, которая передает в loading_* только проверенные строки"""
+    loading_function = STAGING_TABLES[dataset]['loading_function']
+
+    def loader(rows: Iterable[List[str]], file_name: str, cur: Any) -> None:
+        loading_function(validated_rows(rows, dataset, file_name), file_name, cur)
+
+    return loader
+
+
+def loading_dataset(dataset: str, path_file: str, cur: Any, bulk: bool = False, manifest: bool = False,
+                    parse_workers: int = 1, chunk_size: Optional[int] = None, validate: bool = False) -> None:
+    """Функция загружает файл построчно соответствующей функцией loading_* или, при bulk=True, через COPY.
+     При validate=True строки предварительно проверяются, некорректные строки в БД не отправляются."""
+    if bulk:
+        bulk_loading(path_file=path_file, dataset=dataset, cur=cur, manifest=manifest, workers=parse_workers,
+                     chunk_size=chunk_size, validate=validate)
+    else:
+        loading_function = validating_loader(dataset) if validate else STAGING_TABLES[dataset]['loading_function']
+        reading_file(path_file=path_file, loading_function=loading_function, cur=cur,
+                     manifest=manifest, workers=parse_workers, chunk_size=chunk_size,
+                     columns=STAGING_TABLES[dataset]['columns'],
+                     timestamp_in_file=STAGING_TABLES[dataset]['timestamp_in_file'])
+
+
+def loading_dataset_in_connection(dataset: str, path_file: str, connection_params: Dict[str, Any],
+                                  bulk: bool = False, manifest: bool = False, parse_workers: int = 1,
+                                  chunk_size: Optional[int] = None, validate: bool = False) -> Tuple[str, bool, str]:
+    """Функция загружает один файл в собственном подключении и собственной транзакции, чтобы файлы можно было
+     загружать параллельно. Возвращает название данных, признак успешной загрузки и текст ошибки."""
+    conn = psycopg2.connect(**connection_params)
+    try:
+        with conn.cursor() as cur:
+            loading_dataset(dataset, path_file, cur, bulk=bulk, manifest=manifest, parse_workers=parse_workers,
+                            chunk_size=chunk_size, validate=validate)
+        conn.commit()
+        return dataset, True, ''
+    except Exception as e:
+        conn.rollback()
+        logger.exception(f"Ошибка при загрузке {dataset} из {path_file}: %s", e)
+        return dataset, False, str(e)
+    finally:
+        conn.close()
+
+
+def parallel_loading(paths: Dict[str, str], connection_params: Dict[str, Any], workers: int,
+                     bulk: bool = False, manifest: bool = False, parse_workers: int = 1,
+                     chunk_size: Optional[int] = None, validate: bool = False) -> bool:
+    """Функция параллельно загружает файлы в независимые таблицы слоя staging в пуле из workers процессов
+     и выводит в лог сводку по каждому файлу. Возвращает True, если все файлы загружены."""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(loading_dataset_in_connection, dataset, path_file, connection_params, bulk, manifest,
+                                   parse_workers, chunk_size, validate)
+                   for dataset, path_file in paths.items()]
+        results = [future.result() for future in futures]
+
+    for dataset, success, error in results:
+        if success:
+            logger.info(f"{dataset}: загружено")
+        else:
+            logger.error(f"{dataset}: ошибка - {error}")
+
+    failed = [dataset for dataset, success, _ in results if not success]
+    logger.info(f"Параллельная загрузка завершена: успешно {len(results) - len(failed)} из {len(results)}"
+                + (f", с ошибками: {', '.join(failed)}" if failed else ""))
+    return not failed
 
 
 if __name__ == '__main__':
@@ -302,53 +688,128 @@ if __name__ == '__main__':
                              'all - загрузка всех данных в БД.',
                         default='all')
 
+    parser.add_argument('--bulk',
+                        action='store_true',
+                        help='Потоковая загрузка файлов через COPY FROM STDIN вместо построчной вставки.')
+
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help='Загрузка только строк, дописанных в файлы после прошлой загрузки '
+                             '(по журналу etl.load_manifest). Не изменившиеся файлы пропускаются.')
+
+    parser.add_argument('--workers',
+                        type=int,
+                        help='Количество процессов для параллельной загрузки файлов в режиме all. '
+                             'Каждый файл загружается в своем подключении и своей транзакции.',
+                        default=1)
+
+    parser.add_argument('--parse-workers',
+                        type=int,
+                        help='Количество процессов для параллельного разбора одного большого файла '
+                             'по частям (clients.csv, companies.csv).',
+                        default=1)
+
+    parser.add_argument('--chunk-size',
+                        type=int,
+                        help='Загрузка пачками по указанному количеству строк с сохранением после каждой пачки. '
+                             'Прогресс записывается в etl.load_manifest, после сбоя повторный запуск продолжит '
+                             'загрузку с последней сохраненной пачки.',
+                        default=None)
+
+    parser.add_argument('--validate',
+                        action='store_true',
+                        help='Проверка количества значений и формата чисел и дат до загрузки в БД. '
+                             'Некорректные строки с причиной записываются в папку rejects.')
+
     args = parser.parse_args()
 
     # Подключение к базе данных
-    conn = psycopg2.connect(
-        dbname=db_name,
-        user=db_user,
-        password=db_pass,
-        host=db_host
-    )
-    cur = conn.cursor()
-
-    try:
-        if args.loading == 'clients':
-            reading_file(path_file=path_clients, loading_function=loading_clients, cur=cur)
-            logger.info("Загрузка данных клиентов в БД успешно завершена")
-
-        elif args.loading == 'companies':
-            reading_file(path_file=path_companies, loading_function=loading_companies, cur=cur)
-            logger.info("Загрузка данных компаний в БД успешно завершена")
-
-        elif args.loading == 'bank':
-            reading_file(path_file=path_bank, loading_function=loading_bank, cur=cur)
-            logger.info("Загрузка данных о банке в БД успешно завершена")
-
-        elif args.loading == 'capital':
-            reading_file(path_file=path_capital, loading_function=loading_capital, cur=cur)
-            logger.info("Загрузка данных о капитале банка в БД успешно завершена")
-
-        elif args.loading == 'liabilities':
-            reading_file(path_file=path_liabilities, loading_function=loading_liabilities, cur=cur)
-            logger.info("Загрузка данных о пассивах банка в БД успешно завершена")
-
-        elif args.loading == 'assets':
-            reading_file(path_file=path_assets, loading_function=loading_assets, cur=cur)
-            logger.info("Загрузка данных о активах банка в БД успешно завершена")
-
-        elif args.loading == 'all':
-            reading_file(path_file=path_clients, loading_function=loading_clients, cur=cur)
-            reading_file(path_file=path_companies, loading_function=loading_companies, cur=cur)
-            reading_file(path_file=path_bank, loading_function=loading_bank, cur=cur)
-            reading_file(path_file=path_capital, loading_function=loading_capital, cur=cur)
-            reading_file(path_file=path_liabilities, loading_function=loading_liabilities, cur=cur)
-            reading_file(path_file=path_assets, loading_function=loading_assets, cur=cur)
+    connection_params = {
+        'dbname': db_name,
+        'user': db_user,
+        'password': db_pass,
+        'host': db_host,
+    }
+
+    # В параллельном режиме каждый файл загружается в собственном подключении процесса пула
+    if args.loading == 'all' and args.workers > 1:
+        paths = {
+            'clients': path_clients,
+            'companies': path_companies,
+            'bank': path_bank,
+            'capital': path_capital,
+            'liabilities': path_liabilities,
+            'assets': path_assets,
+        }
+        if parallel_loading(paths, connection_params, args.workers, bulk=args.bulk, manifest=args.incremental,
+                            parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                            validate=args.validate):
             logger.info("Загрузка всех данных в БД успешно завершена")
 
-        else:
-            logger.warning("""Вы ввели некорректный параметр. Введите:
+    else:
+        conn = psycopg2.connect(**connection_params)
+        cur = conn.cursor()
+
+        try:
+            if args.loading == 'clients':
+                loading_dataset('clients', path_clients, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                logger.info("Загрузка данных клиентов в БД успешно завершена")
+
+            elif args.loading == 'companies':
+                loading_dataset('companies', path_companies, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                logger.info("Загрузка данных компаний в БД успешно завершена")
+
+            elif args.loading == 'bank':
+                loading_dataset('bank', path_bank, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                logger.info("Загрузка данных о банке в БД успешно завершена")
+
+            elif args.loading == 'capital':
+                loading_dataset('capital', path_capital, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                logger.info("Загрузка данных о капитале банка в БД успешно завершена")
+
+            elif args.loading == 'liabilities':
+                loading_dataset('liabilities', path_liabilities, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                logger.info("Загрузка данных о пассивах банка в БД успешно завершена")
+
+            elif args.loading == 'assets':
+                loading_dataset('assets', path_assets, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                logger.info("Загрузка данных о активах банка в БД успешно завершена")
+
+            elif args.loading == 'all':
+                loading_dataset('clients', path_clients, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                loading_dataset('companies', path_companies, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                loading_dataset('bank', path_bank, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                loading_dataset('capital', path_capital, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                loading_dataset('liabilities', path_liabilities, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                loading_dataset('assets', path_assets, cur, bulk=args.bulk, manifest=args.incremental,
+                                parse_workers=args.parse_workers, chunk_size=args.chunk_size,
+                                validate=args.validate)
+                logger.info("Загрузка всех данных в БД успешно завершена")
+
+            else:
+                logger.warning("""Вы ввели некорректный параметр. Введите:
                   сlients - загрузка данных клиентов.
                   companies - загрузка данных компаний.
                   bank - загрузка информации о банке.'
@@ -357,12 +818,17 @@ if __name__ == '__main__':
                   assets - загрузка данных о активах банка.
                   all - загрузка всех данных в БД.""")
 
-    except Exception as e:
-        logger.exception("Произошла ошибка во время выполнения файла: %s", e)
+        except Exception as e:
+            logger.exception("Произошла ошибка во время выполнения файла: %s", e)
+            # Откатываем изменения, чтобы не сохранить частично загруженные данные
+            conn.rollback()
+
+        else:
+            # Сохраняем изменения
+            conn.commit()
 
-    # Сохраняем изменения
-    conn.commit()
+        log_statistics(logger)
 
-    # Закрываем соединение
-    cur.close()
-    conn.close()
+        # Закрываем соединение
+        cur.close()
+        conn.close()
@@ -0,0 +1,40 @@
+import select
+import time
+from typing import Any, Optional, Set
+
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+
+# Канал уведомлений о новых строках staging (см. sql/006_staging_notify.sql), в уведомлении - имя таблицы
+CHANNEL = 'staging_insert'
+# Максимальное количество новых строк staging, которые переносятся одной транзакцией
+BATCH_SIZE = 1000
+# Время в секундах, в течение которого после первого уведомления собираются остальные
+FLUSH_INTERVAL = 2.0
+
+
+def listen(conn: Any, channel: str = CHANNEL) -> None:
+    """Функция подписывает отдельное соединение на уведомления канала. Уведомления доставляются только
+     между транзакциями, поэтому соединение переводится в режим autocommit."""
+    conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    with conn.cursor() as listen_cur:
+        listen_cur.execute(f'LISTEN {channel}')
+
+
+def wait_for_tables(conn: Any, flush_interval: float = FLUSH_INTERVAL, timeout: Optional[float] = None) -> Set[str]:
+    """Функция ждет первое уведомление о новых строках (не дольше timeout секунд, без timeout - без ограничения),
+     затем еще flush_interval секунд собирает уведомления, пришедшие следом, чтобы перенести их одной пачкой.
+     Возвращает имена таблиц staging, в которые добавлены строки, запросов к таблицам не выполняет."""
+    tables: Set[str] = set()
+    deadline = None
+    while True:
+        wait = timeout if deadline is None else max(deadline - time.monotonic(), 0)
+        if select.select([conn], [], [], wait) == ([], [], []):
+            # Время ожидания вышло
+            return tables
+
+        conn.poll()
+        while conn.notifies:
+            tables.add(conn.notifies.pop(0).payload)
+        if tables and deadline is None:
+            deadline = time.monotonic() + flush_interval
@@ -0,0 +1,246 @@
+import argparse
+import logging
+import os
+import re
+from datetime import date, datetime
+from logging.handlers import RotatingFileHandler
+from typing import Any, List, Optional, Set
+
+import psycopg2
+from dotenv import load_dotenv
+
+from transfer_engine import SNAPSHOT_ENTITIES
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# Количество месяцев вперед, на которые заранее создаются секции
+MONTHS_AHEAD = 3
+
+# Таблицы срезов (капитал, активы, пассивы) всех слоев, которые делятся на месячные секции по timestamp_column
+PARTITIONED_TABLES = {spec[f'{layer}_table']: layer
+                      for spec in SNAPSHOT_ENTITIES.values() for layer in ('staging', 'dds', 'dwh')}
+
+
+def add_months(month: date, count: int) -> date:
+    """Функция возвращает первое число месяца, отстоящего от month на count месяцев"""
+    month_index = month.year * 12 + month.month - 1 + count
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def month_starts(first: date, last: date) -> List[date]:
+    """Функция возвращает первые числа всех месяцев с first по last включительно"""
+    month = first.replace(day=1)
+    months = []
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def is_partitioned(cur: Any, table: str) -> bool:
+    """Функция проверяет, разбита ли таблица на секции"""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def default_months(cur: Any, table: str) -> Set[date]:
+    """Функция возвращает месяцы, строки которых попали в секцию по умолчанию, потому что секции их месяца
+     еще не было (например, extend давно не запускался)"""
+    cur.execute('SELECT to_regclass(%s)', (f'{table}_default',))
+    if cur.fetchone()[0] is None:
+        return set()
+    cur.execute(f"SELECT DISTINCT CAST(date_trunc('month', timestamp_column) AS date) FROM {table}_default")
+    return {row[0] for row in cur.fetchall()}
+
+
+def move_from_default(cur: Any, table: str, month: date) -> int:
+    """Функция создает секцию месяца, строки которого лежат в секции по умолчанию. Пока такие строки там есть,
+     PostgreSQL не дает создать секцию, поэтому секция по умолчанию на время отключается, строки месяца
+     переносятся из нее в новую секцию, и секция по умолчанию подключается обратно.
+     Возвращает количество перенесенных строк."""
+    default = f'{table}_default'
+    bounds = (month, add_months(month, 1))
+    cur.execute(f'ALTER TABLE {table} DETACH PARTITION {default}')
+    cur.execute(f"CREATE TABLE {table}_{month:%Y_%m} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", bounds)
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {default}
+            WHERE timestamp_column >= %s AND timestamp_column < %s
+            RETURNING *
+        )
+        INSERT INTO {table} SELECT * FROM moved""", bounds)
+    moved = cur.rowcount
+    cur.execute(f'ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT')
+    logger.info(f"{table}: строки за {month:%Y-%m} перенесены из секции по умолчанию в новую секцию: {moved}")
+    return moved
+
+
+def ensure_partitions(cur: Any, table: str, until: date, since: Optional[date] = None) -> int:
+    """Функция создает недостающие месячные секции таблицы с месяца since (по умолчанию - текущего) по until.
+     Если строки месяца уже попали в секцию по умолчанию, они переносятся в созданную секцию.
+     Возвращает количество проверенных месяцев."""
+    months = month_starts(since or date.today(), until)
+    stray_months = default_months(cur, table)
+    for month in months:
+        if month in stray_months:
+            move_from_default(cur, table, month)
+        else:
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} PARTITION OF {table} "
+                        f"FOR VALUES FROM (%s) TO (%s)", (month, add_months(month, 1)))
+    return len(months)
+
+
+def create_indexes(cur: Any, table: str) -> None:
+    """Функция создает индексы секционированной таблицы, PostgreSQL создает их и в каждой секции.
+     Все индексы - по самой колонке timestamp_column, без приведения к дате, поэтому запросы по диапазону
+     времени используют и индексы, и отсечение секций."""
+    layer = PARTITIONED_TABLES[table]
+    name = table.split('.')[1]
+    cur.execute(f'CREATE INDEX IF NOT EXISTS {name}_timestamp_column_idx ON {table} (timestamp_column)')
+    if layer == 'staging':
+        # Уникальный индекс секционированной таблицы обязан включать timestamp_column, а отпечаток строки
+        # staging может совпадать у строк, загруженных в разное время, поэтому дубликаты ищутся по обычному индексу
+        cur.execute(f'CREATE INDEX IF NOT EXISTS {name}_row_hash_idx ON {table} (row_hash)')
+        # Индекс для выбора последней строки за день в режимах history_* (DISTINCT ON по дате)
+        cur.execute(f'CREATE INDEX IF NOT EXISTS {name}_day_timestamp_idx '
+                    f'ON {table} (CAST(timestamp_column AS date), timestamp_column DESC)')
+    elif layer == 'dwh':
+        # Естественный ключ среза для слияния при переносе из dds (см. sql/007_dwh_natural_keys.sql)
+        cur.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {name}_bank_timestamp_uidx '
+                    f'ON {table} (bank_id, timestamp_column)')
+
+
+def migrate_table(cur: Any, table: str, months_ahead: int = MONTHS_AHEAD) -> int:
+    """Функция заменяет обычную таблицу секционированной по месяцам с теми же колонками: создает секции
+     на все месяцы существующих данных и months_ahead месяцев вперед, секцию по умолчанию для остальных строк,
+     переносит данные, последовательность id, внешние ключи и триггеры, затем удаляет старую таблицу.
+     Возвращает количество перенесенных строк."""
+    if is_partitioned(cur, table):
+        logger.info(f"{table} уже разбита на секции")
+        return 0
+
+    schema, name = table.split('.')
+    old_table = f'{schema}.{name}_unpartitioned'
+    cur.execute(f'SELECT MIN(timestamp_column), MAX(timestamp_column) FROM {table}')
+    first, last = cur.fetchone()
+    today = date.today()
+    first = min(first.date() if isinstance(first, datetime) else first or today, today)
+    last = max(last.date() if isinstance(last, datetime) else last or today, today)
+
+    cur.execute(f'ALTER TABLE {table} RENAME TO {name}_unpartitioned')
+    cur.execute(f'CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+                f'PARTITION BY RANGE (timestamp_column)')
+    # Первичный ключ секционированной таблицы должен включать ключ секционирования
+    cur.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, timestamp_column)')
+    ensure_partitions(cur, table, add_months(last.replace(day=1), months_ahead), first)
+    cur.execute(f'CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT')
+
+    cur.execute(f'INSERT INTO {table} SELECT * FROM {old_table}')
+    moved = cur.rowcount
+
+    # Последовательность id переходит к новой таблице, иначе она удалится вместе со старой
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (old_table,))
+    sequence = cur.fetchone()[0]
+    if sequence:
+        cur.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+
+    # Внешние ключи (например, на банк) переносятся с теми же определениями
+    cur.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = to_regclass(%s) AND contype = 'f'", (old_table,))
+    for constraint_name, definition in cur.fetchall():
+        cur.execute(f'ALTER TABLE {table} ADD CONSTRAINT {constraint_name} {definition}')
+
+    # Пользовательские триггеры (например, уведомления staging_insert из sql/006) создаются на новой таблице
+    cur.execute('SELECT pg_get_triggerdef(oid) FROM pg_trigger '
+                'WHERE tgrelid = to_regclass(%s) AND NOT tgisinternal', (old_table,))
+    for definition, in cur.fetchall():
+        cur.execute(re.sub(r' ON \S+ ', f' ON {table} ', definition, count=1))
+
+    cur.execute(f'DROP TABLE {old_table}')
+    create_indexes(cur, table)
+    logger.info(f"{table} разбита на секции по месяцам, перенесено строк: {moved}")
+    return moved
+
+
+if __name__ == '__main__':
+    # Запись логов в файл
+    file_handler = RotatingFileHandler(os.path.join('logs', 'partitions.log'),
+                                       maxBytes=2*1024*1024,
+                                       backupCount=1)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(file_handler)
+
+    # Вывод логов в консоль
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    logger.addHandler(console_handler)
+
+    # Использование переменных окружения
+    load_dotenv()
+
+    db_name = os.getenv("DB_NAME")
+    db_host = os.getenv("DB_HOST")
+    db_user = os.getenv("DB_USER")
+    db_pass = os.getenv("DB_PASS")
+
+    # Использование парсера
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action',
+                        nargs='?',
+                        help='migrate - перевод таблиц на секции по месяцам с переносом данных. '
+                             'extend - создание секций на следующие месяцы (запускать раз в месяц).',
+                        default='extend')
+
+    parser.add_argument('table',
+                        nargs='?',
+                        help='Таблица, например staging.capital. all - все таблицы капитала, активов и пассивов.',
+                        default='all')
+
+    parser.add_argument('--months-ahead',
+                        type=int,
+                        help='На сколько месяцев вперед создавать секции.',
+                        default=MONTHS_AHEAD)
+
+    args = parser.parse_args()
+    tables = list(PARTITIONED_TABLES) if args.table == 'all' else [args.table]
+
+    # Подключение к базе данных
+    conn = psycopg2.connect(
+        dbname=db_name,
+        user=db_user,
+        password=db_pass,
+        host=db_host
+    )
+    cur = conn.cursor()
+
+    try:
+        if any(table not in PARTITIONED_TABLES for table in tables):
+            logger.warning(f"Вы ввели некорректный параметр. Введите all или одну из таблиц: "
+                           f"{', '.join(PARTITIONED_TABLES)}")
+        elif args.action == 'migrate':
+            for table in tables:
+                migrate_table(cur, table, args.months_ahead)
+        elif args.action == 'extend':
+            until = add_months(date.today().replace(day=1), args.months_ahead)
+            for table in tables:
+                ensure_partitions(cur, table, until)
+            logger.info(f"Секции созданы по {until:%Y-%m}")
+        else:
+            logger.warning("Вы ввели некорректный параметр. Введите migrate или extend")
+
+    except Exception as e:
+        logger.exception("Произошла ошибка во время выполнения файла: %s", e)
+        # Откатываем изменения, чтобы не сохранить частично перенесенные таблицы
+        conn.rollback()
+
+    else:
+        # Сохраняем изменения
+        conn.commit()
+
+    # Закрываем соединение
+    cur.close()
+    conn.close()
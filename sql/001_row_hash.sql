@@ -0,0 +1,29 @@
+-- Отпечаток строки (md5 по бизнес-полям, см. fingerprint.py) вместо сравнения всех колонок.
+-- После применения заполнить row_hash у уже загруженных строк: python fingerprint.py
+
+ALTER TABLE staging.clients ADD COLUMN IF NOT EXISTS row_hash char(32);
+ALTER TABLE staging.companies ADD COLUMN IF NOT EXISTS row_hash char(32);
+ALTER TABLE staging.bank ADD COLUMN IF NOT EXISTS row_hash char(32);
+ALTER TABLE staging.capital ADD COLUMN IF NOT EXISTS row_hash char(32);
+ALTER TABLE staging.control_liabilities ADD COLUMN IF NOT EXISTS row_hash char(32);
+ALTER TABLE staging.general_assets ADD COLUMN IF NOT EXISTS row_hash char(32);
+
+CREATE UNIQUE INDEX IF NOT EXISTS clients_row_hash_uidx ON staging.clients (row_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS companies_row_hash_uidx ON staging.companies (row_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS bank_row_hash_uidx ON staging.bank (row_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS capital_row_hash_uidx ON staging.capital (row_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS control_liabilities_row_hash_uidx ON staging.control_liabilities (row_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS general_assets_row_hash_uidx ON staging.general_assets (row_hash);
+
+-- На слое dds отпечаток только переносится дальше в dwh, дубликаты на dds допустимы (загрузка на дату)
+ALTER TABLE dds.capital ADD COLUMN IF NOT EXISTS row_hash char(32);
+ALTER TABLE dds.control_liabilities ADD COLUMN IF NOT EXISTS row_hash char(32);
+ALTER TABLE dds.general_assets ADD COLUMN IF NOT EXISTS row_hash char(32);
+
+ALTER TABLE dwh.capital ADD COLUMN IF NOT EXISTS row_hash char(32);
+ALTER TABLE dwh.control_liabilities ADD COLUMN IF NOT EXISTS row_hash char(32);
+ALTER TABLE dwh.general_assets ADD COLUMN IF NOT EXISTS row_hash char(32);
+
+CREATE UNIQUE INDEX IF NOT EXISTS capital_row_hash_uidx ON dwh.capital (row_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS control_liabilities_row_hash_uidx ON dwh.control_liabilities (row_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS general_assets_row_hash_uidx ON dwh.general_assets (row_hash);
@@ -0,0 +1,13 @@
+-- Журнал загрузки файлов: до какого места (байт и строка) каждый файл уже загружен в staging.
+-- Используется при запуске loading_from_file.py с флагом --incremental.
+
+CREATE SCHEMA IF NOT EXISTS etl;
+
+CREATE TABLE IF NOT EXISTS etl.load_manifest (
+    file_path text PRIMARY KEY,
+    file_size bigint NOT NULL,
+    checksum char(64) NOT NULL,
+    byte_offset bigint NOT NULL,
+    line_number bigint NOT NULL,
+    timestamp_column timestamp NOT NULL
+);
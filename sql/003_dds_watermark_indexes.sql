@@ -0,0 +1,8 @@
+-- Индексы для переноса staging -> dds: новые строки выбираются по timestamp_column прямо в БД,
+-- поэтому время выборки зависит от количества новых строк, а не от размера всей истории staging.
+
+CREATE INDEX IF NOT EXISTS clients_timestamp_column_idx ON staging.clients (timestamp_column);
+CREATE INDEX IF NOT EXISTS companies_timestamp_column_idx ON staging.companies (timestamp_column);
+
+CREATE INDEX IF NOT EXISTS deposits_clients_timestamp_column_idx ON dds.deposits_clients (timestamp_column);
+CREATE INDEX IF NOT EXISTS deposits_companies_timestamp_column_idx ON dds.deposits_companies (timestamp_column);
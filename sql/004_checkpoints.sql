@@ -0,0 +1,14 @@
+-- Контрольные точки переноса данных между слоями: для каждого этапа (dds, dwh) и сущности хранится id и время
+-- последней перенесенной строки источника. Точка обновляется в той же транзакции, что и данные,
+-- поэтому повторный запуск после сбоя продолжает ровно с того же места.
+
+CREATE SCHEMA IF NOT EXISTS etl;
+
+CREATE TABLE IF NOT EXISTS etl.checkpoints (
+    stage varchar(20) NOT NULL,
+    entity varchar(50) NOT NULL,
+    last_id bigint NOT NULL DEFAULT 0,
+    last_timestamp timestamp NULL,
+    timestamp_column timestamp NOT NULL,
+    CONSTRAINT checkpoints_pkey PRIMARY KEY (stage, entity)
+);
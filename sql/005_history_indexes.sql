@@ -0,0 +1,9 @@
+-- Индексы для режима history_* в add_to_dds.py: последняя строка за каждый день выбирается через DISTINCT ON
+-- по дате, а диапазон дат ограничивается условием по timestamp_column.
+
+CREATE INDEX IF NOT EXISTS capital_day_timestamp_idx
+    ON staging.capital (CAST(timestamp_column AS date), timestamp_column DESC);
+CREATE INDEX IF NOT EXISTS general_assets_day_timestamp_idx
+    ON staging.general_assets (CAST(timestamp_column AS date), timestamp_column DESC);
+CREATE INDEX IF NOT EXISTS control_liabilities_day_timestamp_idx
+    ON staging.control_liabilities (CAST(timestamp_column AS date), timestamp_column DESC);
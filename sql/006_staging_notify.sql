@@ -0,0 +1,36 @@
+-- Уведомления о новых строках staging для непрерывного режима add_to_dds.py listen: после каждой вставки
+-- (в том числе COPY) в канал staging_insert отправляется имя таблицы. Триггер срабатывает один раз на оператор,
+-- а одинаковые уведомления одной транзакции PostgreSQL объединяет, поэтому загрузка файла дает одно уведомление.
+
+CREATE SCHEMA IF NOT EXISTS etl;
+
+CREATE OR REPLACE FUNCTION etl.notify_staging_insert() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('staging_insert', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS clients_notify ON staging.clients;
+CREATE TRIGGER clients_notify AFTER INSERT ON staging.clients
+    FOR EACH STATEMENT EXECUTE FUNCTION etl.notify_staging_insert();
+
+DROP TRIGGER IF EXISTS companies_notify ON staging.companies;
+CREATE TRIGGER companies_notify AFTER INSERT ON staging.companies
+    FOR EACH STATEMENT EXECUTE FUNCTION etl.notify_staging_insert();
+
+DROP TRIGGER IF EXISTS bank_notify ON staging.bank;
+CREATE TRIGGER bank_notify AFTER INSERT ON staging.bank
+    FOR EACH STATEMENT EXECUTE FUNCTION etl.notify_staging_insert();
+
+DROP TRIGGER IF EXISTS capital_notify ON staging.capital;
+CREATE TRIGGER capital_notify AFTER INSERT ON staging.capital
+    FOR EACH STATEMENT EXECUTE FUNCTION etl.notify_staging_insert();
+
+DROP TRIGGER IF EXISTS general_assets_notify ON staging.general_assets;
+CREATE TRIGGER general_assets_notify AFTER INSERT ON staging.general_assets
+    FOR EACH STATEMENT EXECUTE FUNCTION etl.notify_staging_insert();
+
+DROP TRIGGER IF EXISTS control_liabilities_notify ON staging.control_liabilities;
+CREATE TRIGGER control_liabilities_notify AFTER INSERT ON staging.control_liabilities
+    FOR EACH STATEMENT EXECUTE FUNCTION etl.notify_staging_insert();
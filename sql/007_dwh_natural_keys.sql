@@ -0,0 +1,22 @@
+-- Естественный ключ срезов слоя dwh: банк и время среза. Перенос из dds выполняется через
+-- INSERT ... ON CONFLICT (bank_id, timestamp_column) DO UPDATE - исправленный в dds срез обновляет строку dwh,
+-- а не добавляет вторую. Ключ включает timestamp_column, поэтому подходит и для секционированных таблиц.
+
+-- Перед созданием ключа из повторов на одно время у банка остается последняя добавленная строка
+DELETE FROM dwh.capital a USING dwh.capital b
+WHERE a.bank_id = b.bank_id AND a.timestamp_column = b.timestamp_column AND a.id < b.id;
+DELETE FROM dwh.general_assets a USING dwh.general_assets b
+WHERE a.bank_id = b.bank_id AND a.timestamp_column = b.timestamp_column AND a.id < b.id;
+DELETE FROM dwh.control_liabilities a USING dwh.control_liabilities b
+WHERE a.bank_id = b.bank_id AND a.timestamp_column = b.timestamp_column AND a.id < b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS capital_bank_timestamp_uidx ON dwh.capital (bank_id, timestamp_column);
+CREATE UNIQUE INDEX IF NOT EXISTS general_assets_bank_timestamp_uidx
+    ON dwh.general_assets (bank_id, timestamp_column);
+CREATE UNIQUE INDEX IF NOT EXISTS control_liabilities_bank_timestamp_uidx
+    ON dwh.control_liabilities (bank_id, timestamp_column);
+
+-- Отпечаток строки в dwh теперь только признак изменения среза, уникальным он быть не должен
+DROP INDEX IF EXISTS dwh.capital_row_hash_uidx;
+DROP INDEX IF EXISTS dwh.general_assets_row_hash_uidx;
+DROP INDEX IF EXISTS dwh.control_liabilities_row_hash_uidx;
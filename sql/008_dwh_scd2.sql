@@ -0,0 +1,40 @@
+-- История изменений справочников dwh.clients и dwh.companies (SCD Type 2). Каждая строка - версия клиента
+-- (компании), действовавшая с valid_from по valid_to, у текущей версии valid_to пустой. attributes_hash - отпечаток
+-- отслеживаемых полей: при загрузке новая версия открывается, только если он изменился (см. transfer_engine.py).
+
+ALTER TABLE dwh.clients ADD COLUMN IF NOT EXISTS valid_from timestamp NULL;
+ALTER TABLE dwh.clients ADD COLUMN IF NOT EXISTS valid_to timestamp NULL;
+ALTER TABLE dwh.clients ADD COLUMN IF NOT EXISTS attributes_hash char(32) NULL;
+ALTER TABLE dwh.companies ADD COLUMN IF NOT EXISTS valid_from timestamp NULL;
+ALTER TABLE dwh.companies ADD COLUMN IF NOT EXISTS valid_to timestamp NULL;
+ALTER TABLE dwh.companies ADD COLUMN IF NOT EXISTS attributes_hash char(32) NULL;
+
+-- Уже загруженные строки становятся версиями, действующими с момента загрузки
+UPDATE dwh.clients SET valid_from = timestamp_column,
+                       attributes_hash = md5(ROW(address, phone_number)::text)
+WHERE valid_from IS NULL;
+UPDATE dwh.companies SET valid_from = timestamp_column,
+                         attributes_hash = md5(ROW(name, phone_number, address, registration_date, email)::text)
+WHERE valid_from IS NULL;
+
+-- Из нескольких строк одного клиента (компании) текущей остается последняя, остальные закрываются
+-- моментом начала следующей версии
+UPDATE dwh.clients c SET valid_to = v.next_valid_from
+FROM (
+    SELECT client_id, LEAD(valid_from) OVER (PARTITION BY first_name, last_name, registration_date, email
+                                             ORDER BY valid_from, client_id) AS next_valid_from
+    FROM dwh.clients
+) v
+WHERE c.client_id = v.client_id AND v.next_valid_from IS NOT NULL AND c.valid_to IS NULL;
+UPDATE dwh.companies c SET valid_to = v.next_valid_from
+FROM (
+    SELECT company_id, LEAD(valid_from) OVER (PARTITION BY inn ORDER BY valid_from, company_id) AS next_valid_from
+    FROM dwh.companies
+) v
+WHERE c.company_id = v.company_id AND v.next_valid_from IS NOT NULL AND c.valid_to IS NULL;
+
+-- Поиск текущей версии по натуральному ключу. Индекс не уникальный: закрытие старой и открытие новой версии
+-- выполняются одним запросом, и порядок этих изменений внутри запроса не определен
+CREATE INDEX IF NOT EXISTS clients_current_version_idx
+    ON dwh.clients (first_name, last_name, registration_date, email) WHERE valid_to IS NULL;
+CREATE INDEX IF NOT EXISTS companies_current_version_idx ON dwh.companies (inn) WHERE valid_to IS NULL;
@@ -0,0 +1,54 @@
+import logging
+import re
+import time
+from typing import Any, Dict, List, Sequence
+from weakref import WeakKeyDictionary
+
+
+# Зарегистрированные запросы: имя - текст запроса с параметрами %s
+STATEMENTS: Dict[str, str] = {}
+# Имена запросов, уже подготовленных на сервере, для каждого подключения
+prepared_statements: 'WeakKeyDictionary[Any, set]' = WeakKeyDictionary()
+# Статистика выполнения: имя - [количество вызовов, суммарное время в секундах]
+statistics: Dict[str, List[float]] = {}
+
+
+def register(name: str, sql: str) -> str:
+    """Функция регистрирует запрос под именем, по которому он выполняется функцией execute.
+     Возвращает имя запроса."""
+    STATEMENTS[name] = sql
+    return name
+
+
+def to_positional(sql: str) -> str:
+    """Функция заменяет параметры %s на нумерованные параметры PREPARE ($1, $2, ...)"""
+    numbers = iter(range(1, sql.count('%s') + 1))
+    return re.sub(r'%[s%]', lambda match: f'${next(numbers)}' if match.group() == '%s' else '%', sql)
+
+
+def execute(cur: Any, name: str, params: Sequence[Any] = ()) -> None:
+    """Функция выполняет зарегистрированный запрос как подготовленный: при первом вызове в подключении запрос
+     один раз разбирается и планируется на сервере (PREPARE), следующие вызовы передают только значения
+     параметров (EXECUTE). Значения передаются параметрами, а не подставляются в текст запроса.
+     Количество вызовов и время выполнения запроса накапливаются в statistics."""
+    start = time.perf_counter()
+    connection_statements = prepared_statements.setdefault(cur.connection, set())
+    if name not in connection_statements:
+        cur.execute(f'PREPARE {name} AS {to_positional(STATEMENTS[name])}')
+        connection_statements.add(name)
+
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", tuple(params))
+    else:
+        cur.execute(f'EXECUTE {name}')
+
+    calls = statistics.setdefault(name, [0, 0.0])
+    calls[0] += 1
+    calls[1] += time.perf_counter() - start
+
+
+def log_statistics(logger: logging.Logger) -> None:
+    """Функция выводит в лог количество вызовов и время выполнения каждого подготовленного запроса"""
+    for name, (calls, seconds) in sorted(statistics.items(), key=lambda item: -item[1][1]):
+        logger.info(f"Запрос {name}: вызовов {calls}, время {seconds:.3f} с, "
+                    f"в среднем {seconds / calls * 1000:.2f} мс")
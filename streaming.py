@@ -0,0 +1,56 @@
+import sys
+from itertools import count
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:
+    # Модуля resource нет в Windows, пиковая память там не выводится
+    resource = None
+
+
+# Количество строк, которые за один раз передаются с сервера при потоковом чтении
+ITERSIZE = 10000
+
+# Номера для имен серверных курсоров, имя должно быть уникальным в рамках соединения
+cursor_numbers = count(1)
+
+
+def stream_rows(cur: Any, query: str, params: Optional[Sequence[Any]] = None,
+                itersize: int = ITERSIZE) -> Iterator[Tuple[Any, ...]]:
+    """Функция читает результат запроса через именованный (серверный) курсор в соединении курсора cur.
+     Строки передаются с сервера пачками по itersize, поэтому в памяти не находится вся таблица целиком.
+     Курсор работает в текущей транзакции, записывать данные через cur во время чтения можно."""
+    with cur.connection.cursor(name=f"stream_{next(cursor_numbers)}") as stream:
+        stream.itersize = itersize
+        stream.execute(query, params)
+        yield from stream
+
+
+def stream_chunks(cur: Any, query: str, params: Optional[Sequence[Any]] = None,
+                  itersize: int = ITERSIZE) -> Iterator[List[Tuple[Any, ...]]]:
+    """Функция читает результат запроса через именованный курсор пачками по itersize строк,
+     для обработки, которой нужна вся пачка сразу (например, добавление пачки одним запросом)"""
+    with cur.connection.cursor(name=f"stream_{next(cursor_numbers)}") as stream:
+        stream.execute(query, params)
+        while True:
+            rows = stream.fetchmany(itersize)
+            if not rows:
+                break
+            yield rows
+
+
+def peak_memory_mb() -> Optional[float]:
+    """Функция возвращает пиковое потребление памяти процессом в мегабайтах"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в Linux - в килобайтах
+    return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+
+def log_peak_memory(logger: Any) -> None:
+    """Функция записывает в лог пиковое потребление памяти процессом"""
+    peak_memory = peak_memory_mb()
+    if peak_memory is not None:
+        logger.info(f"Пиковое потребление памяти: {peak_memory:.1f} МБ")
@@ -0,0 +1,198 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+import add_to_dds
+
+
+def test_add_clients_set_based(monkeypatch):
+    """Тест для проверки функции add_clients. Перенос клиентов и депозитов выполняется одним запросом
+     в БД по id строк staging после контрольной точки, строки staging в Python не выгружаются,
+     контрольная точка сохраняется в той же транзакции."""
+    cur = MagicMock()
+    monkeypatch.setattr(add_to_dds, 'cur', cur, raising=False)
+    # Контрольной точки нет, она вычисляется по уже загруженным данным, затем ищутся новые строки staging
+    cur.fetchone.side_effect = [None, (5, datetime(2024, 5, 1)), (9, datetime(2024, 5, 2))]
+
+    add_to_dds.add_clients()
+
+    sql, params = cur.execute.call_args_list[4][0]
+    assert "nextval(pg_get_serial_sequence('dds.clients', 'client_id'))" in sql
+    assert 'WHERE id > %s AND id <= %s' in sql and params == (5, 9)
+    assert 'INSERT INTO dds.clients' in sql and 'INSERT INTO dds.deposits_clients' in sql
+    assert cur.execute.call_args_list[5][0][1][:4] == ('dds', 'clients', 9, datetime(2024, 5, 2))
+    cur.fetchall.assert_not_called()
+
+
+def test_add_clients_without_new_rows(monkeypatch):
+    """Тест для проверки функции add_clients. Если после контрольной точки новых строк нет, перенос
+     не выполняется и контрольная точка не меняется."""
+    cur = MagicMock()
+    monkeypatch.setattr(add_to_dds, 'cur', cur, raising=False)
+    cur.fetchone.side_effect = [(9, datetime(2024, 5, 2)), (None, None)]
+
+    add_to_dds.add_clients()
+
+    assert cur.execute.call_count == 3
+    assert cur.execute.call_args[0] == ('SELECT MAX(id), MAX(timestamp_column) FROM staging.clients WHERE id > %s',
+                                        (9,))
+
+
+def test_add_clients_batch_size(monkeypatch):
+    """Тест для проверки функции add_clients с batch_size. За один вызов переносится не больше batch_size
+     новых строк, функция возвращает количество перенесенных строк."""
+    cur = MagicMock(rowcount=2)
+    monkeypatch.setattr(add_to_dds, 'cur', cur, raising=False)
+    cur.fetchone.side_effect = [(5, datetime(2024, 5, 1)), (7, datetime(2024, 5, 2))]
+
+    assert add_to_dds.add_clients(batch_size=2) == 2
+
+    sql, params = cur.execute.call_args_list[2][0]
+    assert 'ORDER BY id LIMIT %s' in sql and params == (5, 2)
+    assert cur.execute.call_args_list[3][0][1] == (5, 7)
+
+
+def test_process_new_rows(monkeypatch):
+    """Тест для проверки функции process_new_rows. Клиенты переносятся пачками, пока новые строки
+     не закончатся, каждая пачка фиксируется отдельной транзакцией; таблицы без уведомлений не читаются."""
+    cur = MagicMock()
+    monkeypatch.setattr(add_to_dds, 'cur', cur, raising=False)
+    add_clients = MagicMock(side_effect=[2, 2, 1])
+    add_capital = MagicMock()
+    monkeypatch.setattr(add_to_dds, 'add_clients', add_clients)
+    monkeypatch.setattr(add_to_dds, 'add_companies', MagicMock())
+    monkeypatch.setattr(add_to_dds, 'add_capital', add_capital)
+
+    add_to_dds.process_new_rows({'clients'}, batch_size=2)
+
+    assert add_clients.call_count == 3
+    assert cur.connection.commit.call_count == 4
+    add_to_dds.add_companies.assert_not_called()
+    add_capital.assert_not_called()
+
+
+def test_run_micro_batch_keeps_listening_after_error(monkeypatch):
+    """Тест для проверки функции run_micro_batch. Ошибка переноса откатывает транзакцию и не останавливает
+     ожидание уведомлений, таблицы неудачной пачки переносятся повторно со следующими уведомлениями."""
+    cur = MagicMock()
+    monkeypatch.setattr(add_to_dds, 'cur', cur, raising=False)
+    monkeypatch.setattr(add_to_dds, 'listen', MagicMock())
+    monkeypatch.setattr(add_to_dds, 'DimensionKeys', MagicMock())
+    monkeypatch.setattr(add_to_dds, 'dimension_keys', MagicMock(), raising=False)
+    processed = []
+
+    def process_new_rows(tables, batch_size):
+        processed.append(set(tables))
+        if len(processed) == 2:
+            raise RuntimeError('нет банка')
+
+    monkeypatch.setattr(add_to_dds, 'process_new_rows', process_new_rows)
+    monkeypatch.setattr(add_to_dds, 'wait_for_tables',
+                        MagicMock(side_effect=[{'bank'}, {'capital'}, KeyboardInterrupt]))
+
+    add_to_dds.run_micro_batch(MagicMock())
+
+    assert processed[1:] == [{'bank'}, {'bank', 'capital'}]
+    cur.connection.rollback.assert_called_once()
+    add_to_dds.DimensionKeys.assert_called_once_with(cur, 'dds')
+
+
+def test_run_step(monkeypatch):
+    """Тест для проверки функции run_step. Шаг выполняется в подключении процесса и фиксируется
+     своей транзакцией, при ошибке транзакция откатывается и шаг получает статус ошибки."""
+    cur = MagicMock()
+    monkeypatch.setattr(add_to_dds, 'cur', cur, raising=False)
+    monkeypatch.setattr(add_to_dds, 'add_capital', MagicMock())
+    monkeypatch.setattr(add_to_dds, 'add_bank', MagicMock(side_effect=RuntimeError('нет банка')))
+
+    step, success, error, _ = add_to_dds.run_step('capital', {'history': True})
+    assert (step, success, error) == ('capital', True, '')
+    add_to_dds.add_capital.assert_called_once_with(history=True)
+    cur.connection.commit.assert_called_once()
+
+    assert add_to_dds.run_step('bank')[1:3] == (False, 'нет банка')
+    cur.connection.rollback.assert_called_once()
+
+
+def test_init_worker(monkeypatch):
+    """Тест для проверки функции init_worker. Подключение процесса закрывается при его завершении,
+     процессу без настроенных логов добавляется вывод в консоль."""
+    conn = MagicMock()
+    finalize = MagicMock()
+    monkeypatch.setattr(add_to_dds.psycopg2, 'connect', lambda **params: conn)
+    monkeypatch.setattr(add_to_dds, 'Finalize', finalize)
+    monkeypatch.setattr(add_to_dds.logger, 'handlers', [])
+    monkeypatch.setattr(add_to_dds, 'cur', None, raising=False)
+    monkeypatch.setattr(add_to_dds, 'itersize', None, raising=False)
+
+    add_to_dds.init_worker({'dbname': 'test'}, 500)
+
+    assert add_to_dds.cur is conn.cursor.return_value and add_to_dds.itersize == 500
+    finalize.assert_called_once_with(conn, conn.close, exitpriority=10)
+    assert len(add_to_dds.logger.handlers) == 1
+
+
+def test_add_capital_history_backfill(monkeypatch):
+    """Тест для проверки функции add_capital в режиме history с диапазоном дат. Последняя строка за каждый день
+     выбирается одним запросом с DISTINCT ON, строки до контрольной точки загружаются заново,
+     а сама контрольная точка назад не сдвигается."""
+    cur = MagicMock()
+    cur.connection.encoding = 'UTF8'
+    cur.mogrify.side_effect = lambda template, args: repr(tuple(args)).encode()
+    monkeypatch.setattr(add_to_dds, 'cur', cur, raising=False)
+    monkeypatch.setattr(add_to_dds, 'dimension_keys', MagicMock(**{'at.return_value': 1}), raising=False)
+    monkeypatch.setattr(add_to_dds, 'itersize', 100, raising=False)
+    cur.fetchone.side_effect = [(0, datetime(2024, 6, 1))]
+    # Строки staging читаются через серверный курсор
+    stream = cur.connection.cursor.return_value.__enter__.return_value
+    stream.__iter__.return_value = iter([(1, 11111, 7111.30, 1800.50, datetime(2024, 5, 1, 10, 0))])
+
+    add_to_dds.add_capital(history=True, date_from='2024-05-01', date_to='2024-05-02')
+
+    sql, params = stream.execute.call_args[0]
+    assert 'SELECT DISTINCT ON (CAST(timestamp_column AS date)) id, reserve_fund' in sql
+    assert 'FROM staging.capital' in sql and params == ('2024-05-01', '2024-05-02')
+    assert stream.itersize == 100
+    # Перед переносом читаются срезы, уже перенесенные в dds за диапазон
+    sql, params = cur.execute.call_args_list[2][0]
+    assert 'SELECT bank_id, timestamp_column FROM dds.capital' in sql and params == ('2024-05-01', '2024-05-02')
+    assert b'INSERT INTO dds.capital' in cur.execute.call_args_list[3][0][0]
+    assert cur.execute.call_count == 4
+
+
+def test_add_capital_history_backfill_twice(monkeypatch):
+    """Тест для проверки функции add_capital в режиме history с диапазоном дат. При повторной загрузке того же
+     диапазона срезы, уже перенесенные в dds, не добавляются повторно."""
+    cur = MagicMock()
+    cur.connection.encoding = 'UTF8'
+    cur.mogrify.side_effect = lambda template, args: repr(tuple(args)).encode()
+    monkeypatch.setattr(add_to_dds, 'cur', cur, raising=False)
+    monkeypatch.setattr(add_to_dds, 'dimension_keys', MagicMock(**{'at.return_value': 1}), raising=False)
+    monkeypatch.setattr(add_to_dds, 'itersize', 100, raising=False)
+    staging_rows = [(1, 11111, 7111.30, 1800.50, datetime(2024, 5, 1, 10, 0)),
+                    (2, 11112, 7111.30, 1800.50, datetime(2024, 5, 2, 10, 0))]
+    stream = cur.connection.cursor.return_value.__enter__.return_value
+
+    def inserted():
+        # execute_values передает в execute уже собранный запрос в байтах
+        return [args[0][0] for args in cur.execute.call_args_list if isinstance(args[0][0], bytes)]
+
+    # Первый запуск: в dds срезов диапазона нет
+    cur.fetchone.side_effect = [(0, datetime(2024, 6, 1))]
+    cur.fetchall.return_value = []
+    stream.__iter__.return_value = iter(staging_rows)
+    add_to_dds.add_capital(history=True, date_from='2024-05-01', date_to='2024-05-02')
+    assert len(inserted()) == 1 and b'INSERT INTO dds.capital' in inserted()[0]
+    assert b'datetime.datetime(2024, 5, 2, 10, 0)' in inserted()[0]
+
+    # Второй запуск того же диапазона: оба среза уже есть в dds, вставка не выполняется
+    cur.fetchone.side_effect = [(0, datetime(2024, 6, 1))]
+    cur.fetchall.return_value = [(1, row[-1]) for row in staging_rows]
+    stream.__iter__.return_value = iter(staging_rows)
+    add_to_dds.add_capital(history=True, date_from='2024-05-01', date_to='2024-05-02')
+    assert len(inserted()) == 1
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
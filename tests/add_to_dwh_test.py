@@ -0,0 +1,70 @@
+from datetime import date, datetime
+from unittest.mock import MagicMock
+
+import pytest
+import add_to_dwh
+
+
+def test_add_clients_history(monkeypatch):
+    """Тест для проверки функции add_clients. Новые строки dds сливаются с историей dwh.clients одним запросом:
+     изменившиеся клиенты закрывают текущую версию и открывают новую, депозиты получают ключ текущей версии."""
+    cur = MagicMock()
+    monkeypatch.setattr(add_to_dwh, 'cur', cur, raising=False)
+    # Контрольная точка, новые строки dds, количество открытых и закрытых версий и добавленных депозитов
+    cur.fetchone.side_effect = [(5, datetime(2024, 5, 1)), (9, datetime(2024, 5, 2)), (3, 1, 7)]
+
+    add_to_dwh.add_clients()
+
+    sql, params = cur.execute.call_args_list[3][0]
+    assert 'md5(ROW(address, phone_number)::text) AS attributes_hash' in sql
+    assert 'UPDATE dwh.clients c SET valid_to = ch.timestamp_column' in sql
+    assert 'c.attributes_hash IS DISTINCT FROM b.attributes_hash' in sql
+    assert "nextval(pg_get_serial_sequence('dwh.clients', 'client_id'))" in sql
+    assert 'JOIN dds.deposits_clients d ON d.client_id = n.client_id' in sql
+    assert params == (5, 9, 5, 9)
+    assert cur.execute.call_args_list[4][0][1][:4] == ('dwh', 'clients', 9, datetime(2024, 5, 2))
+    assert cur.execute.call_count == 5
+
+
+def test_add_companies_without_new_rows(monkeypatch):
+    """Тест для проверки функции add_companies. Если новых строк в dds нет, перенос не выполняется."""
+    cur = MagicMock()
+    monkeypatch.setattr(add_to_dwh, 'cur', cur, raising=False)
+    cur.fetchone.side_effect = [(9, datetime(2024, 5, 2)), (None, None)]
+
+    add_to_dwh.add_companies()
+
+    assert cur.execute.call_count == 3
+
+
+def test_add_capital_date_range(monkeypatch):
+    """Тест для проверки функции add_capital с диапазоном дат: все даты переносятся одним запросом,
+     возвращается количество перенесенных строк за каждый день."""
+    cur = MagicMock()
+    monkeypatch.setattr(add_to_dwh, 'cur', cur, raising=False)
+    monkeypatch.setattr(add_to_dwh, 'dds_keys', MagicMock(**{'mapping.return_value': {1: 10}}), raising=False)
+    monkeypatch.setattr(add_to_dwh, 'dwh_keys', MagicMock(), raising=False)
+    cur.fetchall.return_value = [(date(2024, 5, 1), 1), (date(2024, 5, 3), 2)]
+
+    counts = add_to_dwh.add_capital(date_from='2024-05-01', date_to='2024-05-03')
+
+    assert counts == {date(2024, 5, 1): 1, date(2024, 5, 3): 2}
+    assert cur.execute.call_args[0] == ('EXECUTE capital_to_dwh_range (%s, %s, %s, %s)',
+                                        ([1], [10], '2024-05-01', '2024-05-03'))
+
+
+def test_range_summary():
+    """Тест для проверки итога загрузки диапазона дат: дни без перенесенных строк выводятся с нулями."""
+    counts = {'capital': {date(2024, 5, 1): 1, date(2024, 5, 3): 2}, 'general_assets': {date(2024, 5, 2): 1}}
+
+    assert add_to_dwh.range_summary(counts, '2024-05-01', '2024-05-03') == [
+        '2024-05-01: capital - 1, general_assets - 0',
+        '2024-05-02: capital - 0, general_assets - 1',
+        '2024-05-03: capital - 2, general_assets - 0',
+        'Всего: capital - 3, general_assets - 1',
+    ]
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+from checkpoints import load_checkpoint, save_checkpoint
+
+from conftest import cur_mock
+
+
+def test_load_checkpoint_bootstrap(cur_mock):
+    """Тест для проверки функции load_checkpoint. Этап и сущность блокируются до чтения точки, поэтому
+     параллельный первый запуск ждет, пока точку сохранит первый. При отсутствии точки она вычисляется
+     по уже загруженным данным."""
+    cur_mock.fetchone.side_effect = [(10, datetime(2024, 5, 1))]
+    assert load_checkpoint(cur_mock, 'dds', 'bank', 'SELECT 1, 2') == (10, datetime(2024, 5, 1))
+    assert cur_mock.execute.call_args_list[0][0] == ('SELECT pg_advisory_xact_lock(hashtext(%s))',
+                                                     ('etl.checkpoints.dds.bank',))
+    assert 'FOR UPDATE' in cur_mock.execute.call_args[0][0]
+
+    cur_mock.fetchone.side_effect = [None, (None, None)]
+    assert load_checkpoint(cur_mock, 'dds', 'bank', 'SELECT MAX(id), MAX(timestamp_column) FROM x') == (0, None)
+    assert cur_mock.execute.call_args[0][0] == 'SELECT MAX(id), MAX(timestamp_column) FROM x'
+
+
+def test_save_checkpoint(cur_mock):
+    """Тест для проверки функции save_checkpoint. Точка добавляется или обновляется одним запросом."""
+    save_checkpoint(cur_mock, 'dwh', 'clients', 42, datetime(2024, 5, 1))
+
+    sql, params = cur_mock.execute.call_args[0]
+    assert 'ON CONFLICT (stage, entity) DO UPDATE' in sql
+    assert params[:4] == ('dwh', 'clients', 42, datetime(2024, 5, 1))
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
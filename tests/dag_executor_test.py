@@ -0,0 +1,65 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from dag_executor import DONE, FAILED, SKIPPED, run_dag
+
+
+DEPENDENCIES = {
+    'clients': (),
+    'bank': (),
+    'capital': ('bank',),
+    'general_assets': ('bank',),
+}
+
+
+def test_run_dag_order_and_parallelism():
+    """Тест для проверки функции run_dag. Шаг запускается только после своих зависимостей,
+     независимые шаги выполняются одновременно."""
+    started = {}
+    finished = {}
+    lock = threading.Lock()
+
+    def run_step(step, seconds):
+        with lock:
+            started[step] = time.monotonic()
+        time.sleep(seconds)
+        with lock:
+            finished[step] = time.monotonic()
+        return step, True, '', seconds
+
+    step_args = {'clients': (0.2,), 'bank': (0.05,), 'capital': (0.05,), 'general_assets': (0.05,)}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        statuses = run_dag(executor, DEPENDENCIES, run_step, step_args)
+
+    assert {status for status, _, _ in statuses.values()} == {DONE}
+    assert started['capital'] >= finished['bank'] and started['general_assets'] >= finished['bank']
+    # Клиенты выполняются одновременно с цепочкой банка
+    assert started['capital'] < finished['clients']
+
+
+def test_run_dag_skips_dependents_of_failed_step():
+    """Тест для проверки функции run_dag. Если шаг завершился ошибкой, зависящие от него шаги пропускаются,
+     независимые шаги выполняются."""
+    def run_step(step):
+        return step, step != 'bank', 'нет подключения' if step == 'bank' else '', 0.0
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        statuses = run_dag(executor, DEPENDENCIES, run_step, {})
+
+    assert statuses['bank'] == (FAILED, 'нет подключения', 0.0)
+    assert statuses['capital'][0] == SKIPPED and statuses['general_assets'][0] == SKIPPED
+    assert statuses['clients'][0] == DONE
+
+
+def test_run_dag_cycle():
+    """Тест для проверки функции run_dag. Циклические зависимости вызывают ошибку, а не зависание."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(ValueError):
+            run_dag(executor, {'a': ('b',), 'b': ('a',)}, lambda step: (step, True, '', 0.0), {})
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
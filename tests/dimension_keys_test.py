@@ -0,0 +1,55 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+from dimension_keys import DimensionKeys
+
+
+def mock_cursor(rows):
+    """Эмуляция курсора, который возвращает строки справочника bank"""
+    cur = MagicMock()
+    cur.fetchall.return_value = rows
+    return cur
+
+
+def test_dimension_keys_bank_at():
+    """Тест для проверки DimensionKeys. Справочник загружается одним запросом, для строки выбирается банк,
+     действовавший на ее момент, новые банки добавляются в кэш без запросов к БД."""
+    cur = mock_cursor([(1, 'Банк', 'ул. Первая', '001', datetime(2024, 1, 1)),
+                       (2, 'Банк', 'ул. Вторая', '001', datetime(2024, 3, 1))])
+    keys = DimensionKeys(cur, 'dds')
+
+    assert keys.at('bank', datetime(2024, 2, 15, 12, 0)) == 1
+    assert keys.at('bank', '2024-03-01') == 2
+    assert keys.at('bank', datetime(2023, 12, 1)) == 1
+    assert keys.get('bank', ('Банк', 'ул. Вторая', '001')) == 2
+
+    keys.add('bank', ('Банк', 'ул. Третья', '001'), 3, '2024-05-01 00:00:00')
+    assert keys.at('bank', datetime(2024, 6, 1)) == 3
+    assert cur.execute.call_count == 1
+
+
+def test_dimension_keys_mapping():
+    """Тест для проверки DimensionKeys.mapping. Ключи банков dds сопоставляются ключам dwh
+     по натуральному ключу, банки без пары в dwh не попадают в соответствие."""
+    dds_keys = DimensionKeys(mock_cursor([(1, 'Банк', 'ул. Первая', '001', datetime(2024, 1, 1)),
+                                          (2, 'Банк', 'ул. Вторая', '001', datetime(2024, 3, 1))]), 'dds')
+    dwh_keys = DimensionKeys(mock_cursor([(10, 'Банк', 'ул. Первая', '001', datetime(2024, 1, 2))]), 'dwh')
+
+    assert dds_keys.mapping(dwh_keys, 'bank') == {1: 10}
+
+
+def test_dimension_keys_only_bank_cached():
+    """Тест для проверки DimensionKeys. Ключи клиентов и компаний не кэшируются и не загружаются из БД:
+     их сопоставляют запросы переноса."""
+    cur = mock_cursor([])
+    keys = DimensionKeys(cur, 'dds')
+
+    with pytest.raises(ValueError):
+        keys.get('clients', ('Алиса', 'Иванова', '2024-01-01', 'alice@example.com'))
+    cur.execute.assert_not_called()
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
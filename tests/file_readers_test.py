@@ -0,0 +1,173 @@
+import bz2
+import csv
+import gzip
+import lzma
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from file_readers import (ColumnarReader, ParallelReader, header_end, is_compressed, parse_byte_range, read_chunks,
+                          split_byte_ranges)
+
+from conftest import path_clients
+
+
+def test_split_byte_ranges(tmp_path):
+    """Тест для проверки функции split_byte_ranges. Части файла начинаются с начала строки и покрывают
+     файл без пропусков."""
+    path_file = tmp_path / 'rows.csv'
+    path_file.write_bytes(b'header\n' + b''.join(f'row {i},\xd0\x90\n'.encode() for i in range(100)))
+
+    ranges = split_byte_ranges(str(path_file), 7, range_size=50)
+    data = path_file.read_bytes()
+
+    assert ranges[0][0] == 7
+    assert ranges[-1][1] == len(data)
+    assert all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:]))
+    assert all(data[start - 1:start] == b'\n' for start, _ in ranges)
+
+
+def test_split_byte_ranges_quoted_newline(tmp_path):
+    """Тест для проверки функции split_byte_ranges и ParallelReader. Граница части не попадает на перевод строки
+     внутри поля в кавычках, разбор по частям совпадает с последовательным чтением. Незакрытая кавычка - ошибка."""
+    path_file = tmp_path / 'bank.csv'
+    path_file.write_text('name,address,license_number\n' +
+                         ''.join(f'Банк {i},"ул. Центральная,\n""д. {i}""",{i}\n' for i in range(50)), encoding='utf-8')
+
+    ranges = split_byte_ranges(str(path_file), header_end(str(path_file)), range_size=40)
+    data = path_file.read_bytes()
+    assert all(data[start:end].count(b'"') % 2 == 0 for start, end in ranges)
+
+    with open(path_file, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader)
+        expected = list(reader)
+    assert list(ParallelReader(str(path_file), workers=2, range_size=40)) == expected
+
+    path_file.write_text('name,address,license_number\nБанк,"ул. Центральная,\nд. 1,1\n', encoding='utf-8')
+    with pytest.raises(ValueError):
+        parse_byte_range(str(path_file), header_end(str(path_file)), path_file.stat().st_size)
+
+
+def test_parallel_reader_same_as_csv_reader(tmp_path):
+    """Тест для проверки ParallelReader. Результат параллельного разбора совпадает с последовательным
+     чтением csv.reader, включая пропуск заголовка и кириллицу."""
+    with open(path_clients, encoding='utf-8') as file:
+        content = file.read()
+    path_file = tmp_path / 'clients.csv'
+    header, rows = content.split('\n', 1)
+    path_file.write_text(header + '\n' + (rows.rstrip('\n') + '\n') * 50, encoding='utf-8')
+
+    with open(path_file, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader)
+        expected = list(reader)
+        expected_line_num = reader.line_num
+
+    parallel_reader = ParallelReader(str(path_file), workers=2, range_size=500)
+    assert list(parallel_reader) == expected
+    assert parallel_reader.line_num == expected_line_num
+    assert parallel_reader.tell() == path_file.stat().st_size
+
+
+def test_read_chunks(tmp_path):
+    """Тест для проверки функции read_chunks. Файл читается пачками, после каждой пачки известно смещение,
+     с которого продолжится загрузка."""
+    path_file = tmp_path / 'capital.csv'
+    path_file.write_text('reserve_fund,equity_capital,accumulated_earnings\n'
+                         '1,2,3\n4,5,6\n7,8,9\n', encoding='utf-8')
+
+    chunks = list(read_chunks(str(path_file), 0, 2))
+    assert [rows for rows, _, _ in chunks] == [[['1', '2', '3'], ['4', '5', '6']], [['7', '8', '9']]]
+    assert [lines_count for _, _, lines_count in chunks] == [3, 1]
+    assert chunks[-1][1] == path_file.stat().st_size
+
+    # Продолжение загрузки после первой пачки
+    assert list(read_chunks(str(path_file), chunks[0][1], 2)) == chunks[1:]
+
+
+def test_read_chunks_quoted_newline(tmp_path):
+    """Тест для проверки функции read_chunks. Запись с переводом строки внутри поля в кавычках не разрывается
+     между пачками, продолжение загрузки начинается с границы записи. Незакрытая кавычка - ошибка."""
+    path_file = tmp_path / 'bank.csv'
+    path_file.write_text('name,address,license_number\n'
+                         'Банк,"ул. Центральная,\nд. 1",1\nДругой банк,"ул. ""Новая""",2\nТретий банк,ул. Лесная,3\n',
+                         encoding='utf-8')
+
+    chunks = list(read_chunks(str(path_file), 0, 1))
+    assert [rows for rows, _, _ in chunks] == [[['Банк', 'ул. Центральная,\nд. 1', '1']],
+                                               [['Другой банк', 'ул. "Новая"', '2']],
+                                               [['Третий банк', 'ул. Лесная', '3']]]
+    assert [lines_count for _, _, lines_count in chunks] == [3, 1, 1]
+    assert list(read_chunks(str(path_file), chunks[0][1], 1)) == chunks[1:]
+
+    path_file.write_text('name,address,license_number\nБанк,"ул. Центральная,\nд. 1,1\n', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(read_chunks(str(path_file), 0, 1))
+
+
+@pytest.mark.parametrize('extension, open_function', [('.gz', gzip.open), ('.bz2', bz2.open), ('.xz', lzma.open),
+                                                     ('.zst', None)])
+def test_read_chunks_compressed(tmp_path, extension, open_function):
+    """Тест для проверки функции read_chunks со сжатыми файлами. Результат совпадает с чтением несжатого файла,
+     смещения считаются по распакованным данным. Поток .zst не поддерживает seek, продолжение чтения с середины
+     файла проверяется и для него."""
+    if extension == '.zst':
+        open_function = pytest.importorskip('zstandard').open
+    content = b'reserve_fund,equity_capital,accumulated_earnings\n1,2,3\n4,5,6\n7,8,9\n'
+    path_plain = tmp_path / 'capital.csv'
+    path_plain.write_bytes(content)
+    path_compressed = tmp_path / f'capital.csv{extension}'
+    with open_function(path_compressed, 'wb') as file:
+        file.write(content)
+
+    assert is_compressed(str(path_compressed)) and not is_compressed(str(path_plain))
+    assert list(read_chunks(str(path_compressed), 0, 2)) == list(read_chunks(str(path_plain), 0, 2))
+    assert list(read_chunks(str(path_compressed), 56, 2)) == list(read_chunks(str(path_plain), 56, 2))
+
+
+def test_header_end_empty_file(tmp_path):
+    """Тест для проверки функции header_end. Пустой файл и файл из одного заголовка не отображаются в память
+     с ошибкой."""
+    path_file = tmp_path / 'empty.csv'
+    path_file.write_bytes(b'')
+    assert header_end(str(path_file)) == 0
+    assert split_byte_ranges(str(path_file), 0) == []
+
+    path_file.write_bytes(b'header')
+    assert header_end(str(path_file)) == 6
+
+
+def test_columnar_reader_parquet(tmp_path):
+    """Тест для проверки ColumnarReader. Колонки Parquet файла читаются в порядке колонок таблицы staging,
+     пустая timestamp_column не передается, загрузку пачками можно продолжить с номера строки."""
+    pyarrow = pytest.importorskip('pyarrow')
+    parquet = pytest.importorskip('pyarrow.parquet')
+    path_file = tmp_path / 'capital.parquet'
+    table = pyarrow.table({
+        'timestamp_column': [datetime(2024, 5, 1, 0, 10), None, None],
+        'accumulated_earnings': [Decimal('1800.50'), Decimal('1822.50'), Decimal('1.00')],
+        'reserve_fund': [Decimal('11111.00'), Decimal('2222.75'), Decimal('3.00')],
+        'equity_capital': [Decimal('7111.30'), Decimal('72222.30'), Decimal('2.00')],
+    })
+    parquet.write_table(table, path_file)
+    columns = ('reserve_fund', 'equity_capital', 'accumulated_earnings')
+
+    reader = ColumnarReader(str(path_file), columns, batch_size=2, timestamp_in_file=True)
+    assert list(reader) == [[Decimal('11111.00'), Decimal('7111.30'), Decimal('1800.50'), datetime(2024, 5, 1, 0, 10)],
+                            [Decimal('2222.75'), Decimal('72222.30'), Decimal('1822.50')],
+                            [Decimal('3.00'), Decimal('2.00'), Decimal('1.00')]]
+    assert reader.line_num == 3
+    assert reader.tell() == path_file.stat().st_size
+
+    chunks = list(ColumnarReader(str(path_file), columns, skip_rows=1).chunks(1))
+    assert [(len(rows), end_offset, lines_count) for rows, end_offset, lines_count in chunks] == \
+           [(1, 0, 1), (1, path_file.stat().st_size, 1)]
+
+    with pytest.raises(ValueError):
+        ColumnarReader(str(path_file), ('reserve_fund', 'interest_rate'))
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
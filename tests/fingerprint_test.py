@@ -0,0 +1,72 @@
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+from fingerprint import backfill_table, normalize_value, row_fingerprint
+
+
+def test_normalize_value_numbers():
+    """Тест для проверки функции normalize_value. Число из файла и то же число из БД приводятся к одному виду."""
+    assert normalize_value('1000.00') == normalize_value(Decimal('1000.00')) == normalize_value(1000.0) == '1000'
+    assert normalize_value('7000.30') == normalize_value(7000.3) == '7000.3'
+
+
+def test_normalize_value_dates():
+    """Тест для проверки функции normalize_value. Даты и время из файла и из БД приводятся к одному виду."""
+    assert normalize_value('2024-05-01 00:00:00.000') == normalize_value(datetime(2024, 5, 1)) == \
+           normalize_value(date(2024, 5, 1)) == '2024-05-01'
+    assert normalize_value('2024-05-01 00:10:00') == normalize_value(datetime(2024, 5, 1, 0, 10)) == \
+           '2024-05-01 00:10:00'
+
+
+def test_row_fingerprint():
+    """Тест для проверки функции row_fingerprint. Отпечаток строки из файла совпадает с отпечатком той же строки,
+     прочитанной из БД, и отличается при изменении любого поля."""
+    from_file = ('Алиса', 'Иванова', ' ул. Центральная', '555-123-4567', '2024-01-01', 'alice@example.com',
+                 '1000.00', '2024-01-01', '2024-12-31', '0.05')
+    from_db = ('Алиса', 'Иванова', 'ул. Центральная', '555-123-4567', date(2024, 1, 1), 'alice@example.com',
+               Decimal('1000.0'), date(2024, 1, 1), date(2024, 12, 31), 0.05)
+
+    assert row_fingerprint(from_file, 'staging.clients') == row_fingerprint(from_db, 'staging.clients')
+    assert row_fingerprint(from_file, 'staging.clients') != row_fingerprint(from_file[:-1] + ('0.06',),
+                                                                            'staging.clients')
+    assert row_fingerprint(('1', '2', ''), 'staging.bank') != row_fingerprint(('12', '', ''), 'staging.bank')
+
+
+@pytest.mark.parametrize('table, first, second', [
+    ('staging.companies', ('ООО Рога', '', '', '', '', '0123456789'), ('ООО Рога', '', '', '', '', '123456789')),
+    ('staging.clients', ('Алиса', 'Иванова', '', '+79001234567'), ('Алиса', 'Иванова', '', '79001234567')),
+    ('staging.bank', ('Банк', 'ул. Центральная', '001.0'), ('Банк', 'ул. Центральная', '1')),
+])
+def test_row_fingerprint_text_columns(table, first, second):
+    """Тест для проверки функции row_fingerprint. Текстовые поля, похожие на числа (ИНН, телефон, номер лицензии),
+     не приводятся к числу, поэтому строки, отличающиеся ведущим нулем или знаком, получают разные отпечатки."""
+    assert normalize_value(' 0123456789 ', text=True) == '0123456789'
+    assert row_fingerprint(first, table) != row_fingerprint(second, table)
+
+
+@pytest.mark.parametrize('unique, updated_ids', [(True, [1]), (False, [1, 2])])
+def test_backfill_table_duplicates(unique, updated_ids):
+    """Тест для проверки функции backfill_table. Повтор строки остается без отпечатка, только если у таблицы
+     есть уникальный индекс по row_hash, иначе отпечаток получают все строки."""
+    conn = MagicMock()
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.connection.encoding = 'UTF8'
+    cur.mogrify.side_effect = lambda template, args: repr(tuple(args)).encode()
+    cur.fetchone.return_value = (unique,)
+    cur.fetchall.return_value = []
+    row = (11111, 7111.30, 1800.50, datetime(2024, 5, 1, 10, 0))
+    cur.fetchmany.side_effect = [[(1, *row), (2, *row)], []]
+
+    backfill_table('dds.capital', conn)
+
+    update = cur.execute.call_args[0][0]
+    assert b'UPDATE dds.capital t SET row_hash' in update
+    row_hash = row_fingerprint(row, 'dds.capital')
+    assert [row_id for row_id in (1, 2) if f"({row_id}, '{row_hash}')".encode() in update] == updated_ids
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
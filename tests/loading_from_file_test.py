@@ -1,10 +1,15 @@
+import gzip
 from datetime import datetime
+from decimal import Decimal
 from typing import Any, List, Tuple
-from unittest.mock import ANY, call
+from unittest.mock import ANY, MagicMock, call
 
 import pytest
-from loading_from_file import (loading_clients, loading_liabilities,
-                               reading_file)
+from fingerprint import row_fingerprint
+import loading_from_file
+from loading_from_file import (CopyStream, bulk_loading, enrich_rows, file_checksum,
+                               loading_clients, loading_dataset_in_connection,
+                               loading_liabilities, reading_file, validated_rows)
 
 from conftest import cur_mock, path_capital, path_clients
 
@@ -79,12 +84,13 @@ def test_reading_file_capital():
 def test_loading_clients_with_mocks(cur_mock):
     """Тест для проверки функции loading_clients. Имитирует подключение к БД
      и проверяет правильность отправки запросов."""
-    # Устанавливаем возвращаемое значение для cur_mock.fetchone
-    cur_mock.fetchone.return_value = None  # Возвращаем None для имитации отсутствия совпадающей записи
+    # Устанавливаем возвращаемое значение для cur_mock.fetchall
+    cur_mock.fetchall.return_value = []  # Возвращаем пустой список для имитации отсутствия совпадающих записей
 
     # Подготовка данных для загрузки
     clients_info = [('John', 'Doe', '123 Main St', '555-1234', '2022-01-01', 'john.doe@example.com', 1000,
                      '2022-01-01', '2023-01-01', 0.05)]
+    row_hash = row_fingerprint(clients_info[0], 'staging.clients')
 
     file_name = 'test_file.csv'
 
@@ -93,38 +99,45 @@ def test_loading_clients_with_mocks(cur_mock):
 
     # Проверяем, что методы были вызваны с правильными аргументами
     cur_mock.execute.assert_called()
-    cur_mock.fetchone.assert_called()
+    cur_mock.fetchall.assert_called()
+    # Запросы подготавливаются один раз на таблицу и выполняются через EXECUTE
     cur_mock.execute.assert_has_calls([
-        call("""
-            SELECT id FROM staging.clients
-            WHERE first_name = %s
-            AND last_name = %s
-            AND address = %s
-            AND phone_number = %s
-            AND registration_date = %s
-            AND email = %s
-            AND deposit_amount = %s
-            AND opening_date = %s
-            AND closing_date = %s
-            AND interest_rate = %s""", ('John', 'Doe', '123 Main St', '555-1234', '2022-01-01', 'john.doe@example.com',
-                                         1000, '2022-01-01', '2023-01-01', 0.05)),
+        call('PREPARE staging_clients_existing_hashes AS '
+             'SELECT row_hash FROM staging.clients WHERE row_hash = ANY($1)'),
+        call('EXECUTE staging_clients_existing_hashes (%s)', ([row_hash],)),
         call(
+            'PREPARE staging_clients_insert AS '
             'INSERT INTO staging.clients (first_name, last_name, address, phone_number, registration_date, '
-            'email, deposit_amount, opening_date, closing_date, interest_rate, file_name, timestamp_column)'
-            ' VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
+            'email, deposit_amount, opening_date, closing_date, interest_rate, file_name, timestamp_column, row_hash)'
+            ' VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)'),
+        call(
+            'EXECUTE staging_clients_insert (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
             ('John', 'Doe', '123 Main St', '555-1234', '2022-01-01', 'john.doe@example.com', 1000, '2022-01-01',
-             '2023-01-01', 0.05, 'test_file.csv', ANY)
+             '2023-01-01', 0.05, 'test_file.csv', ANY, row_hash)
             ),
-    ], any_order=True)
+    ])
     # В случае использования timestamp_column вставляем ANY для проверки любого значения
     cur_mock.close.assert_not_called()  # Проверяем, что метод close не был вызван
 
 
+def test_loading_clients_skips_existing(cur_mock):
+    """Тест для проверки функции loading_clients. Запись, отпечаток которой уже есть в БД, не вставляется."""
+    clients_info = [('John', 'Doe', '123 Main St', '555-1234', '2022-01-01', 'john.doe@example.com', 1000,
+                     '2022-01-01', '2023-01-01', 0.05)]
+    cur_mock.fetchall.return_value = [(row_fingerprint(clients_info[0], 'staging.clients'),)]
+
+    loading_clients(clients_info, 'test_file.csv', cur_mock)
+
+    # Только подготовка и выполнение проверки отпечатков, без вставки
+    assert not any('EXECUTE staging_clients_insert' in args[0][0] for args in cur_mock.execute.call_args_list)
+
+
 def test_loading_liabilities_with_mocks_without_timestamp(cur_mock):
     """Тест для проверки функции loading_liabilities. Имитирует подключение к БД
      и проверяет правильность отправки запросов. Объект без параметра timestamp."""
-    # Устанавливаем возвращаемое значение для cur_mock.fetchone
-    cur_mock.fetchone.return_value = None  # Возвращаем None для имитации отсутствия совпадающей записи чтобы INSERT сработал
+    # Устанавливаем возвращаемое значение для cur_mock.fetchall: пустой список для имитации отсутствия
+    # совпадающей записи, чтобы INSERT сработал
+    cur_mock.fetchall.return_value = []
 
     # Подготовка данных для загрузки без timestamp_column
     liabilities_info = [('9995.90', '9789.01', '17890.12', '8901.23', '19012.34')]
@@ -134,65 +147,303 @@ def test_loading_liabilities_with_mocks_without_timestamp(cur_mock):
     # Вызываем функцию loading_liabilities
     loading_liabilities(liabilities_info, file_name, cur_mock)
 
+    # Время загрузки входит в отпечаток так же, как при заполнении отпечатков из БД (fingerprint.backfill_table)
+    timestamp_column = cur_mock.execute.call_args_list[3][0][1][6]
+    assert isinstance(timestamp_column, datetime)
+    row_hash = row_fingerprint((*liabilities_info[0], timestamp_column), 'staging.control_liabilities')
+    assert row_hash == row_fingerprint((Decimal('9995.90'), Decimal('9789.01'), Decimal('17890.12'),
+                                        Decimal('8901.23'), Decimal('19012.34'), timestamp_column),
+                                       'staging.control_liabilities')
+
     # Проверяем, что методы были вызваны с правильными аргументами
-    cur_mock.execute.assert_called()
-    cur_mock.fetchone.assert_called()
     cur_mock.execute.assert_has_calls([
-        call('SELECT id FROM staging.control_liabilities '
-             'WHERE financial_instruments_debts = %s '
-             'AND securities_obligations = %s '
-             'AND reporting_data = %s '
-             'AND invoices_to_pay = %s '
-             'AND funds_in_accounts = %s', ('9995.90', '9789.01', '17890.12', '8901.23', '19012.34')),
+        call('EXECUTE staging_control_liabilities_existing_hashes (%s)', ([row_hash],)),
         call(
+            'PREPARE staging_control_liabilities_insert AS '
             'INSERT INTO staging.control_liabilities (financial_instruments_debts, securities_obligations,'
-            ' reporting_data, invoices_to_pay, funds_in_accounts, file_name, timestamp_column)'
-            ' VALUES (%s, %s, %s, %s, %s, %s, %s)',
-            ('9995.90', '9789.01', '17890.12', '8901.23', '19012.34', 'test_file.csv', ANY)
+            ' reporting_data, invoices_to_pay, funds_in_accounts, file_name, timestamp_column, row_hash)'
+            ' VALUES ($1, $2, $3, $4, $5, $6, $7, $8)'),
+        call(
+            'EXECUTE staging_control_liabilities_insert (%s, %s, %s, %s, %s, %s, %s, %s)',
+            ('9995.90', '9789.01', '17890.12', '8901.23', '19012.34', 'test_file.csv', timestamp_column, row_hash)
             ),
-    ], any_order=True)
-    # В случае использования timestamp_column вставляем ANY для проверки любого значения
+    ])
     cur_mock.close.assert_not_called()  # Проверяем, что метод close не был вызван
 
 
 def test_loading_liabilities_with_mocks_with_timestamp(cur_mock):
     """Тест для проверки функции loading_liabilities. Имитирует подключение к БД
      и проверяет правильность отправки запросов. Объект с параметром timestamp."""
-    # Устанавливаем возвращаемое значение для cur_mock.fetchone
-    cur_mock.fetchone.return_value = None  # Возвращаем None для имитации отсутствия совпадающей записи чтобы INSERT сработал
+    # Устанавливаем возвращаемое значение для cur_mock.fetchall: пустой список для имитации отсутствия
+    # совпадающей записи, чтобы INSERT сработал
+    cur_mock.fetchall.return_value = []
 
     file_name = 'test_file.csv'
 
     # Подготовка данных для загрузки c timestamp_column
     liabilities_info2 = [('1111.56', '2345.67', '3456.78', '1111.89', '5678.90', '2024-02-10 00:00:00.000')]
+    row_hash = row_fingerprint(liabilities_info2[0], 'staging.control_liabilities')
 
     # Вызываем функцию loading_liabilities
     loading_liabilities(liabilities_info2, file_name, cur_mock)
 
     # Проверяем, что методы были вызваны с правильными аргументами
     cur_mock.execute.assert_called()
-    cur_mock.fetchone.assert_called()
+    cur_mock.fetchall.assert_called()
     cur_mock.execute.assert_has_calls([
-        call('SELECT id FROM staging.control_liabilities '
-             'WHERE financial_instruments_debts = %s '
-             'AND securities_obligations = %s '
-             'AND reporting_data = %s '
-             'AND invoices_to_pay = %s '
-             'AND funds_in_accounts = %s '
-             'AND timestamp_column = %s', ('1111.56', '2345.67',
-                                           '3456.78', '1111.89', '5678.90',
-                                           '2024-02-10 00:00:00.000')),
+        call('EXECUTE staging_control_liabilities_existing_hashes (%s)', ([row_hash],)),
         call(
+            'PREPARE staging_control_liabilities_insert AS '
             'INSERT INTO staging.control_liabilities (financial_instruments_debts, securities_obligations,'
-            ' reporting_data, invoices_to_pay, funds_in_accounts, file_name, timestamp_column)'
-            ' VALUES (%s, %s, %s, %s, %s, %s, %s)',
-            ('1111.56', '2345.67', '3456.78', '1111.89', '5678.90', 'test_file.csv', '2024-02-10 00:00:00.000')
+            ' reporting_data, invoices_to_pay, funds_in_accounts, file_name, timestamp_column, row_hash)'
+            ' VALUES ($1, $2, $3, $4, $5, $6, $7, $8)'),
+        call(
+            'EXECUTE staging_control_liabilities_insert (%s, %s, %s, %s, %s, %s, %s, %s)',
+            ('1111.56', '2345.67', '3456.78', '1111.89', '5678.90', 'test_file.csv', '2024-02-10 00:00:00.000',
+             row_hash)
         ),
     ], any_order=True)
 
     cur_mock.close.assert_not_called()  # Проверяем, что метод close не был вызван
 
 
+def test_reading_file_with_manifest(cur_mock, tmp_path):
+    """Тест для проверки функции reading_file с журналом загрузки. Не изменившийся файл пропускается,
+     из дописанного файла читаются только новые строки."""
+    path_file = tmp_path / 'capital.csv'
+    path_file.write_text('reserve_fund,equity_capital,accumulated_earnings,timestamp_column\n'
+                         '11111,7111.30,1800.50,2024-05-01 00:10:00\n', encoding='utf-8')
+    loaded = []
+
+    def loading_function(rows, file_name, cur):
+        loaded.extend(rows)
+
+    # Первая загрузка - файла нет в журнале
+    cur_mock.fetchone.return_value = None
+    reading_file(str(path_file), loading_function, cur_mock, manifest=True)
+    byte_offset, line_number = cur_mock.execute.call_args[0][1][3:5]
+    assert loaded == [['11111', '7111.30', '1800.50', '2024-05-01 00:10:00']]
+    assert (byte_offset, line_number) == (path_file.stat().st_size, 2)
+
+    # Повторная загрузка не изменившегося файла
+    cur_mock.fetchone.return_value = (byte_offset, line_number, file_checksum(str(path_file), byte_offset))
+    loaded.clear()
+    reading_file(str(path_file), loading_function, cur_mock, manifest=True)
+    assert loaded == []
+
+    # Загрузка дописанного файла
+    with open(path_file, 'a', encoding='utf-8') as file:
+        file.write('2222.75,72222.30,1822.50,2024-06-02 00:20:00\n')
+    reading_file(str(path_file), loading_function, cur_mock, manifest=True)
+    assert loaded == [['2222.75', '72222.30', '1822.50', '2024-06-02 00:20:00']]
+    assert cur_mock.execute.call_args[0][1][3:5] == (path_file.stat().st_size, 3)
+
+
+def test_reading_file_in_chunks(cur_mock, tmp_path):
+    """Тест для проверки функции reading_file в режиме загрузки пачками. После каждой пачки в журнал
+     записывается место, до которого файл загружен, и транзакция сохраняется."""
+    path_file = tmp_path / 'capital.csv'
+    path_file.write_text('reserve_fund,equity_capital,accumulated_earnings\n'
+                         '1,2,3\n4,5,6\n7,8,9\n', encoding='utf-8')
+    chunks = []
+    cur_mock.fetchone.return_value = None
+
+    reading_file(str(path_file), lambda rows, file_name, cur: chunks.append(rows), cur_mock, chunk_size=2)
+
+    assert chunks == [[['1', '2', '3'], ['4', '5', '6']], [['7', '8', '9']]]
+    assert cur_mock.connection.commit.call_count == 2
+    assert cur_mock.execute.call_args[0][1][3:5] == (path_file.stat().st_size, 4)
+
+
+@pytest.mark.parametrize('extension', ['.gz', '.zst'])
+def test_reading_file_compressed_with_manifest(cur_mock, tmp_path, extension):
+    """Тест для проверки функции reading_file со сжатым файлом. Файлы .gz и .zst читаются без распаковки на диск,
+     в журнал записывается смещение в распакованных данных, повторная загрузка продолжается с него."""
+    open_function = pytest.importorskip('zstandard').open if extension == '.zst' else gzip.open
+    content = ('reserve_fund,equity_capital,accumulated_earnings\n'
+               '1,2,3\n4,5,6\n')
+    path_file = tmp_path / f'capital.csv{extension}'
+    with open_function(path_file, 'wt', encoding='utf-8') as file:
+        file.write(content)
+    loaded = []
+
+    def loading_function(rows, file_name, cur):
+        loaded.extend(rows)
+
+    cur_mock.fetchone.return_value = None
+    reading_file(str(path_file), loading_function, cur_mock, manifest=True, workers=2)
+    params = cur_mock.execute.call_args[0][1]
+    assert loaded == [['1', '2', '3'], ['4', '5', '6']]
+    assert params[3:5] == (len(content.encode()), 3)
+
+    # Повторная загрузка того же файла не добавляет строк
+    cur_mock.fetchone.return_value = (params[3], params[4], params[2])
+    loaded.clear()
+    reading_file(str(path_file), loading_function, cur_mock, manifest=True)
+    assert loaded == []
+
+
+def test_reading_file_arrow(tmp_path):
+    """Тест для проверки функции reading_file с файлом Arrow IPC. Значения передаются в функцию загрузки
+     в порядке колонок таблицы staging."""
+    pyarrow = pytest.importorskip('pyarrow')
+    path_file = tmp_path / 'bank.arrow'
+    table = pyarrow.table({'license_number': ['123'], 'address': ['ул. Банковская'], 'name': ['Банк']})
+    with pyarrow.ipc.new_file(path_file, table.schema) as writer:
+        writer.write_table(table)
+    loaded = []
+
+    reading_file(str(path_file), lambda rows, file_name, cur: loaded.extend(rows), MagicMock(),
+                 columns=loading_from_file.STAGING_TABLES['bank']['columns'])
+
+    assert loaded == [['Банк', 'ул. Банковская', '123']]
+
+
+def test_reading_file_parquet_resume(cur_mock, tmp_path):
+    """Тест для проверки функции reading_file с журналом загрузки для файла Parquet. Продолжение загрузки
+     пропускает уже загруженные строки, в журнал записывается номер строки без повторного учета пропущенных."""
+    pyarrow = pytest.importorskip('pyarrow')
+    parquet = pytest.importorskip('pyarrow.parquet')
+    path_file = tmp_path / 'capital.parquet'
+    parquet.write_table(pyarrow.table({'reserve_fund': ['1', '4', '7'], 'equity_capital': ['2', '5', '8'],
+                                       'accumulated_earnings': ['3', '6', '9']}), path_file)
+    loaded = []
+
+    # Прошлая загрузка пачками прервалась после двух строк
+    cur_mock.fetchone.return_value = (0, 2, file_checksum(str(path_file), path_file.stat().st_size))
+    reading_file(str(path_file), lambda rows, file_name, cur: loaded.extend(rows), cur_mock, manifest=True,
+                 columns=loading_from_file.STAGING_TABLES['capital']['columns'])
+
+    assert loaded == [['7', '8', '9']]
+    assert cur_mock.execute.call_args[0][1][3:5] == (path_file.stat().st_size, 3)
+
+
+def test_loading_dataset_clients_parquet(cur_mock, tmp_path):
+    """Тест для проверки загрузки клиентов из Parquet файла с колонкой timestamp_column. Время загрузки клиентов
+     задает скрипт, поэтому колонка файла не читается и в loading_clients передается ровно 10 значений."""
+    pyarrow = pytest.importorskip('pyarrow')
+    parquet = pytest.importorskip('pyarrow.parquet')
+    path_file = tmp_path / 'clients.parquet'
+    columns = loading_from_file.STAGING_TABLES['clients']['columns']
+    values = ['Алиса', 'Иванова', 'ул. Центральная', '555-123-4567', '2024-01-01', 'alice.ivanova@example.com',
+              '1000.00', '2024-01-01', '2024-12-31', '0.05']
+    table = {column: [value] for column, value in zip(columns, values)}
+    table['timestamp_column'] = [datetime(2024, 5, 1, 0, 10)]
+    parquet.write_table(pyarrow.table(table), path_file)
+    cur_mock.fetchall.return_value = []
+
+    loading_from_file.loading_dataset('clients', str(path_file), cur_mock)
+
+    insert_params = cur_mock.execute.call_args[0][1]
+    assert insert_params[:11] == (*values, 'clients.parquet')
+    assert insert_params[11] != datetime(2024, 5, 1, 0, 10)
+
+
+def test_loading_dataset_in_connection(monkeypatch):
+    """Тест для проверки функции loading_dataset_in_connection. При ошибке загрузки транзакция файла
+     откатывается, а ошибка возвращается в сводку, а не прерывает остальные загрузки."""
+    conn_mock = MagicMock()
+    monkeypatch.setattr(loading_from_file.psycopg2, 'connect', lambda **params: conn_mock)
+
+    assert loading_dataset_in_connection('clients', path_clients, {}) == ('clients', True, '')
+    conn_mock.commit.assert_called_once()
+
+    assert loading_dataset_in_connection('clients', 'missing.csv', {})[:2] == ('clients', False)
+    conn_mock.rollback.assert_called_once()
+    assert conn_mock.close.call_count == 2
+
+
+def test_enrich_rows_capital():
+    """Тест для проверки функции enrich_rows. Строки без timestamp_column получают время загрузки, которое входит
+     в отпечаток, строки с некорректным количеством значений отбрасываются."""
+    timestamp_column = datetime(2024, 6, 1, 12, 0, 0)
+    rows = [['11111', '7111.30', '1800.50', '2024-05-01 00:10:00'],
+            ['11111', '7111.30', '1800.50'],
+            ['11111', '7111.30']]
+
+    enriched = list(enrich_rows(rows, 'capital', 'capital_test.csv', timestamp_column))
+
+    assert enriched == [['11111', '7111.30', '1800.50', 'capital_test.csv', '2024-05-01 00:10:00',
+                         row_fingerprint(rows[0], 'staging.capital')],
+                        ['11111', '7111.30', '1800.50', 'capital_test.csv', timestamp_column,
+                         row_fingerprint((*rows[1], timestamp_column), 'staging.capital')]]
+
+
+def test_validated_rows(tmp_path, monkeypatch):
+    """Тест для проверки функции validated_rows. Дальше передаются строки с типизированными значениями,
+     отклоненные строки записываются в файл rejects."""
+    monkeypatch.setattr(loading_from_file, 'REJECTS_DIR', str(tmp_path))
+    rows = [['11111', '7111.30', '1800.50'],
+            ['11111', '7111,30', '1800.50']]
+
+    typed_rows = list(validated_rows(rows, 'capital', 'capital_test.csv'))
+
+    assert typed_rows == [[11111, Decimal('7111.30'), Decimal('1800.50')]]
+    assert (tmp_path / 'capital_test.csv.rejects.csv').read_text(encoding='utf-8').startswith('11111,"7111,30"')
+
+
+def test_bulk_loading_clients(cur_mock):
+    """Тест для проверки функции bulk_loading. Имитирует подключение к БД
+     и проверяет команду COPY во временную таблицу, передаваемые в нее данные и перенос новых строк в staging."""
+    copied = {}
+
+    def copy_expert(sql, stream):
+        copied['sql'] = sql
+        copied['data'] = stream.read(8192) + stream.read(8192)
+        cur_mock.rowcount = 2
+
+    def execute(sql, params=None):
+        if sql.lstrip().startswith('INSERT'):
+            cur_mock.rowcount = 1
+
+    cur_mock.copy_expert.side_effect = copy_expert
+    cur_mock.execute.side_effect = execute
+
+    inserted, skipped = bulk_loading(path_file=path_clients, dataset='clients', cur=cur_mock)
+
+    assert copied['sql'] == ('COPY tmp_clients (first_name, last_name, address, phone_number, registration_date, '
+                             'email, deposit_amount, opening_date, closing_date, interest_rate, file_name, '
+                             "timestamp_column, row_hash) FROM STDIN WITH (FORMAT csv, NULL '\\N')")
+    lines = copied['data'].splitlines()
+    assert len(lines) == 2
+    # Строки без timestamp_column получают время загрузки, клиенты получают отпечаток без него
+    values = lines[0].split(',')
+    assert values[:11] == ['Алиса', 'Иванова', 'ул. Центральная', '555-123-4567', '2024-01-01',
+                           'alice.ivanova@example.com', '1000.00', '2024-01-01', '2024-12-31', '0.05',
+                           'clients_test.csv']
+    assert datetime.fromisoformat(values[11])
+    assert values[12] == row_fingerprint(values[:10], 'staging.clients')
+
+    insert_sql = cur_mock.execute.call_args_list[2][0][0]
+    assert 'INSERT INTO staging.clients' in insert_sql
+    assert 'FROM tmp_clients t' in insert_sql
+    assert 'ON CONFLICT (row_hash) DO NOTHING' in insert_sql
+    assert (inserted, skipped) == (1, 1)
+
+
+def test_copy_stream_empty_field():
+    """Тест для проверки класса CopyStream. Пустое поле файла передается в COPY пустой строкой, как его сохраняет
+     построчная загрузка, а NULL - явным маркером, поэтому отпечаток строки соответствует сохраненным данным."""
+    rows = enrich_rows([['Рога и копыта', '', 'ул. Центральная', '2024-01-01', '', '1234567890', '1000.00',
+                         '2024-01-01', '2024-12-31', '0.05']], 'companies', 'companies_test.csv', None)
+
+    data = CopyStream(rows).read()
+
+    assert data.startswith('Рога и копыта,,ул. Центральная,2024-01-01,,1234567890,')
+    assert data.endswith(',companies_test.csv,\\N,' + row_fingerprint(
+        ['Рога и копыта', '', 'ул. Центральная', '2024-01-01', '', '1234567890', '1000.00', '2024-01-01',
+         '2024-12-31', '0.05'], 'staging.companies') + '\n')
+
+
+def test_deduplication_query_partitioned():
+    """Тест для проверки функции deduplication_query для секционированной таблицы staging.capital:
+     уже загруженные строки отсеиваются по индексу row_hash, без уникального индекса по одному row_hash."""
+    sql = loading_from_file.deduplication_query('capital', 'tmp_capital')
+
+    assert 'WHERE NOT EXISTS (SELECT 1 FROM staging.capital s WHERE s.row_hash = t.row_hash)' in sql
+    assert 'ON CONFLICT DO NOTHING' in sql and 'ON CONFLICT (row_hash)' not in sql
+
+
 # Запускаем тест
 if __name__ == '__main__':
     pytest.main()
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+import micro_batch
+from micro_batch import wait_for_tables
+
+
+def test_wait_for_tables(monkeypatch):
+    """Тест для проверки функции wait_for_tables. После первого уведомления уведомления собираются
+     еще flush_interval секунд, повторные уведомления об одной таблице объединяются."""
+    conn = MagicMock()
+    conn.notifies = []
+    batches = iter([[SimpleNamespace(payload='clients')],
+                    [SimpleNamespace(payload='clients'), SimpleNamespace(payload='capital')]])
+    waits = []
+
+    def fake_select(readers, writers, errors, timeout):
+        waits.append(timeout)
+        if len(waits) <= 2:
+            return readers, [], []
+        return [], [], []
+
+    monkeypatch.setattr(micro_batch.select, 'select', fake_select)
+    conn.poll.side_effect = lambda: conn.notifies.extend(next(batches))
+
+    assert wait_for_tables(conn, flush_interval=5) == {'clients', 'capital'}
+    # Первое уведомление ждем без ограничения, следующие - не дольше flush_interval
+    assert waits[0] is None and 0 < waits[1] <= 5
+
+
+def test_wait_for_tables_timeout(monkeypatch):
+    """Тест для проверки функции wait_for_tables. Без уведомлений по истечении timeout возвращается пустой набор."""
+    monkeypatch.setattr(micro_batch.select, 'select', lambda readers, writers, errors, timeout: ([], [], []))
+
+    assert wait_for_tables(MagicMock(), timeout=1) == set()
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,111 @@
+from datetime import date, datetime
+from unittest.mock import MagicMock
+
+import pytest
+from partitions import PARTITIONED_TABLES, add_months, ensure_partitions, migrate_table, month_starts
+
+
+def test_month_starts():
+    """Тест для проверки функций add_months и month_starts, в том числе на переходе через год."""
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert month_starts(date(2024, 11, 15), date(2025, 1, 2)) == [date(2024, 11, 1), date(2024, 12, 1),
+                                                                   date(2025, 1, 1)]
+
+
+def test_ensure_partitions():
+    """Тест для проверки функции ensure_partitions. Секция создается на каждый месяц с границами
+     первого числа этого и следующего месяца."""
+    cur = MagicMock()
+    # Секции по умолчанию еще нет
+    cur.fetchone.return_value = (None,)
+
+    assert ensure_partitions(cur, 'dwh.capital', date(2024, 12, 1), date(2024, 11, 20)) == 2
+    sql, params = cur.execute.call_args_list[2][0]
+    assert sql == ('CREATE TABLE IF NOT EXISTS dwh.capital_2024_12 PARTITION OF dwh.capital '
+                   'FOR VALUES FROM (%s) TO (%s)')
+    assert params == (date(2024, 12, 1), date(2025, 1, 1))
+
+
+def test_ensure_partitions_moves_rows_from_default():
+    """Тест для проверки функции ensure_partitions. Если строки месяца уже лежат в секции по умолчанию,
+     она отключается на время создания секции месяца, строки переносятся в новую секцию."""
+    cur = MagicMock(rowcount=5)
+    cur.fetchone.return_value = ('dds.capital_default',)
+    cur.fetchall.return_value = [(date(2024, 12, 1),)]
+
+    assert ensure_partitions(cur, 'dds.capital', date(2025, 1, 1), date(2024, 12, 5)) == 2
+
+    statements = [call[0][0] for call in cur.execute.call_args_list]
+    assert statements[2:4] == ['ALTER TABLE dds.capital DETACH PARTITION dds.capital_default',
+                               'CREATE TABLE dds.capital_2024_12 PARTITION OF dds.capital FOR VALUES FROM (%s) TO (%s)']
+    assert 'DELETE FROM dds.capital_default' in statements[4] and 'INSERT INTO dds.capital SELECT' in statements[4]
+    assert cur.execute.call_args_list[4][0][1] == (date(2024, 12, 1), date(2025, 1, 1))
+    assert statements[5] == 'ALTER TABLE dds.capital ATTACH PARTITION dds.capital_default DEFAULT'
+    # Секция следующего месяца, которого в секции по умолчанию нет, создается как обычно
+    assert statements[6].startswith('CREATE TABLE IF NOT EXISTS dds.capital_2025_01')
+
+
+def test_migrate_table():
+    """Тест для проверки функции migrate_table. Данные переносятся в секционированную таблицу до создания
+     индексов, последовательность id передается новой таблице до удаления старой."""
+    cur = MagicMock(rowcount=10)
+    # Секции по умолчанию на момент создания секций месяцев еще нет
+    cur.fetchone.side_effect = [('r',), (datetime(2024, 5, 1), datetime(2024, 6, 3)), (None,),
+                                ('staging.capital_id_seq',)]
+    cur.fetchall.return_value = []
+
+    assert migrate_table(cur, 'staging.capital', months_ahead=1) == 10
+
+    statements = [call[0][0] for call in cur.execute.call_args_list]
+    assert 'ALTER TABLE staging.capital RENAME TO capital_unpartitioned' in statements
+    assert ('CREATE TABLE staging.capital (LIKE staging.capital_unpartitioned '
+            'INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (timestamp_column)') in statements
+    # Секции с первого месяца данных по месяц вперед от текущего и секция по умолчанию
+    months = month_starts(date(2024, 5, 1), add_months(date.today().replace(day=1), 1))
+    assert sum('PARTITION OF staging.capital FOR VALUES' in sql for sql in statements) == len(months)
+    assert 'CREATE TABLE IF NOT EXISTS staging.capital_default PARTITION OF staging.capital DEFAULT' in statements
+    order = [statements.index(sql) for sql in (
+        'INSERT INTO staging.capital SELECT * FROM staging.capital_unpartitioned',
+        'ALTER SEQUENCE staging.capital_id_seq OWNED BY staging.capital.id',
+        'DROP TABLE staging.capital_unpartitioned')]
+    assert order == sorted(order)
+    assert any('capital_day_timestamp_idx' in sql for sql in statements[order[-1]:])
+
+
+def test_migrate_table_keeps_triggers():
+    """Тест для проверки функции migrate_table. Триггеры уведомлений старой таблицы создаются на новой
+     секционированной таблице до удаления старой."""
+    cur = MagicMock(rowcount=10)
+    cur.fetchone.side_effect = [('r',), (datetime(2024, 5, 1), datetime(2024, 6, 3)), (None,), (None,)]
+    trigger = ('CREATE TRIGGER capital_notify AFTER INSERT ON staging.capital_unpartitioned '
+               'FOR EACH STATEMENT EXECUTE FUNCTION etl.notify_staging_insert()')
+    # Внешних ключей нет, один пользовательский триггер
+    cur.fetchall.side_effect = [[], [(trigger,)]]
+
+    migrate_table(cur, 'staging.capital', months_ahead=1)
+
+    statements = [call[0][0] for call in cur.execute.call_args_list]
+    assert any('NOT tgisinternal' in sql for sql in statements)
+    created = statements.index('CREATE TRIGGER capital_notify AFTER INSERT ON staging.capital '
+                               'FOR EACH STATEMENT EXECUTE FUNCTION etl.notify_staging_insert()')
+    assert created < statements.index('DROP TABLE staging.capital_unpartitioned')
+
+
+def test_migrate_table_already_partitioned():
+    """Тест для проверки функции migrate_table. Уже секционированная таблица не меняется."""
+    cur = MagicMock()
+    cur.fetchone.return_value = ('p',)
+
+    assert migrate_table(cur, 'dwh.capital') == 0
+    assert cur.execute.call_count == 1
+
+
+def test_partitioned_tables():
+    """Тест для проверки списка таблиц: капитал, активы и пассивы на трех слоях."""
+    assert len(PARTITIONED_TABLES) == 9
+    assert PARTITIONED_TABLES['dds.general_assets'] == 'dds'
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
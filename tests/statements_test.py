@@ -0,0 +1,41 @@
+from unittest.mock import MagicMock
+
+import pytest
+import statements
+from statements import execute, register, to_positional
+
+
+def test_to_positional():
+    """Тест для проверки замены параметров %s на нумерованные параметры PREPARE."""
+    assert to_positional("SELECT * FROM t WHERE a = %s AND b LIKE 'x%%' AND c < %s") == \
+        "SELECT * FROM t WHERE a = $1 AND b LIKE 'x%' AND c < $2"
+
+
+def test_execute_prepares_once_per_connection(monkeypatch):
+    """Тест для проверки функции execute: запрос подготавливается один раз в подключении,
+     следующие вызовы передают только параметры, вызовы учитываются в статистике."""
+    monkeypatch.setattr(statements, 'statistics', {})
+    name = register('test_select', 'SELECT * FROM dwh.capital WHERE bank_id = %s')
+    cur = MagicMock()
+
+    execute(cur, name, (1,))
+    execute(cur, name, (2,))
+
+    assert [call[0] for call in cur.execute.call_args_list] == [
+        ('PREPARE test_select AS SELECT * FROM dwh.capital WHERE bank_id = $1',),
+        ('EXECUTE test_select (%s)', (1,)),
+        ('EXECUTE test_select (%s)', (2,)),
+    ]
+    assert statements.statistics[name][0] == 2
+
+    # В новом подключении запрос подготавливается заново
+    other_cur = MagicMock()
+    execute(other_cur, name)
+    assert other_cur.execute.call_args_list[0][0][0].startswith('PREPARE test_select')
+    assert other_cur.execute.call_args_list[1][0] == ('EXECUTE test_select',)
+    assert statements.statistics[name][0] == 3
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
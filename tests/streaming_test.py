@@ -0,0 +1,33 @@
+from unittest.mock import MagicMock
+
+import pytest
+from streaming import peak_memory_mb, stream_chunks, stream_rows
+
+
+def test_stream_rows_named_cursor():
+    """Тест для проверки функции stream_rows. Запрос выполняется через именованный курсор
+     с указанным количеством строк за одно обращение к серверу."""
+    cur = MagicMock()
+    stream = cur.connection.cursor.return_value.__enter__.return_value
+    stream.__iter__.return_value = iter([(1,), (2,)])
+
+    assert list(stream_rows(cur, 'SELECT id FROM dds.clients', itersize=500)) == [(1,), (2,)]
+    assert cur.connection.cursor.call_args[1]['name'].startswith('stream_')
+    assert stream.itersize == 500
+    stream.execute.assert_called_once_with('SELECT id FROM dds.clients', None)
+
+
+def test_stream_chunks():
+    """Тест для проверки функции stream_chunks. Строки передаются пачками до пустого ответа сервера."""
+    cur = MagicMock()
+    stream = cur.connection.cursor.return_value.__enter__.return_value
+    stream.fetchmany.side_effect = [[(1,), (2,)], [(3,)], []]
+
+    assert list(stream_chunks(cur, 'SELECT id FROM dds.clients', itersize=2)) == [[(1,), (2,)], [(3,)]]
+    stream.fetchmany.assert_called_with(2)
+    assert peak_memory_mb() is None or peak_memory_mb() > 0
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,111 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+from dimension_keys import DIMENSIONS
+from transfer_engine import (HISTORY_DIMENSIONS, SNAPSHOT_ENTITIES, dimension_history_query, dwh_transfer_query,
+                             insert_query, transfer_to_dds, transfer_to_dwh)
+
+
+@pytest.mark.parametrize('entity', SNAPSHOT_ENTITIES)
+def test_queries_from_entity(entity):
+    """Тест для проверки формирования запросов по описанию сущности: колонки и таблицы всех слоев
+     берутся из SNAPSHOT_ENTITIES."""
+    spec = SNAPSHOT_ENTITIES[entity]
+    columns = ', '.join(spec['columns'])
+
+    assert insert_query(entity, 'dds') == (f"INSERT INTO {spec['dds_table']} ({columns}, timestamp_column, "
+                                           f"bank_id, row_hash) VALUES %s")
+    sql = dwh_transfer_query(entity, on_date=True)
+    assert f"INSERT INTO {spec['dwh_table']} AS t ({columns}, timestamp_column, bank_id, row_hash)" in sql
+    assert f"FROM {spec['dds_table']}" in sql
+    # Условие по дате - диапазон по самой колонке, без приведения к дате
+    assert 'timestamp_column >= CAST(%s AS date) AND timestamp_column < CAST(%s AS date) + 1' in sql
+    assert '::date' not in sql
+    # Слияние по естественному ключу: исправленный срез обновляет строку dwh
+    assert 'ON CONFLICT (bank_id, timestamp_column) DO UPDATE SET' in sql
+    assert f"{spec['columns'][0]} = EXCLUDED.{spec['columns'][0]}" in sql and 'row_hash = EXCLUDED.row_hash' in sql
+    assert 'bank_id = EXCLUDED' not in sql
+    assert 'WHERE t.row_hash IS DISTINCT FROM EXCLUDED.row_hash' in sql
+    assert 'DISTINCT ON (b.dwh_bank_id, timestamp_column)' in sql
+
+
+def test_transfer_to_dds_batches():
+    """Тест для проверки функции transfer_to_dds на указанную дату. Строки добавляются пачками
+     по page_size одним запросом, а не по запросу на строку."""
+    cur = MagicMock()
+    cur.connection.encoding = 'UTF8'
+    cur.mogrify.side_effect = lambda template, args: repr(tuple(args)).encode()
+    # Контрольной точки нет, время последней строки dds - 2024-06-01
+    cur.fetchone.side_effect = [None, (None, datetime(2024, 6, 1))]
+    cur.fetchall.return_value = [(7, 11111, 7111.30, 1800.50, datetime(2024, 5, 1, 10, 0))]
+    dimension_keys = MagicMock(**{'at.return_value': 3})
+
+    inserted = transfer_to_dds(cur, 'capital', dimension_keys, date='2024-05-01', page_size=5)
+
+    assert inserted == 1
+    # Выборка из staging - подготовленный запрос, дата передается параметрами
+    prepare = cur.execute.call_args_list[3][0][0]
+    assert prepare.startswith('PREPARE capital_latest_on_date AS') and 'FROM staging.capital' in prepare
+    assert cur.execute.call_args_list[4][0] == ('EXECUTE capital_latest_on_date (%s, %s)',
+                                                ('2024-05-01', '2024-05-01'))
+    insert = cur.execute.call_args_list[5][0][0]
+    assert insert.startswith(b'INSERT INTO dds.capital') and b"'2024-05-01', 3, " in insert
+    # Строка раньше контрольной точки не сдвигает ее
+    assert cur.execute.call_count == 6
+
+
+def test_transfer_to_dwh():
+    """Тест для проверки функции transfer_to_dwh: соответствие банков dds и dwh и дата передаются параметрами."""
+    cur = MagicMock(rowcount=2)
+
+    assert transfer_to_dwh(cur, 'general_assets', {1: 10, 2: 20}, '2024-05-01') == 2
+    prepare = cur.execute.call_args_list[0][0][0]
+    assert prepare.startswith('PREPARE general_assets_to_dwh_on_date AS') and 'FROM dds.general_assets' in prepare
+    sql, params = cur.execute.call_args[0]
+    assert sql == 'EXECUTE general_assets_to_dwh_on_date (%s, %s, %s, %s)'
+    assert params == ([1, 2], [10, 20], '2024-05-01', '2024-05-01')
+
+
+def test_dwh_transfer_query_by_day():
+    """Тест для проверки переноса диапазона дат: запрос возвращает количество перенесенных строк по дням,
+     не изменившиеся строки по-прежнему пропускаются."""
+    sql = dwh_transfer_query('capital', on_date=True, by_day=True)
+
+    assert sql.count('%s') == 4
+    assert 'WHERE t.row_hash IS DISTINCT FROM EXCLUDED.row_hash' in sql
+    assert 'RETURNING CAST(timestamp_column AS date) AS day)' in sql
+    assert 'SELECT day, COUNT(*) FROM moved GROUP BY day ORDER BY day' in sql
+
+
+@pytest.mark.parametrize('dimension', HISTORY_DIMENSIONS)
+def test_dimension_history_query(dimension):
+    """Тест для проверки запроса слияния справочника с историей: новая версия открывается только для строк
+     без текущей версии или с изменившимися отслеживаемыми полями."""
+    sql = dimension_history_query(dimension)
+
+    assert sql.count('%s') == 4
+    assert f'LEFT JOIN dwh.{dimension} c ON c.valid_to IS NULL AND ' in sql
+    key = DIMENSIONS[dimension][0]
+    assert f'WHERE c.{key} IS NULL OR c.attributes_hash IS DISTINCT FROM b.attributes_hash' in sql
+    assert f'FROM dds.{dimension}' in sql
+    assert f"INSERT INTO dwh.{HISTORY_DIMENSIONS[dimension]['deposits_table']}" in sql
+    assert 'valid_from, attributes_hash)' in sql
+
+
+@pytest.mark.parametrize('dimension, column', [('clients', 'email'), ('clients', 'registration_date'),
+                                               ('companies', 'inn')])
+def test_dimension_history_query_null_key(dimension, column):
+    """Тест для проверки запроса слияния справочника с историей: строка с пустой колонкой натурального ключа
+     совпадает со своей текущей версией и с новой версией при переносе депозитов, поэтому при повторном запуске
+     новая версия не открывается."""
+    sql = dimension_history_query(dimension)
+
+    for left, right in (('c', 'b'), ('o', 'n'), ('c', 'n')):
+        assert f'{left}.{column} IS NOT DISTINCT FROM {right}.{column}' in sql
+        assert f'{left}.{column} = {right}.{column}' not in sql
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,54 @@
+import csv
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from validation import convert_column, validate_batch, write_rejects
+
+
+def test_convert_column():
+    """Тест для проверки функции convert_column. Значения колонки преобразуются к типу, ошибки собираются
+     по номерам строк."""
+    converted, errors = convert_column(['1000.00', 'abc', ' 0.05', 'NaN'], 'decimal')
+
+    assert converted == [Decimal('1000.00'), None, Decimal('0.05'), None]
+    assert list(errors) == [1, 3]
+
+
+def test_validate_batch_capital():
+    """Тест для проверки функции validate_batch. Строки с timestamp_column и без него проходят проверку,
+     строки с неверным количеством значений или форматом отклоняются с причиной."""
+    rows = [['11111', '7111.30', '1800.50', '2024-05-01 00:10:00'],
+            ['11111', '7111.30', '1800.50'],
+            ['11111', '7111.30'],
+            ['11111', 'много', '1800.50', '01.05.2024']]
+
+    typed_rows, rejected = validate_batch(rows, ('decimal', 'decimal', 'decimal'), timestamp_in_file=True)
+
+    assert typed_rows == [[Decimal('11111'), Decimal('7111.30'), Decimal('1800.50'), datetime(2024, 5, 1, 0, 10)],
+                          [Decimal('11111'), Decimal('7111.30'), Decimal('1800.50')]]
+    assert [row for row, reason in rejected] == [rows[2], rows[3]]
+    assert 'получено 2' in rejected[0][1]
+    assert 'много' in rejected[1][1] and '01.05.2024' in rejected[1][1]
+
+
+def test_validate_batch_dates_and_rejects_file(tmp_path):
+    """Тест для проверки функций validate_batch и write_rejects. Некорректная дата отклоняется,
+     отклоненная строка записывается в файл вместе с причиной."""
+    rows = [['Алиса', '2024-01-01', '1000.00'],
+            ['Борис', '2024-13-01', '500']]
+    typed_rows, rejected = validate_batch(rows, ('text', 'date', 'decimal'))
+
+    assert typed_rows == [['Алиса', date(2024, 1, 1), Decimal('1000.00')]]
+
+    path_rejects = tmp_path / 'rejects' / 'clients.csv.rejects.csv'
+    write_rejects(str(path_rejects), rejected)
+    with open(path_rejects, encoding='utf-8') as file:
+        written = list(csv.reader(file))
+
+    assert written == [['Борис', '2024-13-01', '500', rejected[0][1]]]
+
+
+# Запускаем тест
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,315 @@
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from checkpoints import load_checkpoint, save_checkpoint
+from dimension_keys import DIMENSIONS, DimensionKeys
+from fingerprint import row_fingerprint
+from statements import execute, register
+from streaming import ITERSIZE, stream_rows
+
+
+# Количество строк, которые добавляются одним запросом
+PAGE_SIZE = 1000
+
+# Описание сущностей-срезов (данные банка на момент времени): таблицы слоев, бизнес-поля в порядке колонок,
+# колонка отпечатка строки, колонка связи с банком и естественный ключ среза в dwh.
+# Новая сущность добавляется только описанием здесь.
+SNAPSHOT_ENTITIES = {
+    'capital': {
+        'staging_table': 'staging.capital',
+        'dds_table': 'dds.capital',
+        'dwh_table': 'dwh.capital',
+        'columns': ('reserve_fund', 'equity_capital', 'accumulated_earnings'),
+        'fingerprint': 'row_hash',
+        'bank_link': 'bank_id',
+        'natural_key': ('bank_id', 'timestamp_column'),
+    },
+    'general_assets': {
+        'staging_table': 'staging.general_assets',
+        'dds_table': 'dds.general_assets',
+        'dwh_table': 'dwh.general_assets',
+        'columns': ('securities', 'real_estate', 'financial_reports', 'credit_facilities', 'machinery', 'debts',
+                    'equipment'),
+        'fingerprint': 'row_hash',
+        'bank_link': 'bank_id',
+        'natural_key': ('bank_id', 'timestamp_column'),
+    },
+    'control_liabilities': {
+        'staging_table': 'staging.control_liabilities',
+        'dds_table': 'dds.control_liabilities',
+        'dwh_table': 'dwh.control_liabilities',
+        'columns': ('financial_instruments_debts', 'securities_obligations', 'reporting_data', 'invoices_to_pay',
+                    'funds_in_accounts'),
+        'fingerprint': 'row_hash',
+        'bank_link': 'bank_id',
+        'natural_key': ('bank_id', 'timestamp_column'),
+    },
+}
+
+# Справочники dwh с историей изменений (SCD Type 2): бизнес-поля, отслеживаемые поля, при изменении которых
+# открывается новая версия строки, и таблица депозитов. Суррогатный и натуральный ключи - из DIMENSIONS.
+HISTORY_DIMENSIONS = {
+    'clients': {
+        'columns': ('first_name', 'last_name', 'address', 'phone_number', 'registration_date', 'email'),
+        'tracked': ('address', 'phone_number'),
+        'deposits_table': 'deposits_clients',
+    },
+    'companies': {
+        'columns': ('name', 'phone_number', 'address', 'registration_date', 'email', 'inn'),
+        'tracked': ('name', 'phone_number', 'address', 'registration_date', 'email'),
+        'deposits_table': 'deposits_companies',
+    },
+}
+
+
+def staging_query(entity: str, history: bool) -> str:
+    """Функция формирует запрос строк staging: id, бизнес-поля и timestamp_column.
+     В режиме history - последняя строка за каждый день диапазона дат (параметры - начало и конец),
+     иначе - последняя строка на дату (параметры - дата дважды). Условия по дате - диапазоны по самой
+     timestamp_column, чтобы использовались индекс и отсечение секций (см. partitions.py)."""
+    spec = SNAPSHOT_ENTITIES[entity]
+    columns = ', '.join(('id', *spec['columns'], 'timestamp_column'))
+    if history:
+        return f"""
+            SELECT DISTINCT ON (CAST(timestamp_column AS date)) {columns}
+            FROM {spec['staging_table']}
+            WHERE timestamp_column >= COALESCE(CAST(%s AS date), '-infinity'::timestamp)
+              AND timestamp_column < COALESCE(CAST(%s AS date) + 1, 'infinity'::timestamp)
+            ORDER BY CAST(timestamp_column AS date), timestamp_column DESC
+        """
+    return f"""
+        SELECT {columns}
+        FROM {spec['staging_table']}
+        WHERE timestamp_column >= CAST(%s AS date) AND timestamp_column < CAST(%s AS date) + 1
+        ORDER BY timestamp_column DESC
+        LIMIT 1
+    """
+
+
+def insert_query(entity: str, layer: str) -> str:
+    """Функция формирует запрос добавления пачки строк в таблицу сущности на слое layer"""
+    spec = SNAPSHOT_ENTITIES[entity]
+    columns = ', '.join((*spec['columns'], 'timestamp_column', spec['bank_link'], spec['fingerprint']))
+    return f"INSERT INTO {spec[f'{layer}_table']} ({columns}) VALUES %s"
+
+
+def dwh_transfer_query(entity: str, on_date: bool, by_day: bool = False) -> str:
+    """Функция формирует перенос строк сущности из dds в dwh одним запросом: банк dds заменяется банком dwh
+     по переданному соответствию (параметры - массивы id банков dds и dwh). Строки сливаются с dwh
+     по естественному ключу: новые срезы добавляются, исправленные (с другим отпечатком) - обновляются,
+     не изменившиеся не трогаются. Из нескольких строк dds на один ключ берется последняя добавленная.
+     При on_date третьим и четвертым параметрами передаются первая и последняя дата (для одной даты - она же).
+     С by_day запрос возвращает количество добавленных и обновленных строк за каждый день."""
+    spec = SNAPSHOT_ENTITIES[entity]
+    columns = ', '.join((*spec['columns'], 'timestamp_column'))
+    natural_key = ', '.join(spec['natural_key'])
+    updated_columns = [column for column in (*spec['columns'], 'timestamp_column', spec['bank_link'],
+                                             spec['fingerprint'])
+                       if column not in spec['natural_key']]
+    date_condition = ('timestamp_column >= CAST(%s AS date) AND timestamp_column < CAST(%s AS date) + 1'
+                      if on_date else 'TRUE')
+    query = f"""
+        INSERT INTO {spec['dwh_table']} AS t ({columns}, {spec['bank_link']}, {spec['fingerprint']})
+        SELECT DISTINCT ON (b.dwh_bank_id, timestamp_column) {columns}, b.dwh_bank_id, {spec['fingerprint']}
+        FROM {spec['dds_table']}
+        JOIN unnest(%s::int[], %s::int[]) AS b(dds_bank_id, dwh_bank_id) ON b.dds_bank_id = {spec['bank_link']}
+        WHERE {date_condition}
+        ORDER BY b.dwh_bank_id, timestamp_column, id DESC
+        ON CONFLICT ({natural_key}) DO UPDATE SET
+            {', '.join(f'{column} = EXCLUDED.{column}' for column in updated_columns)}
+        WHERE t.{spec['fingerprint']} IS DISTINCT FROM EXCLUDED.{spec['fingerprint']}
+    """
+    if not by_day:
+        return query
+    return f"""
+        WITH moved AS ({query} RETURNING CAST(timestamp_column AS date) AS day)
+        SELECT day, COUNT(*) FROM moved GROUP BY day ORDER BY day
+    """
+
+
+def attributes_hash(dimension: str) -> str:
+    """Функция формирует выражение отпечатка отслеживаемых полей справочника. ROW(...)::text различает
+     NULL и пустую строку, поэтому разные наборы значений не дают одинаковый текст.
+     То же выражение используется при заполнении отпечатков в sql/008_dwh_scd2.sql."""
+    return f"md5(ROW({', '.join(HISTORY_DIMENSIONS[dimension]['tracked'])})::text)"
+
+
+def dimension_history_query(dimension: str) -> str:
+    """Функция формирует запрос слияния новых строк справочника dds с историей справочника dwh (SCD Type 2).
+     Из новых строк (параметры - границы id dds) на каждый натуральный ключ берется последняя. Если текущей
+     версии ключа в dwh нет или отпечаток отслеживаемых полей изменился, текущая версия закрывается (valid_to)
+     и открывается новая (valid_from), не изменившиеся строки не трогаются. Депозиты новых строк переносятся
+     с ключом текущей версии. Третьим и четвертым параметрами повторно передаются границы id.
+     Запрос возвращает количество открытых версий, закрытых версий и добавленных депозитов."""
+    spec = HISTORY_DIMENSIONS[dimension]
+    key, natural_key = DIMENSIONS[dimension]
+    columns = ', '.join((*spec['columns'], 'timestamp_column'))
+
+    def same_key(left: str, right: str) -> str:
+        # Колонки натурального ключа могут быть пустыми (клиент без email), NULL должен совпадать с NULL
+        return ' AND '.join(f'{left}.{column} IS NOT DISTINCT FROM {right}.{column}' for column in natural_key)
+
+    return f"""
+        WITH batch AS (
+            SELECT DISTINCT ON ({', '.join(natural_key)}) {columns}, {attributes_hash(dimension)} AS attributes_hash
+            FROM dds.{dimension}
+            WHERE {key} > %s AND {key} <= %s
+            ORDER BY {', '.join(natural_key)}, timestamp_column DESC, {key} DESC
+        ),
+        changed AS (
+            SELECT b.*, c.{key} AS current_{key}
+            FROM batch b
+            LEFT JOIN dwh.{dimension} c ON c.valid_to IS NULL AND {same_key('c', 'b')}
+            WHERE c.{key} IS NULL OR c.attributes_hash IS DISTINCT FROM b.attributes_hash
+        ),
+        closed AS (
+            UPDATE dwh.{dimension} c SET valid_to = ch.timestamp_column
+            FROM changed ch
+            WHERE c.{key} = ch.current_{key}
+            RETURNING 1
+        ),
+        opened AS (
+            INSERT INTO dwh.{dimension} ({key}, {columns}, valid_from, attributes_hash)
+            SELECT nextval(pg_get_serial_sequence('dwh.{dimension}', '{key}')), {columns}, timestamp_column,
+                   attributes_hash
+            FROM changed
+            RETURNING {key}, {', '.join(natural_key)}
+        ),
+        inserted_deposits AS (
+            INSERT INTO dwh.{spec['deposits_table']} (deposit_amount, opening_date, closing_date, interest_rate,
+                                                     timestamp_column, {key})
+            SELECT d.deposit_amount, d.opening_date, d.closing_date, d.interest_rate, d.timestamp_column,
+                   COALESCE(o.{key}, c.{key})
+            FROM dds.{dimension} n
+            JOIN dds.{spec['deposits_table']} d ON d.{key} = n.{key}
+            LEFT JOIN opened o ON {same_key('o', 'n')}
+            LEFT JOIN dwh.{dimension} c ON c.valid_to IS NULL AND {same_key('c', 'n')}
+            WHERE n.{key} > %s AND n.{key} <= %s
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM opened), (SELECT COUNT(*) FROM closed), (SELECT COUNT(*) FROM inserted_deposits)
+    """
+
+
+def transfer_to_dds(cur: Any, entity: str, dimension_keys: DimensionKeys, history: bool = False,
+                    date: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                    itersize: int = ITERSIZE, page_size: int = PAGE_SIZE) -> int:
+    """Функция переносит строки сущности из staging в dds. Без history переносится последняя строка на дату
+     (по умолчанию - текущую), с history - последняя строка за каждый день, начиная с дня контрольной точки,
+     или за каждый день диапазона date_from - date_to. Строки добавляются пачками по page_size.
+     Возвращает количество добавленных строк."""
+    spec = SNAPSHOT_ENTITIES[entity]
+    # Контрольная точка - время последней перенесенной строки staging
+    _, last_timestamp = load_checkpoint(cur, 'dds', entity,
+                                        f"SELECT NULL, MAX(timestamp_column) FROM {spec['dds_table']}")
+    # При указании диапазона дат данные загружаются заново на эти даты, независимо от контрольной точки
+    backfill = bool(date_from or date_to)
+    # Срезы (банк и время), уже перенесенные в dds за диапазон, повторно не добавляются
+    existing = set()
+    if backfill:
+        cur.execute(f"""
+            SELECT {spec['bank_link']}, timestamp_column FROM {spec['dds_table']}
+            WHERE timestamp_column >= COALESCE(CAST(%s AS date), '-infinity'::timestamp)
+              AND timestamp_column < COALESCE(CAST(%s AS date) + 1, 'infinity'::timestamp)
+        """, (date_from, date_to))
+        existing = set(cur.fetchall())
+
+    if history:
+        rows = stream_rows(cur, staging_query(entity, history=True),
+                           (date_from if backfill else last_timestamp, date_to), itersize)
+        load_time = None
+    else:
+        load_date = date or datetime.now().date()
+        execute(cur, f'{entity}_latest_on_date', (load_date, load_date))
+        rows = cur.fetchall()
+        load_time = datetime.now().replace(microsecond=0).strftime('%Y-%m-%d %H:%M:%S')
+
+    records: List[Tuple[Any, ...]] = []
+    inserted = 0
+    checkpoint = None
+    for row in rows:
+        row_id, values, timestamp_column = row[0], tuple(row[1:-1]), row[-1]
+        # ID банка, действовавшего на момент строки
+        bank_id = dimension_keys.at('bank', timestamp_column)
+
+        # Загрузка на указанную дату выполняется всегда
+        if date:
+            records.append((*values, date, bank_id, row_fingerprint((*values, date), spec['dds_table'])))
+
+        # Срез, уже перенесенный при прошлой загрузке диапазона, пропускается
+        if backfill and (bank_id, timestamp_column) in existing:
+            continue
+        # Проверка условия по времени
+        if backfill or not last_timestamp or timestamp_column > last_timestamp:
+            current_date = timestamp_column if history else date or load_time
+            row_hash = row_fingerprint((*values, current_date), spec['dds_table'])
+            records.append((*values, current_date, bank_id, row_hash))
+
+            # Перенесенная строка с самым поздним временем становится новой контрольной точкой
+            if not checkpoint or timestamp_column > checkpoint[1]:
+                checkpoint = (row_id, timestamp_column)
+
+        if len(records) >= page_size:
+            execute_values(cur, insert_query(entity, 'dds'), records, page_size=page_size)
+            inserted += len(records)
+            records = []
+
+    if records:
+        execute_values(cur, insert_query(entity, 'dds'), records, page_size=page_size)
+        inserted += len(records)
+
+    # Загрузка прошлых дат не сдвигает контрольную точку назад
+    if checkpoint and (not last_timestamp or checkpoint[1] > last_timestamp):
+        save_checkpoint(cur, 'dds', entity, *checkpoint)
+    return inserted
+
+
+def transfer_to_dwh(cur: Any, entity: str, bank_ids: Dict[int, int], target_date: Optional[str] = None) -> int:
+    """Функция переносит строки сущности из dds в dwh одним запросом, bank_ids - соответствие id банков dds
+     и dwh. Возвращает количество добавленных и обновленных строк."""
+    params: Tuple[Any, ...] = (list(bank_ids), list(bank_ids.values()))
+    if target_date:
+        params += (target_date, target_date)
+    execute(cur, f'{entity}_to_dwh_on_date' if target_date else f'{entity}_to_dwh', params)
+    return cur.rowcount
+
+
+def transfer_range_to_dwh(cur: Any, entity: str, bank_ids: Dict[int, int], date_from: str,
+                          date_to: str) -> Dict[date, int]:
+    """Функция переносит строки сущности из dds в dwh за все даты диапазона date_from - date_to (включительно)
+     одним запросом. Уже перенесенные и не изменившиеся строки пропускаются, как и при переносе на одну дату.
+     Возвращает количество добавленных и обновленных строк за каждый день, в котором они есть."""
+    execute(cur, f'{entity}_to_dwh_range', (list(bank_ids), list(bank_ids.values()), date_from, date_to))
+    return dict(cur.fetchall())
+
+
+def transfer_dimension_to_dwh(cur: Any, dimension: str) -> Tuple[int, int, int]:
+    """Функция сливает строки справочника dds, добавленные после контрольной точки, с историей справочника dwh
+     одним запросом (см. dimension_history_query). Работа пропорциональна количеству новых строк, а не размеру
+     справочника. Возвращает количество открытых версий, закрытых версий и добавленных депозитов."""
+    key, _ = DIMENSIONS[dimension]
+    # Контрольная точка - ключ последней перенесенной строки справочника dds
+    last_id, _ = load_checkpoint(cur, 'dwh', dimension, f"""
+        SELECT MAX({key}), MAX(timestamp_column)
+        FROM dds.{dimension}
+        WHERE timestamp_column <= (SELECT MAX(timestamp_column) FROM dwh.{dimension})
+    """)
+    cur.execute(f'SELECT MAX({key}), MAX(timestamp_column) FROM dds.{dimension} WHERE {key} > %s', (last_id,))
+    max_id, max_timestamp = cur.fetchone()
+    if max_id is None:
+        return 0, 0, 0
+
+    cur.execute(dimension_history_query(dimension), (last_id, max_id, last_id, max_id))
+    opened, closed, deposits = cur.fetchone()
+    save_checkpoint(cur, 'dwh', dimension, max_id, max_timestamp)
+    return opened, closed, deposits
+
+
+# Запросы, которые выполняются на каждую дату, готовятся на сервере один раз за подключение (см. statements.py)
+for snapshot_entity in SNAPSHOT_ENTITIES:
+    register(f'{snapshot_entity}_latest_on_date', staging_query(snapshot_entity, history=False))
+    register(f'{snapshot_entity}_to_dwh', dwh_transfer_query(snapshot_entity, on_date=False))
+    register(f'{snapshot_entity}_to_dwh_on_date', dwh_transfer_query(snapshot_entity, on_date=True))
+    register(f'{snapshot_entity}_to_dwh_range', dwh_transfer_query(snapshot_entity, on_date=True, by_day=True))
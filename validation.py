@@ -0,0 +1,104 @@
+import csv
+import os
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+
+def parse_decimal(value: str) -> Decimal:
+    number = Decimal(value.strip())
+    if not number.is_finite():
+        raise ValueError(f"некорректное число {value!r}")
+    return number
+
+
+def parse_date(value: str) -> date:
+    return date.fromisoformat(value.strip())
+
+
+def parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.strip())
+
+
+# Функции преобразования строковых значений из файла в типы колонок
+PARSERS: Dict[str, Callable[[str], Any]] = {
+    'text': str,
+    'decimal': parse_decimal,
+    'date': parse_date,
+    'timestamp': parse_timestamp,
+}
+
+
+def convert_column(values: Sequence[str], column_type: str) -> Tuple[List[Any], Dict[int, str]]:
+    """Функция преобразует все значения одной колонки пачки к типу колонки.
+     Возвращает преобразованные значения и ошибки по номерам строк пачки."""
+    parser = PARSERS[column_type]
+    converted = []
+    errors = {}
+    for index, value in enumerate(values):
+        if value is None:
+            # Пропуск в колоночном файле допустим только для текста, как пустая строка в CSV
+            converted.append(None)
+            if column_type != 'text':
+                errors[index] = f"пустое значение вместо {column_type}"
+            continue
+        if not isinstance(value, str):
+            # Файлы Parquet и Arrow содержат уже типизированные значения, они проверяются в том же виде, что в CSV
+            value = str(value)
+        try:
+            converted.append(parser(value))
+        except (ValueError, InvalidOperation):
+            converted.append(None)
+            errors[index] = f"значение {value!r} не является {column_type}"
+    return converted, errors
+
+
+def validate_batch(rows: Sequence[Sequence[str]], column_types: Sequence[str],
+                   timestamp_in_file: bool = False) -> Tuple[List[List[Any]], List[Tuple[Sequence[str], str]]]:
+    """Функция проверяет пачку строк файла по колонкам: количество значений в строке и формат каждого значения.
+     Возвращает строки с типизированными значениями и отклоненные строки с причиной."""
+    lengths = {len(column_types)}
+    if timestamp_in_file:
+        column_types = (*column_types, 'timestamp')
+        lengths.add(len(column_types))
+
+    rejected = []
+    # Строки группируются по количеству значений, чтобы каждую колонку преобразовывать целиком
+    groups: Dict[int, List[int]] = {}
+    for index, row in enumerate(rows):
+        if len(row) in lengths:
+            groups.setdefault(len(row), []).append(index)
+        else:
+            rejected.append((row, f"ожидалось значений: {' или '.join(map(str, sorted(lengths)))}, "
+                                  f"получено {len(row)}"))
+
+    typed_rows: Dict[int, List[Any]] = {}
+    for length, indexes in groups.items():
+        columns = list(zip(*(rows[index] for index in indexes)))
+        converted_columns = []
+        errors: Dict[int, List[str]] = {}
+        for column_type, values in zip(column_types, columns):
+            converted, column_errors = convert_column(values, column_type)
+            converted_columns.append(converted)
+            for position, error in column_errors.items():
+                errors.setdefault(position, []).append(error)
+
+        for position, values in enumerate(zip(*converted_columns)):
+            if position in errors:
+                rejected.append((rows[indexes[position]], '; '.join(errors[position])))
+            else:
+                typed_rows[indexes[position]] = list(values)
+
+    # Порядок строк сохраняется таким же, как в файле
+    return [typed_rows[index] for index in sorted(typed_rows)], rejected
+
+
+def write_rejects(path_rejects: str, rejected: List[Tuple[Sequence[str], str]]) -> None:
+    """Функция дописывает отклоненные строки в файл с причиной отклонения последним значением"""
+    if not rejected:
+        return
+    os.makedirs(os.path.dirname(path_rejects) or '.', exist_ok=True)
+    with open(path_rejects, 'a', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        for row, reason in rejected:
+            writer.writerow([*row, reason])